@@ -0,0 +1,111 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Render time of the quiz histogram for 4, 10 and 36 options.
+
+Compares the previous pyplot implementation, which builds a new figure
+for each chart, with the template-based Figure/Agg backend of
+:py:mod:`edubot.charts`. Run with::
+
+    python benchmarks/bench_charts.py
+"""
+
+import io
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+from matplotlib.ticker import PercentFormatter  # noqa: E402
+
+from edubot.charts import render_histogram  # noqa: E402
+
+REPEATS = 20
+
+
+def render_pyplot(tally, correct=None):
+    """The previous implementation, based on pyplot global state."""
+    image_buffer = io.BytesIO()
+    plt.style.use("dark_background")
+    individual_votes = np.array(tally)
+    if np.sum(individual_votes) != 0:
+        weighted_votes = individual_votes / np.sum(individual_votes) * 100
+    else:
+        weighted_votes = np.zeros(len(tally))
+    figsize = (
+        np.array([6.4, 4.8]) * len(tally) / 9
+        if len(tally) >= 9
+        else (6.4, 4.8)
+    )
+    plt.figure(figsize=figsize)
+    positions = np.array(range(1, len(tally) + 1))
+    barchart = plt.bar(positions, weighted_votes, width=0.4, color="r")
+    plt.ylim((0, 100))
+    plt.gca().yaxis.set_major_formatter(PercentFormatter())
+    plt.xticks(positions)
+    plt.xlabel("Answers")
+    plt.title(f"Total number of votes: {np.sum(individual_votes)}\n")
+    if correct:
+        barchart.patches[correct - 1].set_facecolor("g")
+    else:
+        for patch in barchart.patches:
+            patch.set_facecolor("b")
+    for i, bar in enumerate(barchart):
+        plt.gca().text(
+            bar.get_x() + bar.get_width() / 2,
+            bar.get_height() + 1.2,
+            f"{individual_votes[i]}",
+            ha="center",
+            color="white",
+            fontsize=12,
+        )
+    for i, spine in enumerate(list(plt.gca().spines.values())):
+        if i in (1, 3):
+            spine.set_visible(False)
+    plt.tick_params(
+        bottom="off", left="off", labelleft="off", labelbottom="on"
+    )
+    plt.savefig(
+        image_buffer, format="png", bbox_inches="tight", transparent=True
+    )
+    plt.close()
+    return image_buffer.getvalue()
+
+
+def timeit(render, noptions):
+    """Mean time in ms of rendering charts with changing tallies."""
+    rng = np.random.default_rng(1)
+    tallies = rng.integers(0, 50, size=(REPEATS + 1, noptions))
+    render(tallies[0], 1)  # Warm up fonts and templates
+    start = time.perf_counter()
+    for tally in tallies[1:]:
+        render(tally, 1)
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+if __name__ == "__main__":
+    print(f"Mean render time over {REPEATS} charts:")
+    print(f"  {'options':<10}{'pyplot':>10}{'template':>10}{'speedup':>9}")
+    for noptions in (4, 10, 36):
+        old = timeit(render_pyplot, noptions)
+        new = timeit(render_histogram, noptions)
+        print(
+            f"  {noptions:<10}{old:8.1f}ms{new:8.1f}ms{old / new:8.2f}x"
+        )
@@ -0,0 +1,92 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Overhead of Poll.on_message per message, with 0, 10 and 100 quizzes.
+
+Compares the previous listener, which filtered all active quizzes for
+every message, with the channel-set fast path. Messages are sent in a
+channel without a quiz, which is by far the most common case. Run with::
+
+    python benchmarks/bench_on_message.py
+"""
+
+import asyncio
+import contextlib
+import io
+import tempfile
+import time
+import unittest.mock
+from pathlib import Path
+from types import SimpleNamespace
+
+from edubot.cogs.poll import Poll, Quiz
+
+MESSAGES = 20000
+
+
+async def on_message_filter(poll, ctx):
+    """The previous implementation, filtering all active quizzes."""
+    ids = list(
+        filter(
+            lambda k: poll.quizzes[k].channel_id == ctx.channel.id,
+            poll.quizzes,
+        )
+    )
+    quizzes = [poll.quizzes[k] for k in ids]
+    if (
+        not quizzes
+        or ctx.author.id == poll.bot.user.id
+        or not quizzes[0].dynamic
+    ):
+        return
+
+
+async def per_message(listener, poll, ctx):
+    """Returns the mean time in microseconds of one listener call."""
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        await listener(poll, ctx)
+    return (time.perf_counter() - start) / MESSAGES * 1e6
+
+
+async def main():
+    """Prints the listener overhead for each number of quizzes."""
+    ctx = SimpleNamespace(
+        channel=SimpleNamespace(id=1),
+        author=SimpleNamespace(id=2),
+        content="hello",
+    )
+    print(f"{'quizzes':>8} {'filter':>10} {'fast path':>10}")
+    with tempfile.TemporaryDirectory() as datadir:
+        for nquizzes in (0, 10, 100):
+            with contextlib.redirect_stdout(io.StringIO()):
+                poll = Poll(unittest.mock.MagicMock(datadir=Path(datadir)))
+            poll.bot.user = SimpleNamespace(id=0)
+            for i in range(nquizzes):
+                quiz = Quiz(None, 0)
+                quiz.message_id = 1000 + i
+                quiz.channel_id = 100 + i
+                quiz.dynamic = i % 2 == 0
+                poll.activate_quiz(quiz)
+            old = await per_message(on_message_filter, poll, ctx)
+            new = await per_message(Poll.on_message, poll, ctx)
+            print(f"{nquizzes:>8} {old:>8.2f}us {new:>8.2f}us")
+            poll.charts.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Memory use per queued student of the queue and vote containers.
+
+Compares the list/dataclass/set based storage used before with the
+compact array based storage, for 10k queued students spread over many
+guilds. Run with::
+
+    python benchmarks/bench_queue_memory.py
+"""
+
+import random
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List
+
+from edubot.cogs.queue import MultiReviewQueue, Queue
+from edubot.compact import uidarray
+from edubot.votes import VoteEngine
+
+GUILDS = 200
+STUDENTS = 10_000
+ASSIGNMENTS = ("1", "2", "3")
+
+
+@dataclass
+class OldStudent:
+    id: int
+    aid: List[str] = field(default_factory=list)
+
+
+def make_uids():
+    """Random 64-bit Discord-like ids, spread over the guilds."""
+    rng = random.Random(1)
+    uids = [rng.getrandbits(63) | (1 << 62) for _ in range(STUDENTS)]
+    per_guild = STUDENTS // GUILDS
+    return [uids[i : i + per_guild] for i in range(0, STUDENTS, per_guild)]
+
+
+# Ids are copied with int(str(uid)) to get fresh int objects, as ids
+# parsed from Discord events or json files would be.
+
+
+def old_queue(guilds):
+    """Review queues as lists of ints."""
+    return [[int(str(uid)) for uid in uids] for uids in guilds]
+
+
+def old_multi(guilds):
+    """Multi-review queues as lists of ints plus Student dataclasses."""
+    multis = []
+    for uids in guilds:
+        queue = OrderedDict((aid, []) for aid in ASSIGNMENTS)
+        students = OrderedDict()
+        for i, uid in enumerate(uids):
+            uid = int(str(uid))
+            aid = ASSIGNMENTS[i % len(ASSIGNMENTS)]
+            queue[aid].append(uid)
+            students[uid] = OldStudent(uid, [aid])
+        multis.append((queue, students))
+    return multis
+
+
+def old_votes(guilds):
+    """Quiz votes as sets of ints."""
+    return [{1: set(int(str(uid)) for uid in uids)} for uids in guilds]
+
+
+def new_queue(guilds):
+    """Review queues backed by arrays."""
+    queues = []
+    for gid, uids in enumerate(guilds):
+        queue = Queue((gid, 1), "guild", "channel")
+        queue.fromfile(uids)
+        queues.append(queue)
+    return queues
+
+
+def new_multi(guilds):
+    """Multi-review queues backed by arrays plus slotted Students."""
+    multis = []
+    for gid, uids in enumerate(guilds):
+        multi = MultiReviewQueue((gid, 2), "guild", "channel")
+        queue = {
+            aid: [int(str(uid)) for uid in uids[i :: len(ASSIGNMENTS)]]
+            for i, aid in enumerate(ASSIGNMENTS)
+        }
+        multi.fromfile(dict(assignments=list(ASSIGNMENTS), queue=queue))
+        multis.append(multi)
+    return multis
+
+
+def new_votes(guilds):
+    """Quiz votes in the VoteEngine of each quiz."""
+    engines = []
+    for uids in guilds:
+        engine = VoteEngine(1)
+        for uid in uids:
+            engine.vote(int(str(uid)), 1)
+        engines.append(engine)
+    return engines
+
+
+def measure(build, guilds):
+    """Returns the bytes allocated by ``build`` per queued student."""
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    storage = build(guilds)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del storage
+    return used / STUDENTS
+
+
+if __name__ == "__main__":
+    guilds = make_uids()
+    # Warm up imports and interned objects before measuring
+    uidarray(guilds[0])
+    print(f"Bytes per student, {STUDENTS} students in {GUILDS} guilds:")
+    print(f"  {'container':<24}{'before':>10}{'after':>10}{'ratio':>8}")
+    for name, old, new in (
+        ("Queue.queue", old_queue, new_queue),
+        ("MultiReviewQueue", old_multi, new_multi),
+        ("Quiz votes", old_votes, new_votes),
+    ):
+        before = measure(old, guilds)
+        after = measure(new, guilds)
+        print(f"  {name:<24}{before:10.1f}{after:10.1f}"
+              f"{before / after:7.2f}x")
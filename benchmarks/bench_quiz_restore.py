@@ -0,0 +1,105 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Startup time of restoring 1,000 saved quizzes.
+
+Writes a save file with 1,000 active quizzes, and measures how long
+:py:meth:`Poll.load_quizzes` takes to restore them, next to the time
+spent reading and parsing the file itself. For comparison, it also
+measures the per-quiz emoji table that each quiz used to build. Run
+with::
+
+    python benchmarks/bench_quiz_restore.py
+"""
+
+import contextlib
+import io
+import json
+import tempfile
+import time
+import unittest.mock
+from pathlib import Path
+
+from edubot.cogs.poll import Poll, Quiz, get_emoji
+from edubot.votes import VoteEngine
+
+QUIZZES = 1000
+REPEATS = 5
+
+
+def emoji_table():
+    """The emoji table that each quiz used to build in its constructor."""
+    options = [
+        get_emoji(em)
+        for em in (":one:", ":two:", ":three:", ":four:", ":five:", ":six:",
+                   ":seven:", ":eight:", ":nine:", ":keycap_ten:")
+    ]
+    options += [
+        chr(ord("\N{REGIONAL INDICATOR SYMBOL LETTER A}") + i)
+        for i in range(26)
+    ]
+    return {em: i + 1 for i, em in enumerate(options)}
+
+
+def save_data(i):
+    """Returns the save data of a quiz with four options and 40 votes."""
+    quiz = Quiz(None, 1)
+    quiz.name = f"quiz {i}"
+    quiz.question = "Which of these is a list?"
+    quiz.options = {1: "[]", 2: "()", 3: "{}", 4: "set()"}
+    quiz.message_id = 10 ** 17 + i
+    quiz.channel_id = 10 ** 17
+    quiz.engine = VoteEngine(4)
+    for voter in range(40):
+        quiz.engine.vote(10 ** 17 + voter, voter % 4 + 1)
+    return quiz.create_save_data()
+
+
+def best(func):
+    """Returns the best time in milliseconds out of a few repeats."""
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    """Prints the restore time of the saved quizzes."""
+    with tempfile.TemporaryDirectory() as datadir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            poll = Poll(unittest.mock.MagicMock(datadir=Path(datadir)))
+            saved = {i: save_data(i) for i in range(QUIZZES)}
+            poll.save_filepath.write_text(json.dumps(saved))
+
+            def read():
+                with open(poll.save_filepath) as file:
+                    json.load(file)
+
+            restore = best(poll.load_quizzes)
+            parse = best(read)
+        poll.charts.shutdown()
+
+    emoji = best(lambda: [emoji_table() for _ in range(QUIZZES)])
+    print(f"restoring {QUIZZES} quizzes: {restore:.1f} ms")
+    print(f"  reading and parsing the save file: {parse:.1f} ms")
+    print(f"  previous per-quiz emoji tables: {emoji:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Archive of finished quizzes, stored as columns of votes.
+
+Each finished quiz is written to ``YYYY-MM-DD/<message id>.npz`` (by
+finishing date, in UTC), with the columns ``voter``, ``option`` and
+``time`` (Unix time of each vote), and the quiz details as JSON in
+``meta``.
+
+An export combines the quizzes of a date range into a single ``.npz``
+file, with the columns ``quiz``, ``voter``, ``option`` and ``time``,
+and the details of all quizzes in ``quizzes.json``. Quizzes are read one
+at a time and columns are buffered on disk, so an export needs memory
+for the largest quiz only.
+"""
+
+import json
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Columns of an export, and their types
+COLUMNS = (
+    ("quiz", np.uint64),
+    ("voter", np.uint64),
+    ("option", np.uint8),
+    ("time", np.float64),
+)
+
+
+class QuizArchive:
+    """Directory of finished quizzes.
+
+    Args:
+        directory: Location of the archive.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def add(
+        self,
+        meta: dict,
+        voters: Sequence[int],
+        options: Sequence[int],
+        times: Sequence[float],
+    ) -> Path:
+        """Stores the votes of a finished quiz.
+
+        Args:
+            meta: Quiz details, with at least the message id as ``quiz``
+                and the Unix time the quiz finished as ``finished_at``.
+            voters: Voter of each vote.
+            options: Option of each vote.
+            times: Unix time of each vote.
+
+        Returns:
+            The path of the stored quiz.
+        """
+        day = datetime.fromtimestamp(meta["finished_at"], timezone.utc)
+        path = self.directory.joinpath(
+            day.date().isoformat(), f"{meta['quiz']}.npz"
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = dict(meta, votes=len(voters))
+        np.savez_compressed(
+            path,
+            voter=np.asarray(voters, dtype=np.uint64),
+            option=np.asarray(options, dtype=np.uint8),
+            time=np.asarray(times, dtype=np.float64),
+            meta=np.array(json.dumps(meta)),
+        )
+        return path
+
+    def paths(
+        self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> Iterator[Path]:
+        """Yields the stored quizzes that finished from ``start`` to ``end``.
+
+        Both dates are included, and either can be None for no limit.
+        """
+        if not self.directory.exists():
+            return
+        first = start.isoformat() if start is not None else ""
+        last = end.isoformat() if end is not None else "9999"
+        for day in sorted(self.directory.iterdir()):
+            if day.is_dir() and first <= day.name <= last:
+                yield from sorted(day.glob("*.npz"))
+
+    @staticmethod
+    def load(path: Path) -> Tuple[dict, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the details, voters, options and times of a quiz."""
+        with np.load(path) as data:
+            return (
+                json.loads(str(data["meta"])),
+                data["voter"],
+                data["option"],
+                data["time"],
+            )
+
+    def export(
+        self,
+        file: BinaryIO,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+    ) -> Tuple[int, int]:
+        """Writes the quizzes of a date range to ``file``, as ``.npz``.
+
+        Each quiz is read once, and its columns are appended to
+        temporary column files, which are then copied into the
+        compressed file in chunks.
+
+        Returns:
+            The number of quizzes and votes exported.
+        """
+        quizzes: List[dict] = []
+        columns = {column: tempfile.TemporaryFile() for column, _ in COLUMNS}
+        try:
+            for path in self.paths(start, end):
+                meta, voters, options, times = self.load(path)
+                quizzes.append(meta)
+                values = dict(
+                    quiz=np.full(len(voters), meta["quiz"], dtype=np.uint64),
+                    voter=voters,
+                    option=options,
+                    time=times,
+                )
+                for column, dtype in COLUMNS:
+                    columns[column].write(values[column].astype(dtype).data)
+            total = sum(meta["votes"] for meta in quizzes)
+
+            with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr("quizzes.json", json.dumps(quizzes))
+                for column, dtype in COLUMNS:
+                    header = dict(
+                        descr=np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                        fortran_order=False,
+                        shape=(total,),
+                    )
+                    with archive.open(
+                        f"{column}.npy", "w", force_zip64=True
+                    ) as member:
+                        np.lib.format.write_array_header_1_0(member, header)
+                        columns[column].seek(0)
+                        shutil.copyfileobj(columns[column], member)
+        finally:
+            for column in columns.values():
+                column.close()
+        return len(quizzes), total
@@ -0,0 +1,254 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Question banks: many quiz questions in one indexed file.
+
+A bank ``name`` consists of three files:
+
+- ``name.jsonl``: one question per line, as ``{"quiz": {...}, "tags":
+  [...], "source": "..."}``, where ``quiz`` is the unchanged content of a
+  per-file quiz definition.
+- ``name.idx``: the byte offset and length of each line, as fixed-size
+  little-endian records, so question ``n`` is read with two seeks.
+- ``name.tags``: the question numbers of each tag, as JSON.
+
+Questions are numbered from 1, in the order they were added. Banks are
+only appended to, so question numbers never change.
+"""
+
+import json
+import random
+import re
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .catalog import QuizFormatError, validate_quiz
+
+# Index record: byte offset (uint64) and length (uint32) of a line
+RECORD = struct.Struct("<QI")
+
+
+class QuestionBank:
+    """An append-only bank of quiz questions.
+
+    Args:
+        path: Location of the JSONL file of the bank.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(".idx")
+        self.tags_path = self.path.with_suffix(".tags")
+        self._tags = None
+        if self.path.exists() and not self.index_current():
+            self.rebuild_index()
+
+    @property
+    def name(self) -> str:
+        """Name of the bank."""
+        return self.path.stem
+
+    def __len__(self) -> int:  # noqa
+        if not self.index_path.exists():
+            return 0
+        return self.index_path.stat().st_size // RECORD.size
+
+    def index_current(self) -> bool:
+        """Returns whether the index covers all lines of the bank."""
+        if not self.index_path.exists():
+            return False
+        nquestions = len(self)
+        if not nquestions:
+            return self.path.stat().st_size == 0
+        offset, length = self.record(nquestions)
+        return offset + length == self.path.stat().st_size
+
+    def rebuild_index(self) -> None:
+        """Rebuilds the index and tags from the JSONL file."""
+        records = bytearray()
+        tags = dict()
+        offset = 0
+        with open(self.path, "rb") as file:
+            for number, line in enumerate(file, 1):
+                records += RECORD.pack(offset, len(line))
+                offset += len(line)
+                for tag in json.loads(line).get("tags", ()):
+                    tags.setdefault(tag, []).append(number)
+        self.index_path.write_bytes(records)
+        self.tags_path.write_text(json.dumps(tags))
+        self._tags = tags
+
+    def record(self, number: int) -> Tuple[int, int]:
+        """Returns the offset and length of question ``number``."""
+        if not 1 <= number <= len(self):
+            raise KeyError(number)
+        with open(self.index_path, "rb") as file:
+            file.seek((number - 1) * RECORD.size)
+            return RECORD.unpack(file.read(RECORD.size))
+
+    def entry(self, number: int) -> dict:
+        """Returns the stored line of question ``number``.
+
+        Raises:
+            KeyError: If the bank has no question ``number``.
+        """
+        offset, length = self.record(number)
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            return json.loads(file.read(length))
+
+    def get(self, number: int) -> dict:
+        """Returns the validated quiz definition of question ``number``.
+
+        Raises:
+            KeyError: If the bank has no question ``number``.
+            QuizFormatError: If the question is not valid.
+        """
+        return validate_quiz(self.entry(number)["quiz"])
+
+    @property
+    def tags(self) -> Dict[str, List[int]]:
+        """Question numbers of each tag."""
+        if self._tags is None:
+            self._tags = (
+                json.loads(self.tags_path.read_text())
+                if self.tags_path.exists()
+                else dict()
+            )
+        return self._tags
+
+    def append(
+        self, quiz: dict, tags: Iterable[str] = (), source: str = None
+    ) -> int:
+        """Adds a question to the bank.
+
+        Args:
+            quiz: Quiz definition, as in a per-file quiz JSON file.
+            tags: Tags used to draw questions on a topic.
+            source: Name of the file the question was imported from.
+
+        Returns:
+            The number of the new question.
+
+        Raises:
+            QuizFormatError: If ``quiz`` is not a valid quiz definition.
+        """
+        validate_quiz(quiz)
+        tags = list(dict.fromkeys(tags))
+        line = dict(quiz=quiz, tags=tags)
+        if source is not None:
+            line["source"] = source
+        data = (json.dumps(line, ensure_ascii=False) + "\n").encode()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as file:
+            offset = file.tell()
+            file.write(data)
+        with open(self.index_path, "ab") as file:
+            file.write(RECORD.pack(offset, len(data)))
+        number = len(self)
+        for tag in tags:
+            self.tags.setdefault(tag, []).append(number)
+        if tags:
+            self.tags_path.write_text(json.dumps(self.tags))
+        return number
+
+    def draw(self, tag: str = None, rng: random.Random = random) -> int:
+        """Returns the number of a random question, with ``tag`` if given.
+
+        Raises:
+            KeyError: If there are no (matching) questions.
+        """
+        if tag is None:
+            if not len(self):
+                raise KeyError(tag)
+            return rng.randint(1, len(self))
+        numbers = self.tags.get(tag)
+        if not numbers:
+            raise KeyError(tag)
+        return rng.choice(numbers)
+
+    def import_file(self, path: Path, tags: Iterable[str] = ()) -> int:
+        """Appends a per-file quiz definition, and returns its number."""
+        with open(path, "r") as file:
+            quiz = json.load(file)
+        return self.append(quiz, tags, source=Path(path).name)
+
+    def export(self, directory: Path) -> List[Path]:
+        """Writes each question to a per-file quiz definition.
+
+        Imported questions keep the name of the file they came from,
+        other questions are named after their number.
+
+        Returns:
+            The paths of the written files, in question order.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        with open(self.path, "rb") as file:
+            for number, line in enumerate(file, 1):
+                entry = json.loads(line)
+                path = directory.joinpath(
+                    entry.get("source", f"{number}.json")
+                )
+                if path in paths:
+                    path = directory.joinpath(f"{number}.json")
+                path.write_text(json.dumps(entry["quiz"], ensure_ascii=False))
+                paths.append(path)
+        return paths
+
+
+def check_bank_name(name: str) -> str:
+    """Returns ``name`` if it can be used as a bank name.
+
+    Raises:
+        QuizFormatError: If the name contains other characters than
+            letters, digits, - and _.
+    """
+    if not re.fullmatch(r"[\w-]+", name):
+        raise QuizFormatError(
+            "bank names can only contain letters, digits, - and _"
+        )
+    return name
+
+
+def parse_reference(
+    reference: str,
+) -> Tuple[str, Optional[int], Optional[str]]:
+    """Splits a reference to a question in a bank.
+
+    References are ``bank:number``, ``bank:random`` or
+    ``bank:random:tag``.
+
+    Returns:
+        The bank name, and the question number or tag (or neither).
+
+    Raises:
+        QuizFormatError: If the question part is not a number or random.
+    """
+    bank, _, question = reference.partition(":")
+    check_bank_name(bank)
+    question, _, tag = question.partition(":")
+    if question.lower() == "random":
+        return bank, None, tag or None
+    if not question.isdigit() or tag:
+        raise QuizFormatError(
+            f"use {bank}:<number>, {bank}:random or {bank}:random:<tag>"
+        )
+    return bank, int(question), None
@@ -0,0 +1,199 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Catalog of the quiz definition files in the quiz directory.
+
+Quiz files are read, parsed and validated once, and kept in memory.
+Entries are refreshed when the modification time or size of a file
+changes. Changes are detected with inotify when the optional
+``inotify_simple`` package is available (Linux only), and otherwise by
+checking the files at most once every few seconds.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # pragma: no cover
+    INotify = None
+
+# Maximum number of options, one for each option emoji
+MAX_OPTIONS = 36
+
+
+class QuizFormatError(ValueError):
+    """Raised when a quiz definition is not valid."""
+
+
+def validate_quiz(data) -> dict:
+    """Checks a parsed quiz file, and returns the quiz definition.
+
+    Raises:
+        QuizFormatError: With a description of the first problem found.
+    """
+    if not isinstance(data, dict):
+        raise QuizFormatError("the file should contain a JSON object")
+    if "question" not in data:
+        raise QuizFormatError('the "question" field is missing')
+    options = data.get("options")
+    if not isinstance(options, list):
+        raise QuizFormatError('"options" should be a list of answers')
+    if len(options) > MAX_OPTIONS:
+        raise QuizFormatError(
+            f"a quiz can have at most {MAX_OPTIONS} options, "
+            f"not {len(options)}"
+        )
+    correct = data.get("correct")
+    if correct is not None and (
+        isinstance(correct, bool)
+        or not isinstance(correct, int)
+        or not 1 <= correct <= len(options)
+    ):
+        raise QuizFormatError(
+            f'"correct" should be the number (1 to {len(options)}) '
+            f"of the correct option"
+        )
+    timer = data.get("timer")
+    if timer is not None and (
+        isinstance(timer, bool)
+        or not isinstance(timer, (int, float))
+        or timer < 0
+    ):
+        raise QuizFormatError('"timer" should be a number of seconds')
+    for field in ("singlevote", "dynamic"):
+        if not isinstance(data.get(field, False), bool):
+            raise QuizFormatError(f'"{field}" should be true or false')
+    return dict(
+        name=str(data.get("name", "Quiz")),
+        question=str(data["question"]),
+        options=[str(option) for option in options],
+        correct=correct,
+        singlevote=data.get("singlevote", True),
+        dynamic=data.get("dynamic", False),
+        timer=timer or None,
+    )
+
+
+class CatalogEntry:
+    """A quiz file, with its contents and parsed definition.
+
+    Attributes:
+        path: Location of the file.
+        stamp: Modification time and size of the file when it was read.
+        data: Raw contents of the file.
+        definition: Validated quiz definition, or None if it is invalid.
+        error: Why the file is not a valid quiz, or None.
+    """
+
+    __slots__ = ("path", "stamp", "data", "definition", "error")
+
+    def __init__(self, path: Path, stamp: tuple):
+        self.path = path
+        self.stamp = stamp
+        self.data = path.read_bytes()
+        self.definition = None
+        self.error = None
+        try:
+            self.definition = validate_quiz(json.loads(self.data))
+        except json.JSONDecodeError as err:
+            self.error = f"invalid JSON ({err})"
+        except (QuizFormatError, UnicodeDecodeError) as err:
+            self.error = str(err)
+
+
+class QuizCatalog:
+    """In-memory catalog of the ``*.json`` quiz files in a directory.
+
+    Args:
+        directory: Directory containing the quiz files.
+        interval: Seconds between checks for changed files, when
+            inotify is not available.
+        watch: Use inotify to detect changes, when available.
+    """
+
+    # Changes to the directory that invalidate the catalog
+    watchflags = (
+        flags.CREATE
+        | flags.DELETE
+        | flags.CLOSE_WRITE
+        | flags.MOVED_FROM
+        | flags.MOVED_TO
+        if INotify is not None
+        else 0
+    )
+
+    def __init__(
+        self, directory: Path, interval: float = 5.0, watch: bool = True
+    ):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.entries: Dict[str, CatalogEntry] = dict()
+        self.checked = None
+        self.inotify = INotify() if watch and INotify is not None else None
+        self.watched = set()
+
+    def refresh(self, force: bool = False) -> None:
+        """Rereads the quiz files that were added or changed.
+
+        Unless ``force`` is set, this only checks the files when a
+        change was detected, or when they were last checked more than
+        :py:attr:`interval` seconds ago.
+        """
+        if not force and self.checked is not None and not self.changed():
+            return
+        entries = dict()
+        for path in sorted(self.directory.rglob("*.json")):
+            name = path.relative_to(self.directory).as_posix()
+            try:
+                stat = path.stat()
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                entry = self.entries.get(name)
+                if entry is None or entry.stamp != stamp:
+                    entry = CatalogEntry(path, stamp)
+            except OSError:
+                # The file was removed or replaced during the scan
+                continue
+            entries[name] = entry
+            self.watch(path.parent)
+        self.watch(self.directory)
+        self.entries = entries
+        self.checked = time.monotonic()
+
+    def changed(self) -> bool:
+        """Returns whether the files may have changed since the last scan."""
+        if self.inotify is not None:
+            return bool(self.inotify.read(timeout=0))
+        return time.monotonic() - self.checked >= self.interval
+
+    def watch(self, directory: Path) -> None:
+        """Watches ``directory`` for changes, when inotify is used."""
+        if self.inotify is not None and directory not in self.watched:
+            self.inotify.add_watch(directory, self.watchflags)
+            self.watched.add(directory)
+
+    def get(self, name: str) -> Optional[CatalogEntry]:
+        """Returns the entry of quiz file ``name``, or None."""
+        self.refresh()
+        return self.entries.get(name)
+
+    def names(self) -> List[str]:
+        """Returns the names of all quiz files, in alphabetical order."""
+        self.refresh()
+        return list(self.entries)
@@ -0,0 +1,352 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Rendering of quiz result charts outside of the event loop.
+
+Charts are rendered from plain vote-count vectors in a small pool of
+worker processes, so that matplotlib never blocks the Discord gateway.
+Rendered charts are cached, so each distinct state of a quiz is only
+encoded once. Charts are drawn with prebuilt :py:class:`Figure`
+templates instead of pyplot, so rendering is also safe in threads.
+"""
+
+import asyncio
+import io
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Hashable, Optional, Sequence
+
+import matplotlib.style
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import PercentFormatter
+
+# Creating templates reads the global rcParams, so it is done under a lock
+_template_lock = threading.Lock()
+# Each thread keeps its own templates, so renders never share a figure
+_templates = threading.local()
+
+
+class HistogramTemplate:
+    """Prebuilt bar chart figure for a fixed number of options.
+
+    The figure, axes, bars and labels are created once. Rendering only
+    updates the bar heights, colours and labels, and encodes the figure.
+    Templates are not shared between threads.
+
+    Args:
+        noptions: Number of answer options (bars).
+        style: Matplotlib style sheet to use.
+    """
+
+    def __init__(self, noptions: int, style: str = "dark_background"):
+        self.noptions = noptions
+        figsize = (
+            np.array([6.4, 4.8]) * noptions / 9
+            if noptions >= 9
+            else (6.4, 4.8)
+        )
+        with _template_lock, matplotlib.style.context(style):
+            self.figure = Figure(figsize=figsize)
+            FigureCanvasAgg(self.figure)
+            ax = self.figure.add_subplot()
+            positions = np.arange(1, noptions + 1)
+            self.bars = ax.bar(
+                positions, np.zeros(noptions), width=0.4, color="r"
+            )
+            ax.set_ylim((0, 100))
+            ax.yaxis.set_major_formatter(PercentFormatter())
+            ax.set_xticks(positions)
+            ax.set_xlabel("Answers")
+            self.title = ax.set_title("")
+            self.labels = [
+                ax.text(
+                    bar.get_x() + bar.get_width() / 2,
+                    1.2,
+                    "",
+                    ha="center",
+                    color="white",
+                    fontsize=12,
+                )
+                for bar in self.bars
+            ]
+            # Disable the left and top splines
+            for i, spine in enumerate(ax.spines.values()):
+                if i in (1, 3):
+                    spine.set_visible(False)
+            ax.tick_params(
+                bottom="off", left="off", labelleft="off", labelbottom="on"
+            )
+            self.bbox = self._tightbbox()
+
+    def _tightbbox(self):
+        """Bounding box that fits the chart for any tally.
+
+        Computing a tight bounding box takes an extra draw of the
+        figure, so it is done once, with the bars and labels at their
+        largest extent.
+        """
+        self.update(np.full(self.noptions, 99999))
+        for bar in self.bars:
+            bar.set_height(100)
+        for label in self.labels:
+            label.set_y(101.2)
+        renderer = self.figure.canvas.get_renderer()
+        bbox = self.figure.get_tightbbox(renderer)
+        return bbox.padded(matplotlib.rcParams["savefig.pad_inches"])
+
+    def update(
+        self, tally: Sequence[int], correct: Optional[int] = None
+    ) -> None:
+        """Updates the bars, labels and title to show ``tally``."""
+        individual_votes = np.asarray(tally)
+        total = individual_votes.sum()
+        if total != 0:
+            weighted_votes = individual_votes / total * 100
+        else:
+            weighted_votes = np.zeros(self.noptions)
+
+        for i, (votes, height, bar, label) in enumerate(
+            zip(individual_votes, weighted_votes, self.bars, self.labels)
+        ):
+            bar.set_height(height)
+            label.set_y(height + 1.2)
+            label.set_text(f"{votes}")
+            # Color the correct answer green
+            if correct:
+                bar.set_facecolor("g" if i == correct - 1 else "r")
+            else:
+                bar.set_facecolor("b")
+        self.title.set_text(f"Total number of votes: {total}\n")
+
+    def render(
+        self, tally: Sequence[int], correct: Optional[int] = None
+    ) -> bytes:
+        """Updates the chart with ``tally`` and encodes it as PNG."""
+        self.update(tally, correct)
+        image_buffer = io.BytesIO()
+        self.figure.savefig(
+            image_buffer, format="png", bbox_inches=self.bbox, transparent=True
+        )
+        return image_buffer.getvalue()
+
+
+def get_template(noptions: int, style: str) -> HistogramTemplate:
+    """Returns this thread's template for ``noptions`` bars."""
+    cache = getattr(_templates, "cache", None)
+    if cache is None:
+        cache = _templates.cache = dict()
+    template = cache.get((noptions, style))
+    if template is None:
+        template = cache[(noptions, style)] = HistogramTemplate(
+            noptions, style
+        )
+    return template
+
+
+def render_histogram(
+    tally: Sequence[int],
+    correct: Optional[int] = None,
+    style: str = "dark_background",
+) -> bytes:
+    """Renders the percentual distribution of votes as a bar chart.
+
+    This is safe to call from several threads at the same time.
+
+    Args:
+        tally: Number of votes for each option.
+        correct: Number (starting at 1) of the correct option, if any.
+        style: Matplotlib style sheet to use.
+
+    Returns:
+        The chart as PNG encoded bytes.
+    """
+    return get_template(len(tally), style).render(tally, correct)
+
+
+def text_histogram(
+    tally: Sequence[int],
+    labels: Sequence[str],
+    correct: Optional[int] = None,
+    width: int = 20,
+) -> str:
+    """Renders the distribution of votes as text bars for an embed.
+
+    Messages can be edited cheaply, but their attachments can not be
+    replaced, so live results are shown with text bars instead of an
+    image.
+
+    Args:
+        tally: Number of votes for each option.
+        labels: Label (emoji) shown in front of each bar.
+        correct: Number (starting at 1) of the correct option, if any.
+        width: Length in characters of a full bar.
+    """
+    total = sum(tally)
+    rows = []
+    for i, (votes, label) in enumerate(zip(tally, labels)):
+        fraction = votes / total if total else 0.0
+        bar = "\u2588" * round(fraction * width)
+        mark = " \u2714" if correct and i == correct - 1 else ""
+        rows.append(
+            f"{label} `{bar:<{width}}` {fraction * 100:3.0f}% ({votes}){mark}"
+        )
+    rows.append(f"\nTotal number of votes: {total}")
+    return "\n".join(rows)
+
+
+class ChartCache:
+    """Least-recently-used cache of encoded charts with a byte budget.
+
+    Args:
+        budget: Maximum total size in bytes of the cached charts.
+    """
+
+    def __init__(self, budget: int = 16 * 1024 * 1024):
+        self.budget = budget
+        self.nbytes = 0
+        self.charts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Returns the chart stored for ``key``, or None."""
+        png = self.charts.get(key)
+        if png is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.charts.move_to_end(key)
+        return png
+
+    def put(self, key: Hashable, png: bytes) -> None:
+        """Stores a chart, evicting the least recently used ones."""
+        if len(png) > self.budget:
+            return
+        old = self.charts.pop(key, None)
+        if old is not None:
+            self.nbytes -= len(old)
+        self.charts[key] = png
+        self.nbytes += len(png)
+        while self.nbytes > self.budget:
+            _, evicted = self.charts.popitem(last=False)
+            self.nbytes -= len(evicted)
+
+    def discard(self, quiz: Hashable) -> None:
+        """Removes all charts of ``quiz`` from the cache."""
+        for key in [key for key in self.charts if key[0] == quiz]:
+            self.nbytes -= len(self.charts.pop(key))
+
+
+class ChartRenderer:
+    """Renders charts in a bounded pool of worker processes.
+
+    Args:
+        workers: Maximum number of worker processes.
+        timeout: Seconds to wait for a chart before giving up.
+        budget: Byte budget of the chart cache.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 10.0,
+        budget: int = 16 * 1024 * 1024,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.pool = None
+        self.cache = ChartCache(budget)
+        # Renders in progress, shared by identical requests
+        self.pending = dict()
+        # Latencies (in seconds) of the most recent renders
+        self.latencies = deque(maxlen=200)
+        self.timeouts = 0
+        self.failures = 0
+
+    async def render(
+        self,
+        tally: Sequence[int],
+        correct: Optional[int] = None,
+        quiz: Hashable = None,
+        labels: Sequence[str] = (),
+        style: str = "dark_background",
+    ) -> bytes:
+        """Renders a histogram of ``tally`` in a worker process.
+
+        Charts are cached by quiz, option labels, tally, correct answer
+        and style, and identical requests made while a chart is being
+        rendered wait for that same render.
+
+        Raises:
+            asyncio.TimeoutError: When rendering takes longer than
+                :py:attr:`timeout` seconds.
+        """
+        key = (quiz, tuple(labels), tuple(tally), correct, style)
+        png = self.cache.get(key)
+        if png is not None:
+            return png
+        if key not in self.pending:
+            self.pending[key] = asyncio.ensure_future(self._render(key))
+        try:
+            return await asyncio.shield(self.pending[key])
+        finally:
+            self.pending.pop(key, None)
+
+    async def _render(self, key) -> bytes:
+        """Renders the chart for cache ``key``, and stores it."""
+        _, _, tally, correct, style = key
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_event_loop()
+        start = time.perf_counter()
+        future = loop.run_in_executor(
+            self.pool, render_histogram, tally, correct, style
+        )
+        try:
+            png = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except Exception:
+            self.failures += 1
+            raise
+        self.latencies.append(time.perf_counter() - start)
+        self.cache.put(key, png)
+        return png
+
+    def stats(self) -> str:
+        """Returns a summary of the render latencies."""
+        if not self.latencies:
+            return "no charts rendered yet"
+        lat = np.array(self.latencies) * 1000
+        return (
+            f"{len(lat)} recent renders, median {np.median(lat):.0f} ms, "
+            f"p95 {np.percentile(lat, 95):.0f} ms, max {lat.max():.0f} ms, "
+            f"{self.timeouts} timeouts, {self.failures} failures, "
+            f"{self.cache.hits} cache hits, "
+            f"{self.cache.nbytes // 1024} kB cached"
+        )
+
+    def shutdown(self) -> None:
+        """Stops the worker processes."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
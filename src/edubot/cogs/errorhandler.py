@@ -3,6 +3,8 @@ import sys
 from discord.ext import commands
 import discord
 
+from ..ratelimit import RateLimited
+
 
 class ErrorHandler(commands.Cog):
     ''' Error handler Cog.'''
@@ -32,6 +34,11 @@ class ErrorHandler(commands.Cog):
         if isinstance(error, (commands.CommandNotFound, commands.UserInputError, commands.BadArgument)):
             return await ctx.send(f'Command or argument not recognised! Did you make a typo <@{ctx.author.id}>?', delete_after=10)
 
+        elif isinstance(error, RateLimited):
+            # Only repeated read-only requests are rate-limited: don't reply,
+            # to keep the number of API calls down
+            return
+
         elif isinstance(error, commands.DisabledCommand):
             return await ctx.send(f'{ctx.command} has been disabled, <@{ctx.author.id}>.', delete_after=10)
 
@@ -1,16 +1,47 @@
 import asyncio
+import csv
+import heapq
 import io
 import json
+import math
+import os
+import tempfile
+import time
+import unicodedata
+from collections import defaultdict, deque
+from datetime import date
 import discord
 import emoji  # Library used for handling emoji codes
-import matplotlib.pyplot as plt
 import numpy as np
 from discord.ext import commands
-from matplotlib.ticker import PercentFormatter
+
+from ..archive import QuizArchive
+from ..bank import QuestionBank, check_bank_name, parse_reference
+from ..catalog import QuizCatalog, QuizFormatError, validate_quiz
+from ..charts import ChartRenderer, text_histogram
+from ..gradebook import Gradebook
+from ..ratelimit import TokenBucket
+from ..reactions import ReactionRemover, ReactionSeeder
+from ..votelog import VoteLog
+from ..votes import VoteEngine, VoteTimeline
 
 # Define a shorthand for obtaining the emoji belonging to a :emoji: string
 get_emoji = lambda em: emoji.emojize(em, use_aliases=True)
 
+# The emoji used for the answer options, in option order. These are looked up once, and shared by all quizzes
+EMOJI_OPTIONS = tuple(get_emoji(em) for em in
+                      (":one:",":two:",":three:",":four:",":five:",":six:",":seven:",":eight:",":nine:",
+                       ":keycap_ten:")) + \
+    tuple(chr(ord("\N{REGIONAL INDICATOR SYMBOL LETTER A}") + i) for i in range(26))
+# Look up table for the option (starting at 1) that belongs to an emoji
+EMOJI_INDEX = {em: i + 1 for i, em in enumerate(EMOJI_OPTIONS)}
+
+def normalize_option(text):
+    '''Return the text used to recognise duplicate options: Unicode-normalized (NFKC) and case-folded, with
+    whitespace collapsed and the punctuation and quotes around it removed'''
+    text = " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+    return text.strip(".,;:!?'\"` ")
+
 class Quiz:
 
     """
@@ -18,6 +49,13 @@ class Quiz:
     Also contains information about the quiz message and creator for use by the Discord API
     """
 
+    __slots__ = ("name", "filename", "owner", "message_id", "channel_id", "question", "correct_answer", "options",
+                 "timer", "deadline", "dynamic", "engine", "live_message_id", "votable_after", "started", "timeline",
+                 "option_index")
+
+    emoji_options = EMOJI_OPTIONS
+    emoji_index = EMOJI_INDEX
+
     def __init__(self, json_file, owner):
         self.name = 'Quiz'
         self.filename = json_file
@@ -30,59 +68,65 @@ class Quiz:
         self.correct_answer = 0
         self.options = {}
         self.timer = None
+        # Time (time.monotonic) at which the quiz is finished, if it has a timer
+        self.deadline = None
         self.dynamic = False
 
-        self.votes = {}
-        self.singlevote = True
-
-        self.emoji_options = [get_emoji(em) for em in
-                              (":one:",":two:",":three:",":four:",":five:",":six:",":seven:",":eight:",":nine:",
-                               ":keycap_ten:", "\N{REGIONAL INDICATOR SYMBOL LETTER A}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER B}", "\N{REGIONAL INDICATOR SYMBOL LETTER C}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER D}", "\N{REGIONAL INDICATOR SYMBOL LETTER E}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER F}", "\N{REGIONAL INDICATOR SYMBOL LETTER G}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER H}", "\N{REGIONAL INDICATOR SYMBOL LETTER I}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER J}", "\N{REGIONAL INDICATOR SYMBOL LETTER K}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER L}", "\N{REGIONAL INDICATOR SYMBOL LETTER M}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER N}", "\N{REGIONAL INDICATOR SYMBOL LETTER O}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER P}", "\N{REGIONAL INDICATOR SYMBOL LETTER Q}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER R}", "\N{REGIONAL INDICATOR SYMBOL LETTER S}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER T}", "\N{REGIONAL INDICATOR SYMBOL LETTER U}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER V}", "\N{REGIONAL INDICATOR SYMBOL LETTER W}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER X}", "\N{REGIONAL INDICATOR SYMBOL LETTER Y}",
-                               "\N{REGIONAL INDICATOR SYMBOL LETTER Z}")]
+        self.engine = VoteEngine()
+        # Time (time.monotonic) at which the quiz opened, and the time of each counted vote since then
+        self.started = time.monotonic()
+        self.timeline = VoteTimeline()
+
+        # Message that shows live results, if enabled
+        self.live_message_id = None
+        # Normalized option text -> option number, built when it is first needed
+        self.option_index = None
+        # Seconds between starting the quiz and adding the last option reaction
+        self.votable_after = None
+
+    @property
+    def singlevote(self):
+        '''Whether only the last vote of each voter counts'''
+        return self.engine.singlevote
+
+    @singlevote.setter
+    def singlevote(self, singlevote):
+        self.engine.set_singlevote(singlevote)
 
     def load_data(self):
         '''Function for loading in json files containing the quiz information'''
         try:
             with open(self.filename, "r") as file:
-                json_data = json.load(file)
-            self.name = json_data.get('name', 'Quiz')
-            self.question = str(json_data["question"])
-            self.options = {i+1: str(option) for i,option in enumerate(json_data["options"])}
-
-            self.correct_answer = json_data.get('correct', None)
-            self.votes = {i+1: set() for i in range(len(self.options))}
-            self.singlevote = json_data.get('singlevote', True)
-            self.dynamic = json_data.get('dynamic', False)
-
-            # When the  file is read in, the timer specified there is used as a baseline. !makequiz and !startquiz
-            # Can overwrite this value
-            self.timer = json_data.get('timer', None)
-
+                self.load_definition(validate_quiz(json.load(file)))
             succesful = True
 
-        except Exception:
+        except (OSError, ValueError):
             succesful = False
 
         return succesful, self
 
+    def load_definition(self, definition):
+        '''Function for loading in a validated quiz definition (see edubot.catalog.validate_quiz)'''
+        self.name = definition["name"]
+        self.question = definition["question"]
+        self.options = {i+1: option for i,option in enumerate(definition["options"])}
+        self.option_index = None
+
+        self.correct_answer = definition["correct"]
+        self.engine = VoteEngine(len(self.options), definition["singlevote"])
+        self.dynamic = definition["dynamic"]
+
+        # When the  file is read in, the timer specified there is used as a baseline. !makequiz and !startquiz
+        # Can overwrite this value
+        self.timer = definition["timer"]
+        return self
+
     def create_save_data(self):
 
         '''Function to store all data needed to reconstruct the class'''
 
         # Convert the vote sets to lists in order to be saved in a json file
-        converted_votes = {key: list(data) for key,data in self.votes.items()}
+        converted_votes = self.engine.tolists()
 
         # Create the save dict
         toreturn = dict(
@@ -97,8 +141,10 @@ class Quiz:
             singlevote=self.singlevote,
             dynamic=self.dynamic,
             timer=self.timer,
-            counted_votes={self.options[index]: len(self.votes[index])
-                           for index in range(1, len(self.options) + 1)}
+            ends_at=None if self.deadline is None else time.time() + self.deadline - time.monotonic(),
+            started_at=time.time() - (time.monotonic() - self.started),
+            vote_times=self.timeline.todict(),
+            counted_votes=dict(zip(self.options.values(), self.engine.tally()))
         )
 
         return toreturn
@@ -114,15 +160,29 @@ class Quiz:
 
         self.options = save_dict["options"]
         self.options = {int(key): option for key,option in self.options.items()}
+        self.option_index = None
 
         self.correct_answer = None if not save_dict["correct"] else int(save_dict["correct"])
         self.owner = int(save_dict["owner"])
 
-        self.votes = save_dict["votes"]
-        self.votes = {int(key): set(data) for key,data in self.votes.items()}
-
-        self.singlevote = save_dict.get("singlevote", True)
+        votes = {int(key): data for key,data in save_dict["votes"].items()}
+        self.engine = VoteEngine.from_votes(votes, save_dict.get("singlevote", True))
         self.timer = None if not save_dict["timer"] else int(save_dict["timer"])
+        self.dynamic = save_dict.get("dynamic", False)
+
+        # Resume the countdown where it was. Quizzes saved without an end time restart their timer
+        ends_at = save_dict.get("ends_at")
+        if ends_at is not None:
+            self.deadline = time.monotonic() + max(0.0, ends_at - time.time())
+        elif self.timer:
+            self.deadline = time.monotonic() + self.timer
+
+        # Vote times stay relative to the start of the quiz
+        started_at = save_dict.get("started_at")
+        if started_at is not None:
+            self.started = time.monotonic() - max(0.0, time.time() - started_at)
+        if "vote_times" in save_dict:
+            self.timeline = VoteTimeline.from_dict(save_dict["vote_times"])
 
         return self
 
@@ -145,82 +205,51 @@ class Quiz:
 
         return title, description, emojis
 
-    def vote(self, voter_id, emoji):
+    def vote(self, voter_id, emoji, at=None):
 
-        '''Function that handles user votes to the quiz and makes sure each user only has one final vote'''
+        '''Function that handles user votes to the quiz and makes sure each user only has one final vote.
+        The time of the vote is now, or time.time() value at for votes that are replayed.'''
 
         # If it's an invalid emoji, just return
-        if not emoji in self.emoji_options:
-            return
-
-        # Delete the voter_id from all options
-        if self.singlevote:
-            for option in self.votes:
-                if voter_id in self.votes[option]:
-                    self.votes[option].remove(voter_id)
-        # Cast the vote
-        self.votes[self.emoji_options.index(emoji) + 1].add(voter_id)
-
-
-    def create_histogram(self):
-
-        """
-        Function that creates a histogram to serve as quiz feedback, shows percentual distribution of votes.
-        Returns a BytesIO() object that serves as an image file to pass into a Discord message.
-        """
-
-        # Create a BytesIO buffer to temporarily store the image
-        image_buffer = io.BytesIO()
-        image_buffer.name = f"{self.name.replace(' ','_')}_quiz_feedback.png"
-
-        # Set the plot style to be easier to view in Discord
-        plt.style.use('dark_background')
-
-        # Get the distribution of votes in percentages
-        individual_votes = np.array([len(self.votes[option]) for option in self.options])
-        if np.sum(individual_votes) != 0:
-            weighted_votes = individual_votes / np.sum(individual_votes) * 100
-        else:
-            weighted_votes = np.zeros(len(self.options)) * 100
-
-        # Create a bar chart to represent the data
-        figsize = np.array([6.4,4.8])*len(self.options)/9 if len(self.options) >= 9 else (6.4,4.8)
-        plt.figure(figsize=figsize)
-        barchart = plt.bar(np.array(range(1,len(self.options) + 1)), weighted_votes, width=0.4, color="r")
-        plt.ylim((0,100))
-        plt.gca().yaxis.set_major_formatter(PercentFormatter())
-        plt.xticks(np.array(range(1, len(self.options) + 1)))
-        plt.xlabel("Answers")
-        plt.title(f"Total number of votes: {np.sum(individual_votes)}\n")
-
-        # Color the correct answer green
-        if self.correct_answer:
-            barchart.patches[self.correct_answer - 1].set_facecolor("g")
-        else:
-            for patch in barchart.patches:
-                patch.set_facecolor("b")
-
-        # Show the values of the various bars in the bar chart above the bars
-        for i, bar in enumerate(barchart):
-            votes = individual_votes[i]
-            plt.gca().text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 1.2, f"{votes}",
-                           ha='center', color='white', fontsize=12)
-
-        # Disable the left and top splines
-        [spine.set_visible(False) for i, spine in enumerate(list(plt.gca().spines.values())) if i in (1,3)]
-        plt.tick_params(bottom='off', left='off', labelleft='off', labelbottom='on')
-
-        # Save figure to image buffer
-        plt.savefig(image_buffer, format="png", bbox_inches="tight", transparent=True)
-        plt.close()
-
-        # Reset the buffer internal index to the beginning
-        image_buffer.seek(0)
-
-        return image_buffer
-
-
-
+        option = self.emoji_index.get(emoji)
+        if option is None or option > len(self.options):
+            return None
+        # Cast the vote, this replaces the earlier vote in single-vote quizzes. Return the option if the vote counted
+        if not self.engine.vote(voter_id, option):
+            return None
+        seconds = time.monotonic() - self.started
+        if at is not None:
+            seconds -= time.time() - at
+        self.timeline.append(voter_id, option, seconds)
+        return option
+
+    def find_option(self, text):
+        '''Return the number of the option with the same normalized text, or None'''
+        if self.option_index is None:
+            # Keep the first of options that are the same after normalization
+            self.option_index = {}
+            for option, option_text in self.options.items():
+                self.option_index.setdefault(normalize_option(option_text), option)
+        return self.option_index.get(normalize_option(text))
+
+    def add_option(self, text):
+        '''Add an option, and return its number. Returns None if there is no emoji left for a new option.'''
+        if len(self.options) == len(self.emoji_options):
+            return None
+        # Make sure the index of the existing options is built
+        self.find_option(text)
+        option = self.engine.add_option()
+        self.options[option] = text
+        self.option_index[normalize_option(text)] = option
+        return option
+
+    def tally(self):
+        '''Return the number of votes for each option, in option order'''
+        return self.engine.tally()
+
+    def chart_filename(self):
+        '''Return the filename used for the feedback chart of this quiz'''
+        return f"{self.name.replace(' ','_')}_quiz_feedback.png"
 
 
 class Poll(commands.Cog):
@@ -233,48 +262,196 @@ class Poll(commands.Cog):
             self.datadir.mkdir()
 
         self.save_filepath = self.datadir.joinpath("saved_quizzes.backupjson")
-
-        # This dictionary contains all the currently active quizzes
+        # Votes cast since the last save are logged, and folded into a new save every compact_interval seconds
+        # by the compactor task. Saves are written one at a time, in a worker thread
+        self.votelog = VoteLog(self.datadir.joinpath("votes.log"))
+        self.compact_interval = 300
+        self.compacted = time.monotonic()
+        self.compactor = None
+        self.save_lock = asyncio.Lock()
+        # Parsed quiz files, kept up to date with the quiz directory
+        self.catalog = QuizCatalog(self.datadir)
+        # Question banks, by name
+        self.banksdir = self.datadir.joinpath("banks")
+        self.banks = {}
+        # Votes of finished quizzes
+        self.archive = QuizArchive(self.datadir.joinpath("archive"))
+        # Results of the students in each course (guild), by guild id
+        self.gradebooks = {}
+
+        # This dictionary contains all the currently active quizzes, by message id
         self.quizzes = {}
+        # Indexes of the active quizzes: channel id -> {message id: quiz}, and name -> quizzes (oldest first)
+        self.channel_quizzes = defaultdict(dict)
+        self.named_quizzes = defaultdict(list)
+        # Channels with an active dynamic quiz, in which other messages are deleted
+        self.dynamic_channels = set()
+        # Messages waiting to be deleted in a batch, by channel id, and the delay before deleting them
+        self.pending_deletions = {}
+        self.delete_delay = 1.0
+        # Updates of dynamic quiz messages for new options, by message id, and the delay before sending them,
+        # so a burst of options is shown with one edit
+        self.option_updates = {}
+        self.option_delay = 0.5
+        # Countdowns of quizzes with a timer: heap of (time of next update, message id, deadline),
+        # handled by a single ticker task
+        self.timers = []
+        self.ticker = None
+        self.ticker_wakeup = None
+        # Feedback charts are rendered in worker processes
+        self.charts = ChartRenderer()
+        # Budget for message edits (timers and live results) per channel:
+        # bursts of five edits, and one edit per second on average
+        self.edit_budget = TokenBucket(rate=1, capacity=5)
+        # Seconds between updates of live results
+        self.live_interval = 5
+        # Vote reactions are removed in the background
+        self.reactions = ReactionRemover()
+        # Option reactions of new quizzes are added in the background, within the same budget
+        self.seeder = ReactionSeeder(self.reactions.budget)
+        # Seconds between receiving a vote reaction and recording the vote
+        self.vote_latencies = deque(maxlen=500)
         self.last_started = ''
         self.load_quizzes()
 
+    def activate_quiz(self, quiz):
+        '''Make a quiz active, and add it to the quiz indexes'''
+        self.quizzes[quiz.message_id] = quiz
+        self.channel_quizzes[quiz.channel_id][quiz.message_id] = quiz
+        self.named_quizzes[quiz.name].append(quiz)
+        if quiz.dynamic:
+            self.dynamic_channels.add(quiz.channel_id)
+
+    def deactivate_quiz(self, quiz):
+        '''Remove a quiz from the active quizzes and the quiz indexes'''
+        self.quizzes.pop(quiz.message_id, None)
+        chanquizzes = self.channel_quizzes.get(quiz.channel_id, {})
+        chanquizzes.pop(quiz.message_id, None)
+        if not chanquizzes:
+            self.channel_quizzes.pop(quiz.channel_id, None)
+        named = self.named_quizzes.get(quiz.name, [])
+        if quiz in named:
+            named.remove(quiz)
+        if not named:
+            self.named_quizzes.pop(quiz.name, None)
+        if quiz.dynamic:
+            self.update_dynamic(quiz.channel_id)
+
+    def update_dynamic(self, chanid):
+        '''Update whether a channel has an active dynamic quiz'''
+        if any(quiz.dynamic for quiz in self.channel_quizzes.get(chanid, {}).values()):
+            self.dynamic_channels.add(chanid)
+        else:
+            self.dynamic_channels.discard(chanid)
+
+    def find_quiz(self, name):
+        '''Return the most recently started active quiz with this name, or None'''
+        named = self.named_quizzes.get(name)
+        return named[-1] if named else None
+
     def get_chanquizzes(self, chanid):
-        ids = list(
-            filter(lambda k: self.quizzes[k].channel_id == chanid, self.quizzes))
-        return [self.quizzes[k] for k in ids]
+        '''Return the active quizzes in a channel, oldest first'''
+        chanquizzes = self.channel_quizzes.get(chanid)
+        return list(chanquizzes.values()) if chanquizzes else []
 
     @commands.Cog.listener()
     async def on_message(self, ctx):
-        # Get quizzes for this channel
-        quizzes = self.get_chanquizzes(ctx.channel.id)
-
-        # If the message is from the bot itself or there are no dynamic quizzes, don't execute this function
-        if not quizzes or ctx.author.id == self.bot.user.id or not quizzes[0].dynamic:
+        # This runs for every message the bot can see: return right away when there is no dynamic quiz in the
+        # channel, or if the message is from the bot itself
+        if ctx.channel.id not in self.dynamic_channels or ctx.author.id == self.bot.user.id:
             return
 
-        # If it wasn't a command, the message should still be deleted
-        try:
-            await ctx.delete()
-        except:
+        # Commands delete their own message
+        if isinstance(self.bot.command_prefix, str) and ctx.content.startswith(self.bot.command_prefix):
             return
 
+        # If it wasn't a command, the message should still be deleted, together with other recent messages
+        self.queue_deletion(ctx)
+
+    def queue_deletion(self, message):
+        '''Delete a message in a dynamic quiz channel, together with the other messages of the next moment'''
+        pending = self.pending_deletions.get(message.channel.id)
+        if pending is None:
+            pending = self.pending_deletions[message.channel.id] = []
+            self.bot.loop.create_task(self.delete_pending(message.channel))
+        pending.append(message)
+
+    async def delete_pending(self, channel):
+        '''Delete the messages that were sent in a dynamic quiz channel in the last moment, in bulk'''
+        await asyncio.sleep(self.delete_delay)
+        messages = self.pending_deletions.pop(channel.id, [])
+        # At most 100 messages can be deleted at once
+        for start in range(0, len(messages), 100):
+            try:
+                await channel.delete_messages(messages[start:start + 100])
+            except discord.HTTPException:
+                pass
+
     def cog_unload(self):
         '''Function to handle unloading of the Poll Cog'''
 
         # Save all active quizzes before shutdown
         print('Unloading Poll Cog')
         self.save_quizzes()
+        self.votelog.close()
+        self.charts.shutdown()
+        self.reactions.shutdown()
+        self.seeder.shutdown()
+        if self.ticker is not None:
+            self.ticker.cancel()
+        if self.compactor is not None:
+            self.compactor.cancel()
         return super().cog_unload()
 
-    def save_quizzes(self):
-        '''Function to save a pickle object containing all the currently active quizzes'''
-
+    def snapshot(self):
+        '''Return a snapshot of all the currently active quizzes, as JSON'''
         save_dict = {message_id: self.quizzes[message_id].create_save_data() for message_id in self.quizzes}
         save_dict["last_started"] = self.last_started
+        return json.dumps(save_dict)
 
-        with open(self.save_filepath, 'w') as file:
-            json.dump(save_dict, file, indent=4)
+    def write_snapshot(self, snapshot):
+        '''Store a snapshot, replacing the previous one only once the new one is complete'''
+        tmp_filepath = self.save_filepath.with_suffix(".tmp")
+        with open(tmp_filepath, 'w') as file:
+            file.write(snapshot)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filepath, self.save_filepath)
+
+    def save_quizzes(self):
+        '''Save a snapshot of all the currently active quizzes, which replaces the vote log.
+        This blocks until the snapshot is stored: it is only used while loading and unloading the cog.'''
+        self.write_snapshot(self.snapshot())
+
+        # All logged votes are part of the snapshot now
+        self.votelog.truncate()
+        self.compacted = time.monotonic()
+
+    async def store_quizzes(self):
+        '''Save a snapshot of all the currently active quizzes without blocking the event loop.
+        Only the logged votes that are part of the snapshot are removed from the vote log.'''
+        async with self.save_lock:
+            snapshot = self.snapshot()
+            mark = self.votelog.mark()
+            await self.bot.loop.run_in_executor(None, self.write_snapshot, snapshot)
+            await self.votelog.discard(*mark)
+            self.compacted = time.monotonic()
+
+    async def compact(self):
+        '''Fold the vote log into a new snapshot every compact_interval seconds, while votes are being logged'''
+        while self.votelog.records:
+            await asyncio.sleep(self.compacted + self.compact_interval - time.monotonic())
+            if self.votelog.records:
+                await self.store_quizzes()
+
+    def cast_vote(self, quiz, voter_id, emoji):
+        '''Cast a vote in a quiz, and add it to the vote log'''
+        option = quiz.vote(voter_id, emoji)
+        if option is None:
+            return
+        self.votelog.append(quiz.message_id, voter_id, option)
+        if self.compactor is None or self.compactor.done():
+            self.compactor = asyncio.ensure_future(self.compact())
 
     @commands.command("savequiz",aliases=("save-quiz","save_quiz","savequizzes","save-quizzes","save_quizzes"))
     @commands.has_permissions(administrator=True)
@@ -283,7 +460,7 @@ class Poll(commands.Cog):
         '''Save all currently active quizzes to disk.'''
         await ctx.message.delete()
 
-        self.save_quizzes()
+        await self.store_quizzes()
         await ctx.channel.send(f"<@{ctx.author.id}> Currently active quizzes saved!",
                                delete_after=20)
 
@@ -300,8 +477,24 @@ class Poll(commands.Cog):
         self.last_started = json_data.get("last_started", None)
         json_data.pop("last_started", None)
 
-        self.quizzes = {int(message_id): Quiz(None,None).load_from_save_data(json_data[message_id])
-                        for message_id in json_data}
+        self.quizzes = {}
+        self.channel_quizzes.clear()
+        self.named_quizzes.clear()
+        for message_id in json_data:
+            quiz = Quiz(None,None).load_from_save_data(json_data[message_id])
+            self.activate_quiz(quiz)
+            # Resume the timer of the quiz
+            if quiz.deadline is not None:
+                self.start_timer(quiz)
+
+        # Replay the votes that were cast after the snapshot was made, and fold them into a new snapshot
+        votes = self.votelog.replay()
+        for message_id, voter_id, option, at in votes.tolist():
+            quiz = self.quizzes.get(message_id)
+            if quiz is not None and 1 <= option <= len(quiz.options):
+                quiz.vote(voter_id, quiz.emoji_options[option - 1], at)
+        if len(votes):
+            self.save_quizzes()
 
         print(f"Quiz system loaded with following parameters:\n"
               f"- Active quizzes: {len(self.quizzes)}\n"
@@ -316,10 +509,21 @@ class Poll(commands.Cog):
             f"""
             ** Currently active quizzes: ** {len(self.quizzes)}
             ** Last started quiz: **        {self.last_started}
+            ** Chart rendering: **          {self.charts.stats()}
+            ** Vote recording: **           {self.vote_stats()}
+            ** Reaction removal: **         {self.reactions.stats()}
+            ** Reaction seeding: **         {self.seeder.stats()}
             """
         embed = discord.Embed(title="Quiz system status", description=status, colour=0x25a52b)
         await ctx.message.channel.send(embed=embed, delete_after=20)
 
+    def vote_stats(self):
+        '''Return a summary of the time it takes to record a vote'''
+        if not self.vote_latencies:
+            return "no votes recorded yet"
+        latencies = np.array(self.vote_latencies) * 1e6
+        return f"median {np.median(latencies):.0f} \u03bcs, p95 {np.percentile(latencies, 95):.0f} \u03bcs"
+
 
     @commands.command("startquiz", aliases=("start-quiz","start_quiz","quiz","beginquiz","begin-quiz",
                                             "begin_quiz","launchquiz","launch_quiz","launch-quiz"))
@@ -331,7 +535,8 @@ class Poll(commands.Cog):
         Discord command to start a quiz.
 
         Arguments:
-        - fname: The JSON file containing the quiz
+        - fname: The JSON file containing the quiz, or a question from a question bank:
+          bank:number, bank:random or bank:random:tag
         - timeout: Timeout in seconds for each question (optional)
         '''
 
@@ -343,31 +548,73 @@ class Poll(commands.Cog):
         # Delete the message containing the command
         await ctx.message.delete()
 
+        # Load a question from a question bank
+        if ":" in fname:
+            try:
+                new_quiz = self.bank_question(fname, quiz_creator)
+            except QuizFormatError as err:
+                await ctx.channel.send(f"<@{ctx.author.id}> Can't start {fname}: {err}", delete_after=20)
+                return
+            await self.launch_quiz(quiz_channel, new_quiz, timeout)
+            return
+
         # Add a .json extension if it is not present
         fname += ".json" if ".json" not in fname else ""
 
-        quiz_filepath = self.datadir.joinpath(fname)
+        quiz_file = self.catalog.get(fname)
 
         # Check if the filename specified actually exists
-        if not quiz_filepath.exists():
+        if quiz_file is None:
             await ctx.channel.send(
                 f"<@{ctx.author.id}> The filename provided does not seem to exist, please check spelling and try again.",
                 delete_after=20
             )
             return
 
-        # Create the new quiz
-        was_succesful, new_quiz = Quiz(quiz_filepath, quiz_creator).load_data()
-
-        # Abort if the data reading has failed. If the bot has been properly configured, this means that the json
-        # formatting is wrong.
-        if not was_succesful:
+        # Abort if the quiz file is not valid
+        if quiz_file.error:
             await ctx.channel.send(
-                f"<@{ctx.author.id}> The json quiz file has been improperly formatted!",
+                f"<@{ctx.author.id}> The json quiz file has been improperly formatted: {quiz_file.error}",
                 delete_after=20
             )
             return
 
+        # Create the new quiz
+        new_quiz = Quiz(quiz_file.path, quiz_creator).load_definition(quiz_file.definition)
+        await self.launch_quiz(quiz_channel, new_quiz, timeout)
+
+    def get_bank(self, name, create=False):
+        '''Return the question bank with this name, or None if it does not exist (and create is False)'''
+        bank = self.banks.get(name)
+        if bank is None:
+            path = self.banksdir.joinpath(f"{check_bank_name(name)}.jsonl")
+            if not create and not path.exists():
+                return None
+            bank = self.banks[name] = QuestionBank(path)
+        return bank
+
+    def bank_question(self, reference, owner):
+        '''Create a quiz from a bank question (bank:number, bank:random or bank:random:tag).
+        Raises a QuizFormatError that describes the problem if this is not possible.'''
+        name, number, tag = parse_reference(reference)
+        bank = self.get_bank(name)
+        if bank is None:
+            raise QuizFormatError(f"there is no question bank named {name}")
+        try:
+            if number is None:
+                number = bank.draw(tag)
+            definition = bank.get(number)
+        except KeyError:
+            if tag:
+                raise QuizFormatError(f"bank {name} has no questions tagged {tag}")
+            if number is None:
+                raise QuizFormatError(f"bank {name} has no questions")
+            raise QuizFormatError(f"bank {name} has questions 1 to {len(bank)}, not {number}")
+        return Quiz(bank.path, owner).load_definition(definition)
+
+    async def launch_quiz(self, quiz_channel, new_quiz, timeout=None):
+        '''Post the message of a new quiz, and make the quiz active'''
+        started = time.perf_counter()
         if timeout != None:
             timeout = int(timeout)
             new_quiz.timer = timeout if timeout not in (-1,0) else None
@@ -382,17 +629,26 @@ class Poll(commands.Cog):
         new_quiz.message_id = new_message.id
         new_quiz.channel_id = new_message.channel.id
 
-        # Add the quiz to the internal dict
-        self.quizzes[new_quiz.message_id] = new_quiz
+        # Add the quiz to the internal dict, voting opens now
+        new_quiz.started = time.monotonic()
+        self.activate_quiz(new_quiz)
         self.last_started = new_quiz.name
 
-        # Add the appropriate reactions
-        for em in emojis:
-            await new_message.add_reaction(em)
-
         # If the quiz has a timer, activate it
         if new_quiz.timer:
-            self.bot.loop.create_task(self.quiz_timer(new_quiz.timer,new_message))
+            self.start_timer(new_quiz, new_quiz.timer)
+
+        # The quiz is open for votes now. Add the option reactions in the background,
+        # votes on options that have no reaction yet are counted as well
+        seeding = self.seeder.seed(new_message, emojis, started)
+        seeding.add_done_callback(lambda task: self.seeded(new_quiz, task))
+        await self.store_quizzes()
+
+    @staticmethod
+    def seeded(quiz, seeding):
+        '''Record the time until a quiz was fully votable, once its reactions are added'''
+        if not seeding.cancelled() and seeding.exception() is None:
+            quiz.votable_after = seeding.result()
 
     @commands.command("dynamic", aliases=("makedynamic", "make_dynamic", "make-dynamic", "dynamicquiz", "dynamic-quiz",
                                           "dynamic_quiz"))
@@ -404,9 +660,11 @@ class Poll(commands.Cog):
         Turns the last activated quiz into a dynamic quiz.
         """
         quizzes = self.get_chanquizzes(ctx.channel.id)
-        # Turn on dynamic quiz mode: Assume there's only one active quiz in this channel
+        # Turn on dynamic quiz mode for the most recently started quiz in this channel
         if quizzes:
-            quizzes[0].dynamic = True
+            quizzes[-1].dynamic = True
+            self.update_dynamic(ctx.channel.id)
+            await self.store_quizzes()
         await ctx.message.delete()
 
     @commands.command("allow-multiple", aliases=("allowmult","allow_mult", "allow_multiple"))
@@ -419,10 +677,10 @@ class Poll(commands.Cog):
         '''
         await ctx.message.delete()
 
-        if self.last_started:
-            last_quiz = self.quizzes[list(
-                filter(lambda k: self.quizzes[k].name == self.last_started, self.quizzes))[0]]
+        last_quiz = self.find_quiz(self.last_started)
+        if last_quiz is not None:
             last_quiz.singlevote = False
+            await self.store_quizzes()
 
             # Now generate a new quiz embed and react with the appropriate new reaction
             title, description, emojis = last_quiz.generate_quiz_message()
@@ -440,41 +698,55 @@ class Poll(commands.Cog):
         Arguments:
             - Option you want to add
         """
-        await ctx.message.delete()
-        quizzes = self.get_chanquizzes(ctx.channel.id)
-
-        # If there's no dynamic quiz active, don't continue
-        if not quizzes or not quizzes[0].dynamic:
-            return
+        # Delete the command together with the other messages of a burst of submissions
+        self.queue_deletion(ctx.message)
+        # Select the most recently started dynamic quiz in this channel
+        dynamic = [quiz for quiz in self.get_chanquizzes(ctx.channel.id) if quiz.dynamic]
 
-        # Parse the new option, and select the dynamic quiz to add it to
+        # If there's no dynamic quiz active, or no option given, don't continue
         addition = " ".join(args)
-        dyn_quiz = quizzes[0]
-
-        # That option is already in the quiz or the max amount of options has been reached
-        if len(dyn_quiz.options) == len(dyn_quiz.emoji_options):
+        if not dynamic or not normalize_option(addition):
             return
-        options = [option.lower() for option in dyn_quiz.options.values()]
-        if addition.lower() in options:
-            vote_index = options.index(addition.lower())
-            dyn_quiz.vote(ctx.author.id, dyn_quiz.emoji_options[vote_index])
+        dyn_quiz = dynamic[-1]
+
+        # Vote for the option if it is already in the quiz, otherwise add it if the max amount of options
+        # hasn't been reached
+        option = dyn_quiz.find_option(addition)
+        if option is None:
+            option = dyn_quiz.add_option(addition)
+            if option is None:
+                return
+            self.queue_option_update(dyn_quiz, ctx.channel, option)
+        self.cast_vote(dyn_quiz, ctx.author.id, dyn_quiz.emoji_options[option - 1])
+
+    def queue_option_update(self, quiz, channel, option):
+        '''Show a new option of a dynamic quiz, together with the other options of the next moment'''
+        if quiz.message_id not in self.option_updates:
+            self.option_updates[quiz.message_id] = asyncio.ensure_future(
+                self.update_options(quiz, channel, option))
+
+    async def update_options(self, quiz, channel, first):
+        '''Show the options from option first onwards in the quiz message, add their reactions and save the quiz'''
+        await asyncio.sleep(self.option_delay)
+        # Options that are added from here on are shown by the next update
+        self.option_updates.pop(quiz.message_id, None)
+        if quiz.message_id not in self.quizzes:
             return
 
-        current_option_length = len(dyn_quiz.options)
-        dyn_quiz.options[current_option_length + 1] = addition
-        dyn_quiz.votes[current_option_length + 1] = set()
-
-        dyn_quiz.vote(ctx.author.id, dyn_quiz.emoji_options[current_option_length])
-
-        # Now generate a new quiz embed and react with the appropriate new reaction
-        title, description, emojis = dyn_quiz.generate_quiz_message()
-        original_message = await ctx.message.channel.fetch_message(dyn_quiz.message_id)
-        original_embed = original_message.embeds[0].to_dict()
-        original_embed["description"] = description
-        await original_message.edit(embed=discord.Embed().from_dict(original_embed))
-        await original_message.add_reaction(emojis[-1])
-
-
+        title, description, emojis = quiz.generate_quiz_message()
+        embed = discord.Embed(title=title, description=description, colour=0x3939cf)
+        # Keep showing the countdown of a quiz with a timer
+        if quiz.deadline is not None:
+            embed.set_footer(text=self.time_left(quiz.deadline - time.monotonic()))
+        message = channel.get_partial_message(quiz.message_id)
+        # The reactions of the new options are added in the background, like those of a new quiz. They are added
+        # even when the edit fails, as later updates only add the reactions of their own options
+        self.seeder.seed(message, emojis[first - 1:])
+        try:
+            await message.edit(embed=embed)
+        except discord.HTTPException:
+            pass
+        await self.store_quizzes()
 
     @commands.command("finishquiz", aliases=("finish-quiz", "finish_quiz", "endquiz","end_quiz","end-quiz"))
     @commands.has_permissions(administrator=True)
@@ -501,16 +773,15 @@ class Poll(commands.Cog):
             if not args:
                 self.last_started = None
 
-            try:
-                quiz_to_finish = self.quizzes[list(filter(lambda k: self.quizzes[k].name == quiz_name, self.quizzes))[0]]
-            except Exception:
+            quiz_to_finish = self.find_quiz(quiz_name)
+            if quiz_to_finish is None:
                 await ctx.channel.send(
                     f"<@{ctx.author.id}> That quiz does not exist, please check the spelling of the name you provided!",
                     delete_after=20
                 )
                 return
 
-        # The function was called internally by quiz_timer
+        # The function was called internally by the quiz ticker
         else:
             # Check if the quiz has been ended in the meantime
             if not ctx in self.quizzes:
@@ -519,38 +790,231 @@ class Poll(commands.Cog):
             author_id = quiz_to_finish.owner
             message_channel = self.bot.get_channel(quiz_to_finish.channel_id)
 
-        feedback_chart = quiz_to_finish.create_histogram()
+        # Without its channel the quiz message can't be updated: keep the quiz, the ticker tries again later
+        channel = self.bot.get_channel(quiz_to_finish.channel_id)
+        if channel is None:
+            if message_channel is not None:
+                await message_channel.send(f"<@{author_id}> The channel of {quiz_to_finish.name} is not available, "
+                                           f"please try to finish the quiz again later.", delete_after=20)
+            return
+
+        try:
+            feedback_chart = await self.render_chart(quiz_to_finish)
+        except asyncio.TimeoutError:
+            await message_channel.send(f"<@{author_id}> Rendering the results of {quiz_to_finish.name} took too long, "
+                                       f"please try to finish the quiz again.", delete_after=20)
+            return
 
-        # Get the original quiz message
-        message = await message_channel.fetch_message(quiz_to_finish.message_id)
+        # Stop adding option reactions, if that is still going on
+        self.seeder.cancel(quiz_to_finish.message_id)
 
-        # Clear the reactions and set the embed colour to green
-        await message.clear_reactions()
-        altered_embed = message.embeds[0].to_dict()
-        altered_embed["color"] = 0x25a52b # Green
-        # altered_embed.pop("footer")
-        altered_embed = discord.Embed.from_dict(altered_embed)
-        await message.edit(embed=altered_embed)
+        # Clear the reactions and set the embed colour to green, without fetching the quiz message
+        message = channel.get_partial_message(quiz_to_finish.message_id)
+        title, description, _ = quiz_to_finish.generate_quiz_message()
+        finished_embed = discord.Embed(title=title, description=description, colour=0x25a52b) # Green
 
         # Get the recipients of the feedback chart
-        channel = self.bot.get_channel(quiz_to_finish.channel_id)
         owner = self.bot.get_user(quiz_to_finish.owner)
         author = self.bot.get_user(author_id)
 
-        # Send the feedback chart to the recipients
-        for recipient in {channel, owner, author}:
-            # Reset the buffer internal index to 0 again
-            feedback_chart.seek(0)
+        # Update the quiz message and send the feedback chart to the recipients, all at the same time
+        results = await asyncio.gather(
+            message.clear_reactions(),
+            message.edit(embed=finished_embed),
+            self.send_chart((channel, owner, author), feedback_chart, quiz_to_finish.chart_filename(),
+                            f"Feedback for {quiz_to_finish.name}", 0x25a52b, self.timing_report(quiz_to_finish)),
+            return_exceptions=True
+        )
+        for result in results:
+            # A deleted quiz message doesn't stop the quiz from finishing
+            if isinstance(result, Exception) and not isinstance(result, discord.HTTPException):
+                raise result
+
+        # Archive the votes, and remove the quiz from the internal dictionary and its charts from the cache
+        await self.archive_quiz(quiz_to_finish)
+        await self.grade_quiz(quiz_to_finish, channel)
+        self.deactivate_quiz(quiz_to_finish)
+        self.charts.cache.discard(quiz_to_finish.message_id)
+        # Only now the quiz is finished, its timer can stop
+        quiz_to_finish.deadline = None
+        await self.store_quizzes()
+
+    async def archive_quiz(self, quiz):
+        '''Store the details and timed votes of a finished quiz in the archive, in a worker thread'''
+        finished_at = time.time()
+        started_at = finished_at - (time.monotonic() - quiz.started)
+        voters, options, times = quiz.timeline.columns()
+        meta = dict(quiz=quiz.message_id, name=quiz.name, question=quiz.question,
+                    options=list(quiz.options.values()), correct=quiz.correct_answer, singlevote=quiz.singlevote,
+                    channel=quiz.channel_id, owner=quiz.owner, started_at=started_at, finished_at=finished_at,
+                    tally=quiz.tally())
+        return await self.bot.loop.run_in_executor(None, self.archive.add, meta, voters, options,
+                                                   started_at + times.astype(np.float64))
+
+    def get_gradebook(self, guild_id):
+        '''Return the gradebook of the course in a guild'''
+        gradebook = self.gradebooks.get(guild_id)
+        if gradebook is None:
+            path = self.datadir.joinpath("gradebooks", f"{guild_id}.npz")
+            gradebook = self.gradebooks[guild_id] = Gradebook(path)
+        return gradebook
+
+    async def grade_quiz(self, quiz, channel):
+        '''Add the results of a finished quiz with a correct answer to the gradebook of its course,
+        which is saved in a worker thread'''
+        if not quiz.correct_answer or channel is None or channel.guild is None:
+            return
+        matrix = quiz.engine.selection_matrix()
+        selections = matrix.selections(len(quiz.options))
+        # Voters answered correctly when they selected the correct option and nothing else
+        correct = (selections[:, quiz.correct_answer - 1] == 1) & (selections.sum(axis=1) == 1)
+        gradebook = self.get_gradebook(channel.guild.id)
+        gradebook.add(quiz.message_id, quiz.name, matrix.voters[:len(matrix)], correct)
+        await self.bot.loop.run_in_executor(None, gradebook.save)
+
+    @staticmethod
+    def csv_file(filename, header, rows):
+        '''Return a Discord file of a CSV table'''
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return discord.File(io.BytesIO(text.getvalue().encode()), filename=filename)
+
+    @commands.command("studentstats", aliases=("student-stats", "student_stats"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def student_stats(self, ctx, student: discord.Member = None):
+        '''
+        Send the accuracy of the students of this course over all finished quizzes with a correct answer to the caller.
+
+        Arguments:
+            - student (optional, a table of all students is sent if not provided)
+        '''
+        await ctx.message.delete()
+        gradebook = self.get_gradebook(ctx.guild.id)
+        answered, correct = gradebook.counts(axis=1)
+        accuracy = gradebook.accuracy()
+        if student is not None:
+            row = gradebook.rows.get(student.id)
+            if row is None or not answered[row]:
+                await ctx.author.send(f"{student.display_name} has not answered any graded quizzes yet.")
+                return
+            await ctx.author.send(f"{student.display_name} answered {correct[row]} of {answered[row]} graded "
+                                  f"quizzes correctly ({accuracy[row] * 100:.0f}%).")
+            return
+
+        active = answered > 0
+        if not active.any():
+            await ctx.author.send("Nobody has answered a graded quiz yet.")
+            return
+        rows = []
+        for student_id, nanswered, ncorrect, fraction in zip(gradebook.students[:gradebook.nstudents].tolist(),
+                                                            answered.tolist(), correct.tolist(), accuracy.tolist()):
+            member = ctx.guild.get_member(student_id)
+            rows.append((student_id, member.display_name if member else "", nanswered, ncorrect,
+                         f"{fraction:.3f}" if nanswered else ""))
+        await ctx.author.send(
+            f"{np.count_nonzero(active)} students answered {gradebook.nquizzes} graded quizzes, "
+            f"median accuracy {np.median(accuracy[active]) * 100:.0f}%.",
+            file=self.csv_file("student_accuracy.csv", ("student", "name", "answered", "correct", "accuracy"), rows)
+        )
+
+    @commands.command("quizstats", aliases=("quiz-stats", "quiz_stats"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def quiz_stats(self, ctx):
+        '''
+        Send the difficulty (fraction of correct answers) and discrimination index (fraction correct among the
+        best 27% of the students minus that among the weakest 27%) of the finished quizzes of this course to the caller.
+        '''
+        await ctx.message.delete()
+        gradebook = self.get_gradebook(ctx.guild.id)
+        if not gradebook.nquizzes:
+            await ctx.author.send("No graded quizzes have finished yet.")
+            return
+        answered, correct = gradebook.counts(axis=0)
+        difficulty = gradebook.difficulty()
+        discrimination = gradebook.discrimination()
+        rows = [
+            (quiz_id, name, nanswered, ncorrect,
+             "" if np.isnan(p) else f"{p:.3f}", "" if np.isnan(d) else f"{d:.3f}")
+            for quiz_id, name, nanswered, ncorrect, p, d in zip(
+                gradebook.quizzes[:gradebook.nquizzes].tolist(), gradebook.names[:gradebook.nquizzes].tolist(),
+                answered.tolist(), correct.tolist(), difficulty.tolist(), discrimination.tolist())
+        ]
+        hardest = np.nanargmin(difficulty) if not np.isnan(difficulty).all() else None
+        summary = f"{gradebook.nquizzes} graded quizzes"
+        if hardest is not None:
+            summary += (f", the most difficult was {gradebook.names[hardest]} "
+                        f"({difficulty[hardest] * 100:.0f}% correct)")
+        await ctx.author.send(
+            summary + ".",
+            file=self.csv_file("quiz_difficulty.csv",
+                               ("quiz", "name", "answered", "correct", "difficulty", "discrimination"), rows)
+        )
 
-            # Create the file object and embed again to avoid errors
-            file_object = discord.File(feedback_chart, filename=feedback_chart.name)
-            embed = discord.Embed(title=f"Feedback for {quiz_to_finish.name}", colour=0x25a52b)
-            embed.set_image(url=f"attachment://{feedback_chart.name}")
+    @commands.command("exportquizzes", aliases=("export-quizzes", "export_quizzes"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def export_quizzes(self, ctx, start: str = None, end: str = None):
+        '''
+        Send yourself the votes of the quizzes that finished in a date range, as a compressed NumPy .npz file.
+        It has the columns quiz, voter, option and time (Unix time of the vote), and the quiz details in quizzes.json.
 
-            await recipient.send(embed=embed,file=file_object)
+        Arguments:
+            - first day [YYYY-MM-DD] (optional, all archived quizzes if not provided)
+            - last day [YYYY-MM-DD] (optional, up to today if not provided)
+        '''
+        await ctx.message.delete()
+        try:
+            first = date.fromisoformat(start) if start else None
+            last = date.fromisoformat(end) if end else None
+        except ValueError:
+            await ctx.channel.send(f"<@{ctx.author.id}> Please give the days as YYYY-MM-DD", delete_after=20)
+            return
 
-        # Remove the quiz from the internal dictionary
-        self.quizzes.pop(quiz_to_finish.message_id)
+        # The export is written in a worker thread, to a temporary file that only stays in memory while it is small
+        with tempfile.SpooledTemporaryFile(max_size=1 << 20) as file:
+            nquizzes, nvotes = await self.bot.loop.run_in_executor(None, self.archive.export, file, first, last)
+            if file.tell() > ctx.guild.filesize_limit:
+                await ctx.channel.send(f"<@{ctx.author.id}> The export of {nquizzes} quizzes is too large to send, "
+                                       f"please choose a shorter period.", delete_after=20)
+                return
+            # discord.File only takes io.IOBase objects, which a spooled file is not before Python 3.11
+            file.seek(0)
+            data = io.BytesIO(file.read())
+        filename = f"quizzes_{first or 'start'}_{last or date.today()}.npz"
+        try:
+            await ctx.author.send(f"Votes of {nquizzes} quizzes ({nvotes} votes)",
+                                  file=discord.File(data, filename=filename))
+        except discord.Forbidden:
+            await ctx.channel.send(f"<@{ctx.author.id}> I can't send you the export, "
+                                   f"please allow direct messages from members of this server.", delete_after=20)
+
+    async def render_chart(self, quiz):
+        '''Render the feedback chart of a quiz without blocking the event loop.
+        Returns the PNG image as bytes, which can be shared by all messages that show it.'''
+        return await self.charts.render(quiz.tally(), quiz.correct_answer, quiz=quiz.message_id,
+                                        labels=quiz.options.values())
+
+    @staticmethod
+    async def send_chart(recipients, png, filename, title, colour, description=discord.Embed.Empty, **kwargs):
+        '''Send a chart to channels and users concurrently. Each recipient gets the chart once,
+        also when it is listed more than once. Sending fails for recipients that don't accept messages,
+        without affecting the others.'''
+        unique = {recipient.id: recipient for recipient in recipients if recipient is not None}
+
+        async def send(recipient):
+            # Each message needs its own file object, but these all share the bytes of the image
+            embed = discord.Embed(title=title, description=description, colour=colour)
+            embed.set_image(url=f"attachment://{filename}")
+            await recipient.send(embed=embed, file=discord.File(io.BytesIO(png), filename=filename), **kwargs)
+
+        results = await asyncio.gather(*map(send, unique.values()), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, discord.HTTPException):
+                raise result
 
     @commands.command("intermediate_results", aliases=("intermediateresults", "intermediate-results", "intermediate"))
     @commands.has_permissions(administrator=True)
@@ -573,10 +1037,8 @@ class Poll(commands.Cog):
 
         await ctx.message.delete()
 
-        try:
-            quiz = self.quizzes[list(filter(lambda k: self.quizzes[k].name == quiz_name, self.quizzes))[0]]
-
-        except Exception:
+        quiz = self.find_quiz(quiz_name)
+        if quiz is None:
             await ctx.channel.send(
                 f"<@{ctx.author.id}> That quiz does not exist, please check the spelling of the name you provided!",
                 delete_after=20
@@ -584,39 +1046,165 @@ class Poll(commands.Cog):
             return
 
         # Get the current feedback chart
-        quiz_chart = quiz.create_histogram()
+        try:
+            quiz_chart = await self.render_chart(quiz)
+        except asyncio.TimeoutError:
+            await ctx.channel.send(f"<@{ctx.author.id}> Rendering the results took too long, please try again.",
+                                   delete_after=20)
+            return
 
         recipients = [self.bot.get_channel(quiz.channel_id)] * public + [ctx.message.author]
+        await self.send_chart(recipients, quiz_chart, quiz.chart_filename(),
+                              f"Intermediate feedback for {quiz.name}", 0x3939cf, delete_after=50)
 
-        for recipient in recipients:
-            # Reset the bytesIO index to 0
-            quiz_chart.seek(0)
 
-            # Create the embed
-            file_object = discord.File(quiz_chart, filename=quiz_chart.name)
-            embed = discord.Embed(title=f"Intermediate feedback for {quiz.name}", colour=0x3939cf)
-            embed.set_image(url=f"attachment://{quiz_chart.name}")
-
-            await recipient.send(embed=embed, file=file_object, delete_after=50)
+    @commands.command("liveresults", aliases=("live-results", "live_results", "live"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def live_results(self, ctx, *args):
+        '''
+        Show the results of a quiz in a message that is updated while the quiz runs.
+        Arguments:
+            - quiz name (optional, last started quiz will be used if not provided)
+        '''
+        await ctx.message.delete()
+        quiz_name = " ".join(args) if args else self.last_started
+        quiz = self.find_quiz(quiz_name)
+        if quiz is None:
+            await ctx.channel.send(
+                f"<@{ctx.author.id}> That quiz does not exist, please check the spelling of the name you provided!",
+                delete_after=20
+            )
+            return
+        if quiz.live_message_id is not None:
+            return
 
+        channel = self.bot.get_channel(quiz.channel_id)
+        message = await channel.send(embed=self.live_embed(quiz))
+        quiz.live_message_id = message.id
+        self.bot.loop.create_task(self.live_updater(quiz, channel))
+
+    def live_embed(self, quiz):
+        '''Create the embed that shows the live results of a quiz'''
+        labels = quiz.emoji_options[:len(quiz.options)]
+        return discord.Embed(title=f"Live results for {quiz.name}",
+                             description=text_histogram(quiz.tally(), labels), colour=0x3939cf)
+
+    async def live_updater(self, quiz, channel):
+        '''Update the live results of a quiz when its votes change, until the quiz is finished'''
+        message = channel.get_partial_message(quiz.live_message_id)
+        shown = quiz.tally()
+        try:
+            while quiz.message_id in self.quizzes:
+                await asyncio.sleep(self.live_interval)
+                tally = quiz.tally()
+                # Only edit when votes have changed, and the edit budget of this channel allows it
+                if tally == shown or quiz.message_id not in self.quizzes or \
+                        not self.edit_budget.consume(quiz.channel_id):
+                    continue
+                try:
+                    await message.edit(embed=self.live_embed(quiz))
+                except discord.NotFound:
+                    # The live results message was deleted
+                    break
+                except discord.HTTPException:
+                    continue
+                shown = tally
+        finally:
+            quiz.live_message_id = None
+
+    @commands.command("quizcombos", aliases=("quiz-combos", "quiz_combos", "combinations"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def quiz_combinations(self, ctx, *args):
+        '''
+        Send the answer combinations of a (multiple answer) quiz to the caller.
+        Arguments:
+            - quiz name (optional, last started quiz will be used if not provided)
+        '''
+        await ctx.message.delete()
+        quiz_name = " ".join(args) if args else self.last_started
+        quiz = self.find_quiz(quiz_name)
+        if quiz is None:
+            await ctx.channel.send(
+                f"<@{ctx.author.id}> That quiz does not exist, please check the spelling of the name you provided!",
+                delete_after=20
+            )
+            return
+        embed = discord.Embed(title=f"Answer combinations for {quiz.name}",
+                              description=self.combination_report(quiz), colour=0x3939cf)
+        await ctx.author.send(embed=embed)
+
+    @staticmethod
+    def combination_report(quiz, ncombos=10, npairs=5):
+        '''Summarise the most chosen exact answer combinations and option pairs of a quiz'''
+        noptions = len(quiz.options)
+        matrix = quiz.engine.selection_matrix()
+        if not len(matrix):
+            return "Nobody has voted yet."
+        labels = quiz.emoji_options[:noptions]
+
+        lines = ["**Most chosen combinations**"]
+        for options, count in matrix.combinations(noptions, ncombos):
+            combo = " ".join(labels[option - 1] for option in options)
+            lines.append(f"{combo}: {count} ({count / len(matrix) * 100:.0f}%)")
+
+        # Rank the option pairs (upper triangle of the co-selection matrix)
+        cosel = matrix.coselection(noptions)
+        first, second = np.triu_indices(noptions, k=1)
+        counts = cosel[first, second]
+        top = [i for i in np.argsort(-counts, kind="stable")[:npairs] if counts[i]]
+        if top:
+            lines.append("\n**Most chosen together**")
+            lines.extend(f"{labels[first[i]]} + {labels[second[i]]}: {counts[i]}" for i in top)
+        lines.append(f"\nTotal number of voters: {len(matrix)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def timing_report(quiz, nmoments=4):
+        '''Summarise how fast each option was chosen, and how the tallies changed during a quiz'''
+        timeline = quiz.timeline
+        if not len(timeline):
+            return "Nobody has voted yet."
+        noptions = len(quiz.options)
+        labels = quiz.emoji_options[:noptions]
+
+        lines = ["**Response time** (median, 25th to 75th percentile)"]
+        for label, (low, median, high) in zip(labels, timeline.response_times(noptions)):
+            if not np.isnan(median):
+                lines.append(f"{label}: {median:.1f} s ({low:.1f} to {high:.1f} s)")
+        if quiz.correct_answer:
+            correct = timeline.time_to_correct(quiz.correct_answer)
+            if len(correct):
+                lines.append(f"\n**Time to correct answer:** median {np.median(correct):.1f} s, "
+                             f"90% within {np.percentile(correct, 90):.1f} s")
+
+        # Tallies at evenly spaced moments, up to the last vote
+        last = max(timeline.times)
+        moments = np.linspace(last / nmoments, last, nmoments)
+        lines.append("\n**Votes over time**")
+        for moment, tally in zip(moments, timeline.tallies(noptions, moments, quiz.singlevote)):
+            lines.append(f"{moment:.0f} s: " + "  ".join(f"{label} {count}" for label, count in zip(labels, tally)))
+        return "\n".join(lines)
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self,ctx):
 
         '''A Discord event listener that is triggered each time a reaction is added to a message.'''
 
-        message_id = ctx.message_id
-        if not message_id in self.quizzes or ctx.user_id == self.bot.user.id:
+        received = time.perf_counter()
+        quiz = self.quizzes.get(ctx.message_id)
+        if quiz is None or ctx.user_id == self.bot.user.id:
             return
-        # The RawReactionEvent object only contains id's, so these need to be converted to usable
-        # discord Channel, Message and Member objects in order to delete the received reaction
-        reaction_channel = self.bot.get_channel(ctx.channel_id)
-        reaction_message = await reaction_channel.fetch_message(message_id)
-        reaction_member = reaction_channel.guild.get_member(ctx.user_id)
-        await reaction_message.remove_reaction(ctx.emoji, reaction_member)
 
-        # Call the vote command. If an invalid emoji has been used, this will do nothing
-        self.quizzes[message_id].vote(reaction_member.id, str(ctx.emoji))
+        # Call the vote command straight from the ids in the event. If an invalid emoji has been used,
+        # this will do nothing
+        self.cast_vote(quiz, ctx.user_id, str(ctx.emoji))
+        self.vote_latencies.append(time.perf_counter() - received)
+
+        # Remove the reaction in the background, so other students can't see the vote
+        reaction_channel = self.bot.get_channel(ctx.channel_id)
+        await self.reactions.remove(reaction_channel, ctx.message_id, ctx.user_id, ctx.emoji)
 
     @commands.command("makequiz", aliases=("make_quiz","make-quiz","create-quiz","create_quiz","createquiz"))
     @commands.has_permissions(administrator=True)
@@ -645,13 +1233,31 @@ class Poll(commands.Cog):
                 - timer [specified using the following syntax: timer=xx where xx is the value in seconds] (optional)
         '''
 
+        # Tags of questions that are added to a question bank: tags=a,b
+        tag_args = [arg for arg in args if arg.lower().startswith("tags=")]
+        args = tuple(arg for arg in args if arg not in tag_args)
+        tags = [tag.strip() for arg in tag_args for tag in arg[5:].split(",") if tag.strip()]
+
         if len(args) == 0:
             await ctx.channel.send(f"<@{ctx.author.id}> No arguments were given!",
                                    delete_after=20)
             await ctx.message.delete()
             return
 
+        # Instead of a filename, bank:name adds the quiz to a question bank
+        bank_name = args[0][5:] if args[0].lower().startswith("bank:") else None
+
         # If a file has been attached, this means the quiz is attached in a json file format
+        if len(ctx.message.attachments) > 0 and bank_name:
+            await ctx.message.delete()
+            try:
+                quiz = json.loads(await ctx.message.attachments[0].read())
+            except ValueError as err:
+                await ctx.channel.send(f"<@{ctx.author.id}> The attached file is not valid JSON: {err}",
+                                       delete_after=20)
+                return
+            await self.add_to_bank(ctx, bank_name, quiz, tags)
+            return
         if len(ctx.message.attachments) > 0:
             # In this case, the command usage dictates that the argument is the filename that should be used
             # to save the json file.
@@ -659,6 +1265,7 @@ class Poll(commands.Cog):
             file_name += ".json" if ".json" not in file_name else ""
             await ctx.message.attachments[0].save(self.datadir.joinpath(file_name), use_cached=False, seek_begin=True)
             await ctx.message.delete()
+            await self.check_quiz_file(ctx, file_name)
             return
 
         # If not, the json data must be given as an argument
@@ -685,10 +1292,103 @@ class Poll(commands.Cog):
         json_string = f'{{"name": "{quiz_name}", "question": "{question}",' \
                       f' "options": [{options_parsed}]{correct}{timer_value}}}'
 
+        await ctx.message.delete()
+        if bank_name:
+            try:
+                quiz = json.loads(json_string)
+            except ValueError:
+                await ctx.channel.send(f"<@{ctx.author.id}> The quiz could not be read, please check for quotes in "
+                                       f"the question and answers.", delete_after=20)
+                return
+            await self.add_to_bank(ctx, bank_name, quiz, tags)
+            return
+
         with open(self.datadir.joinpath(file_name), 'w') as file:
             file.write(json_string)
 
+        await self.check_quiz_file(ctx, file_name)
+
+    async def add_to_bank(self, ctx, bank_name, quiz, tags):
+        '''Add a quiz definition to a question bank, and tell the author its reference'''
+        try:
+            number = self.get_bank(bank_name, create=True).append(quiz, tags)
+        except QuizFormatError as err:
+            await ctx.channel.send(f"<@{ctx.author.id}> The question can't be added to bank {bank_name}: {err}",
+                                   delete_after=20)
+            return
+        await ctx.channel.send(f"<@{ctx.author.id}> Question added, start it with !startquiz {bank_name}:{number}",
+                               delete_after=20)
+
+    @commands.command("importbank", aliases=("import-bank", "import_bank"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def import_bank(self, ctx, bank_name, *args):
+        '''
+        Add stored quiz json files to a question bank, which is created if needed.
+
+        Arguments:
+            - bank name
+            - quiz filenames
+            - tags for the imported questions [specified as tags=a,b] (optional)
+        '''
+        await ctx.message.delete()
+        tag_args = [arg for arg in args if arg.lower().startswith("tags=")]
+        tags = [tag.strip() for arg in tag_args for tag in arg[5:].split(",") if tag.strip()]
+        try:
+            bank = self.get_bank(bank_name, create=True)
+        except QuizFormatError as err:
+            await ctx.channel.send(f"<@{ctx.author.id}> {err}", delete_after=20)
+            return
+
+        added, problems = [], []
+        for filename in args:
+            if filename in tag_args:
+                continue
+            filename += ".json" if ".json" not in filename else ""
+            quiz_file = self.catalog.get(filename)
+            if quiz_file is None:
+                problems.append(f"{filename}: file does not exist")
+            elif quiz_file.error:
+                problems.append(f"{filename}: {quiz_file.error}")
+            else:
+                added.append(f"{filename} as {bank_name}:{bank.import_file(quiz_file.path, tags)}")
+
+        report = "Added " + ", ".join(added) if added else "No questions added"
+        if problems:
+            report += "\nSkipped:\n- " + "\n- ".join(problems)
+        await ctx.channel.send(f"<@{ctx.author.id}> {report}", delete_after=30)
+
+    @commands.command("exportbank", aliases=("export-bank", "export_bank"))
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def export_bank(self, ctx, bank_name):
+        '''
+        Store every question of a question bank as a quiz json file, in a folder named after the bank.
+
+        Arguments:
+            - bank name
+        '''
         await ctx.message.delete()
+        try:
+            bank = self.get_bank(bank_name)
+        except QuizFormatError:
+            bank = None
+        if bank is None:
+            await ctx.channel.send(f"<@{ctx.author.id}> There is no question bank named {bank_name}!",
+                                   delete_after=20)
+            return
+        paths = bank.export(self.datadir.joinpath(bank_name))
+        self.catalog.refresh(force=True)
+        await ctx.channel.send(f"<@{ctx.author.id}> Exported {len(paths)} questions to {bank_name}/",
+                               delete_after=20)
+
+    async def check_quiz_file(self, ctx, file_name):
+        '''Add a new quiz file to the catalog, and tell the author if it is not a valid quiz'''
+        self.catalog.refresh(force=True)
+        quiz_file = self.catalog.get(file_name)
+        if quiz_file is not None and quiz_file.error:
+            await ctx.channel.send(f"<@{ctx.author.id}> The quiz file {file_name} was saved, but it can't be "
+                                   f"started: {quiz_file.error}", delete_after=20)
 
     @commands.command("directquiz", aliases=("direct-quiz", "direct_quiz"))
     @commands.has_permissions(administrator=True)
@@ -729,31 +1429,11 @@ class Poll(commands.Cog):
         newquiz.name = quiz_name
         newquiz.question = question
         newquiz.options = {i+1: str(option) for i,option in enumerate(options_parsed)}
-        newquiz.votes = {i+1: set() for i in range(len(options_parsed))}
+        newquiz.engine = VoteEngine(len(options_parsed))
         newquiz.correct_answer = correct
         newquiz.timer = timer_value
 
-
-        # Create the message belonging to the quiz and give it a blue coloured embed
-        title, description, emojis = newquiz.generate_quiz_message()
-        embed = discord.Embed(title=title, description=description, colour=0x3939cf)
-        new_message = await quiz_channel.send(embed=embed)
-
-        # Now attach this new message's id to the new quiz
-        newquiz.message_id = new_message.id
-        newquiz.channel_id = new_message.channel.id
-
-        # Add the quiz to the internal dict
-        self.quizzes[newquiz.message_id] = newquiz
-        self.last_started = newquiz.name
-
-        # Add the appropriate reactions
-        for em in emojis:
-            await new_message.add_reaction(em)
-
-        # If the quiz has a timer, activate it
-        if newquiz.timer:
-            self.bot.loop.create_task(self.quiz_timer(newquiz.timer, new_message))
+        await self.launch_quiz(quiz_channel, newquiz)
 
 
 
@@ -768,9 +1448,12 @@ class Poll(commands.Cog):
     async def view_quizzes(self,ctx):
         ''' List all stored json files as well as all active quizzes. '''
 
-        json_files = [path.name for path in list(self.datadir.rglob("*.json"))]
+        json_files = [name + (" (invalid)" if self.catalog.get(name).error else "") for name in self.catalog.names()]
+        banks = [f"{path.stem} ({len(self.get_bank(path.stem))} questions)"
+                 for path in sorted(self.banksdir.glob("*.jsonl"))]
         currently_active = [self.quizzes[message_id].name for message_id in self.quizzes]
         to_send = "Quiz JSON files: \n- "*(len(json_files)>0) + "\n- ".join(json_files) + "\n\n" + \
+            "Question banks: \n- "*(len(banks)>0) + "\n- ".join(banks) + "\n\n"*(len(banks)>0) + \
             "Currently active quizzes: \n- "*(len(currently_active) > 0) + "\n- ".join(currently_active)
 
 
@@ -798,15 +1481,17 @@ class Poll(commands.Cog):
         filename = " ".join(args)
         filename += ".json" if ".json" not in filename else ""
 
-        filepath = self.datadir.joinpath(filename)
-        if not filepath.exists():
+        quiz_file = self.catalog.get(filename)
+        if quiz_file is None:
             await ctx.channel.send(f"<@{ctx.author.id}> That file does not exist!",
                                    delete_after=20)
         else:
             await ctx.channel.send(f"<@{ctx.author.id}> File will be sent via private message.",
                                    delete_after=20)
-            await self.bot.get_user(ctx.author.id).send(f"<@{ctx.author.id}> Here is the file that you requested.",
-                                                        file=discord.File(filepath))
+            problem = f"\nNote: this quiz can't be started: {quiz_file.error}" if quiz_file.error else ""
+            await self.bot.get_user(ctx.author.id).send(f"<@{ctx.author.id}> Here is the file that you requested."
+                                                        f"{problem}", file=discord.File(io.BytesIO(quiz_file.data),
+                                                                                        filename=quiz_file.path.name))
         await ctx.message.delete()
 
     @commands.command("delquiz", aliases=("delete-quiz", "deletequiz", "delete_quiz", "removequiz", "remove-quiz", "remove_quiz"))
@@ -829,25 +1514,82 @@ class Poll(commands.Cog):
                                    delete_after=20)
         else:
             filepath.unlink()
+            self.catalog.refresh(force=True)
             await ctx.channel.send(f"<@{ctx.author.id}> File deleted!",
                                    delete_after=20)
         await ctx.message.delete()
 
 
-    async def quiz_timer(self, timer_duration, message_object):
-
-        '''Function to dynamically update the timer value on a quiz and automatically end it'''
-
-        timer = timer_duration
-        t = lambda x: f"{0 if x//60 < 10 else ''}{x // 60}:{0 if x % 60 < 10 else ''}{x % 60}{0 if x % 60 == 0 else ''}"
-
-
-        while timer > 0:
-            new_timer_value = f"Time left: {t(timer)}"
-            embed = (await message_object.channel.fetch_message(message_object.id)).embeds[0]
-            embed.set_footer(text=new_timer_value)
-            await message_object.edit(embed=embed)
-            await asyncio.sleep(1)
-            timer -= 1
-
-        await self.finish_quiz(message_object.id)
+    # Seconds between countdown updates, by the time left: coarse while far from the end, finer near it
+    timer_cadence = ((10, 1), (60, 5), (300, 15), (math.inf, 60))
+    # Seconds until finishing a quiz is tried again, when it failed at its deadline
+    finish_retry = 60
+
+    def start_timer(self, quiz, seconds=None):
+        '''Start (or resume) the countdown of a quiz, which is finished when its time is up'''
+        if seconds is not None:
+            quiz.deadline = time.monotonic() + seconds
+        # Show the time left right away
+        heapq.heappush(self.timers, (time.monotonic(), quiz.message_id, quiz.deadline))
+        if self.ticker is None or self.ticker.done():
+            self.ticker = self.bot.loop.create_task(self.tick())
+        elif self.ticker_wakeup is not None:
+            self.ticker_wakeup.set()
+
+    async def tick(self):
+        '''Update the countdowns of all quizzes with a timer, and finish each quiz at its deadline'''
+        self.ticker_wakeup = asyncio.Event()
+        # Timers resumed at startup can only update their quizzes once the channels are known
+        await self.bot.wait_until_ready()
+        while self.timers:
+            when, message_id, deadline = self.timers[0]
+            delay = when - time.monotonic()
+            if delay > 0:
+                # Sleep until the next update, or until a timer is started
+                self.ticker_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.ticker_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.timers)
+
+            # Skip quizzes that have been finished in the meantime
+            quiz = self.quizzes.get(message_id)
+            if quiz is None or quiz.deadline != deadline:
+                continue
+
+            left = deadline - time.monotonic()
+            if left <= 0:
+                # The deadline is cleared when the quiz is finished, until then it is retried
+                heapq.heappush(self.timers, (time.monotonic() + self.finish_retry, message_id, deadline))
+                self.bot.loop.create_task(self.finish_quiz(message_id))
+                continue
+            self.bot.loop.create_task(self.show_time_left(quiz, left))
+
+            # Update again when the time left reaches the next multiple of the update interval
+            interval = next(interval for limit, interval in self.timer_cadence if left <= limit)
+            heapq.heappush(self.timers, (deadline - (math.ceil(left / interval) - 1) * interval, message_id, deadline))
+        self.ticker_wakeup = None
+
+    @staticmethod
+    def time_left(left):
+        '''Return the footer text of a quiz message that has left seconds to go'''
+        seconds = math.ceil(max(left, 0))
+        return f"Time left: {seconds // 60:02d}:{seconds % 60:02d}"
+
+    async def show_time_left(self, quiz, left):
+        '''Show the time left in the footer of a quiz message, without fetching the message'''
+        # Skip this update when the edit budget of the channel is used up
+        if not self.edit_budget.consume(quiz.channel_id):
+            return
+        title, description, _ = quiz.generate_quiz_message()
+        embed = discord.Embed(title=title, description=description, colour=0x3939cf)
+        embed.set_footer(text=self.time_left(left))
+        channel = self.bot.get_channel(quiz.channel_id)
+        if channel is None:
+            return
+        try:
+            await channel.get_partial_message(quiz.message_id).edit(embed=embed)
+        except discord.HTTPException:
+            pass
@@ -14,15 +14,17 @@
 # You should have received a copy of the GNU Affero General Public
 # License along with this program.
 # If not, see <https://www.gnu.org/licenses/>.
+import asyncio
 import json
 import re
-from collections import OrderedDict
-from dataclasses import dataclass, field
-from typing import List
+from collections import OrderedDict, defaultdict
 
 import discord
 from discord.ext import commands
 
+from ..compact import uidarray
+from ..ratelimit import RateLimited, TokenBucket
+
 # Generate regular expressions for raw content parsing
 re_ask = re.compile(r'(?:!ask|!question)\s*(.*)')
 
@@ -40,6 +42,36 @@ def readymovevoice(member):
     ''' Check if this member is ready to be moved to a discussion channel. '''
     return (getvoicechan(member) != None) and not member.voice.self_stream
 
+class FenwickTree:
+    ''' Binary indexed tree over question indices, used to find the rank
+        (position) of a pending question in O(log n). Indices start at 1,
+        and the tree grows when higher indices are added. '''
+    def __init__(self):
+        self.tree = [0]
+
+    def _grow(self, idx):
+        while len(self.tree) <= idx:
+            # Initialise the new node with the sum of the range it covers
+            i = len(self.tree)
+            self.tree.append(self.prefix(i - 1) - self.prefix(i - (i & -i)))
+
+    def add(self, idx, delta):
+        ''' Add delta to the count stored at idx. '''
+        self._grow(idx)
+        while idx < len(self.tree):
+            self.tree[idx] += delta
+            idx += idx & -idx
+
+    def prefix(self, idx):
+        ''' Sum of the counts stored at indices 1 up to and including idx. '''
+        idx = min(idx, len(self.tree) - 1)
+        total = 0
+        while idx > 0:
+            total += self.tree[idx]
+            idx -= idx & -idx
+        return total
+
+
 class Queue:
     ''' Base queue implementation. '''
     # Get reference to bot in a static
@@ -111,7 +143,7 @@ class Queue:
         self.qid = qid
         self.guildname = guildname
         self.channame = channame
-        self.queue = []
+        self.queue = uidarray()
 
     def size(self):
         ''' Return the size of this queue. '''
@@ -142,11 +174,11 @@ class Queue:
 
     def fromfile(self, qdata):
         ''' Build queue from data out of json file. '''
-        self.queue = qdata
+        self.queue = uidarray(qdata)
 
     def tofile(self):
         ''' Return queue data for storage in json file. '''
-        return self.queue
+        return self.queue.tolist()
 
     def save(self):
         ''' Save queue object to file. '''
@@ -183,7 +215,7 @@ class ReviewQueue(Queue):
         self.indicator = multiQueue.indicator
         self.assignments = multiQueue.assignments
         for aid in self.assignments:
-            self.queue += [uid for uid in multiQueue.queue[aid] if uid not in self.queue]
+            self.queue.extend([uid for uid in multiQueue.queue[aid] if uid not in self.queue])
 
     async def takenext(self, ctx):
         ''' Take the next student from the queue. '''
@@ -202,7 +234,7 @@ class ReviewQueue(Queue):
             member = await ctx.guild.fetch_member(uid)
         except:
             member = None
-        unready = []
+        unready = uidarray()
         while self.queue and not readymovevoice(member):
             await self.bot.dm(member, f'You were invited by a TA, but you\'re not in a voice channel yet!'
                               'You will be placed back in the queue. Make sure that you\'re more prepared next time!')
@@ -305,10 +337,15 @@ class ReviewQueue(Queue):
 class MultiReviewQueue(Queue):
     qtype = 'MultiReview'
 
-    @dataclass
     class Student:
-        id: int
-        aid: List[str] = field(default_factory=list)
+        __slots__ = ('id', 'aid', 'oldVC', 'check', 'qid')
+
+        def __init__(self, id, aid=None):
+            self.id = id
+            self.aid = aid if aid is not None else []
+            self.oldVC = None
+            self.check = None
+            self.qid = None
 
     def __init__(self, qid, guildname, channame):
         super().__init__(qid, guildname, channame)
@@ -329,7 +366,7 @@ class MultiReviewQueue(Queue):
         if not self.assignments:
             self.assignments.append(aid)
         else:
-            self.queue = {i:[] for i in self.assignments}
+            self.queue = OrderedDict((i, uidarray()) for i in self.assignments)
         aid = next(iter(self.assignments))
         self.queue[aid] = singleQueue.queue
         for uid in singleQueue.queue:
@@ -339,9 +376,9 @@ class MultiReviewQueue(Queue):
 
 
     def fromfile(self, qdata):
-        self.queue = qdata['queue']
+        self.queue = OrderedDict((aid, uidarray(uids)) for aid, uids in qdata['queue'].items())
         self.assignments = qdata['assignments']
-        students = OrderedDict()
+        students = dict()
         for aid in self.assignments:
             for uid in self.queue[aid]:
                 if uid in students:
@@ -355,7 +392,7 @@ class MultiReviewQueue(Queue):
     def tofile(self):
         qdata = {
             'assignments':self.assignments,
-            'queue':self.queue
+            'queue':{aid: uids.tolist() for aid, uids in self.queue.items()}
         }
         return qdata
 
@@ -451,7 +488,7 @@ class MultiReviewQueue(Queue):
             member = await ctx.guild.fetch_member(uid)
         except:
             member = None
-        unready = []
+        unready = uidarray()
         while self.queue[aid] and not readymovevoice(member):
             await self.bot.dm(member.id, f'You were invited by a TA, but you\'re not in a voice channel yet!'
                               'You will be placed back in the queue. Make sure that you\'re more prepared next time!')
@@ -576,7 +613,7 @@ class MultiReviewQueue(Queue):
         """Adds a queue to the list of allowed queues and updates the indicator"""
         if aid not in self.assignments:
             self.assignments.append(aid)
-            self.queue[aid] = []
+            self.queue[aid] = uidarray()
             self.assignments.sort()
             await self.updateIndicator(ctx)
             await ctx.send(f'Added queue for assignment {aid}', delete_after=5)
@@ -596,31 +633,99 @@ class MultiReviewQueue(Queue):
             ctx.send(f"Assignment {aid} was not being reviewed.", delete_after=5)
 class QuestionQueue(Queue):
     qtype = 'Question'
+    # Limits for one page of the question listing of !follow. Embed
+    # descriptions are limited to 2048 characters.
+    pagesize = 15
+    pagechars = 1800
+    linechars = 200
+    # Amendments arriving within this many seconds are merged in one edit
+    amenddelay = 2.0
 
     class Question:
+        __slots__ = ('qmsg', 'disc_msg', 'askedby', 'followers', 'msgid', 'title', 'content', 'pending')
+
         def __init__(self, askedby, qmsg, disc_msg=None):
             self.qmsg = qmsg
             self.disc_msg = disc_msg
-            self.followers = [askedby]
+            self.askedby = askedby
+            self.followers = {askedby}
+            # Answer message id and embed, stored to edit the answer later
+            self.msgid = None
+            self.title = ''
+            self.content = ''
+            self.pending = []
+
+        def followerlist(self):
+            ''' Followers in display order: the asker comes first. '''
+            return [self.askedby] + sorted(self.followers - {self.askedby})
 
     def __init__(self, qid, guildname, channame):
         super().__init__(qid, guildname, channame)
         self.queue = OrderedDict()
         self.answers = dict()
         self.maxidx = 0
+        # Reverse index of followed questions (uid -> set of question indices)
+        self.following = defaultdict(set)
+        # Pending question indices, to look up question positions
+        self.ranks = FenwickTree()
+        # Cached pages of the question listing, rebuilt when questions
+        # are added or answered
+        self.pages = None
+
+    def _enqueue(self, idx, question):
+        ''' Add question to the queue and to the follower and rank indices. '''
+        self.queue[idx] = question
+        self.ranks.add(idx, 1)
+        self.pages = None
+        for uid in question.followers:
+            self.following[uid].add(idx)
+
+    def _dequeue(self, idx):
+        ''' Remove question from the queue and from the follower and rank indices. '''
+        question = self.queue.pop(idx)
+        self.ranks.add(idx, -1)
+        self.pages = None
+        for uid in question.followers:
+            followed = self.following[uid]
+            followed.discard(idx)
+            if not followed:
+                del self.following[uid]
+        return question
+
+    def _addfollower(self, idx, uid):
+        ''' Let user with uid follow the question with index idx. '''
+        self.queue[idx].followers.add(uid)
+        self.following[uid].add(idx)
 
     def fromfile(self, qdata):
         ''' Build queue from data out of json file. '''
-        idx = -1
-        for idx, (qmsg, qf) in enumerate(qdata):
-            question = QuestionQueue.Question(0, qmsg)
-            question.followers = qf
-            self.queue[idx+1] = question
-        self.maxidx = idx + 1
+        if isinstance(qdata, list):
+            # Old format: a list of pending (question, followers) tuples
+            qdata = dict(questions=[(idx + 1, qmsg, qf) for idx, (qmsg, qf) in enumerate(qdata)],
+                         answers=[], maxidx=len(qdata))
+        for idx, qmsg, qf in qdata['questions']:
+            self._enqueue(idx, self.makequestion(qmsg, qf))
+        for idx, qmsg, qf, msgid, title, content in qdata['answers']:
+            question = self.makequestion(qmsg, qf)
+            question.msgid, question.title, question.content = msgid, title, content
+            self.answers[idx] = question
+        self.maxidx = qdata['maxidx']
 
     def tofile(self):
         ''' Return queue data for storage in json file. '''
-        return [(q.qmsg, q.followers) for q in self.queue.values()]
+        return dict(
+            questions=[(idx, q.qmsg, q.followerlist()) for idx, q in self.queue.items()],
+            answers=[(idx, q.qmsg, q.followerlist(), q.msgid, q.title, q.content)
+                     for idx, q in self.answers.items() if q.msgid is not None],
+            maxidx=self.maxidx
+        )
+
+    @staticmethod
+    def makequestion(qmsg, qf):
+        ''' Create a question from its text and stored list of followers. '''
+        question = QuestionQueue.Question(qf[0] if qf else 0, qmsg)
+        question.followers.update(qf)
+        return question
 
     async def follow(self, ctx, idx=None):
         """ Follow a question. """
@@ -634,25 +739,57 @@ class QuestionQueue(Queue):
 
         member = ctx.author.id
         if idx is None:
-            msg = '**The following questions can be followed:**\n\n'
-            for qidx, qstn in self.queue.items():
-                msg = msg + f'**- {qidx:02d}:** {qstn.qmsg}' + \
-                    (' (already following)\n' if member in qstn.followers else '\n')
-            embed = discord.Embed(title="Questions in this queue:",
-                                  description=msg, colour=0x3939cf)
-            await ctx.channel.send(embed=embed, delete_after=30)
+            await self.listquestions(ctx)
             return
 
         question = self.queue.get(idx, None)
         if question is None:
             msg = f'Hi <@{member}>! There\'s no question in the queue with index {idx}!'
-        elif member in question.followers:
+        elif idx in self.following.get(member, ()):
             msg = f'You are already following question {idx} <@{member}>!'
         else:
-            question.followers.append(member)
+            self._addfollower(idx, member)
             msg = f'You are now following question {idx} <@{member}>!'
         await ctx.send(msg, delete_after=20)
 
+    def getpages(self):
+        ''' Return the question listing split in pages. Each page is a list
+            of (index, line) tuples. '''
+        if self.pages is None:
+            marker = len(' (already following)\n')
+            self.pages = []
+            page, pagelen = [], 0
+            for qidx, qstn in self.queue.items():
+                text = qstn.qmsg if len(qstn.qmsg) <= self.linechars else \
+                    qstn.qmsg[:self.linechars - 3] + '...'
+                line = f'**- {qidx:02d}:** {text}'
+                if page and (len(page) == self.pagesize or
+                             pagelen + len(line) + marker > self.pagechars):
+                    self.pages.append(page)
+                    page, pagelen = [], 0
+                page.append((qidx, line))
+                pagelen += len(line) + marker
+            if page:
+                self.pages.append(page)
+        return self.pages
+
+    async def listquestions(self, ctx, page=1):
+        ''' Send one page of the list of questions that can be followed. '''
+        pages = self.getpages()
+        if not pages:
+            await ctx.send('There are no questions in the queue!', delete_after=20)
+            return
+        page = min(max(page, 1), len(pages))
+        followed = self.following.get(ctx.author.id, ())
+        msg = '**The following questions can be followed:**\n\n' + \
+            ''.join(line + (' (already following)\n' if qidx in followed else '\n')
+                    for qidx, line in pages[page - 1])
+        embed = discord.Embed(title="Questions in this queue:",
+                              description=msg, colour=0x3939cf)
+        if len(pages) > 1:
+            embed.set_footer(text=f'Page {page}/{len(pages)}. Type `!follow page <number>` to see another page.')
+        await ctx.channel.send(embed=embed, delete_after=30)
+
     async def add(self, ctx, askedby, qmsg):
         ''' Add question to this queue. '''
         # Delete the originating command message
@@ -665,7 +802,7 @@ class QuestionQueue(Queue):
         embed = discord.Embed(title=f"Question {self.maxidx}:",
                               description=content, colour=0xd13b33)  # 0x41f109
         disc_msg = await ctx.send(embed=embed)
-        self.queue[self.maxidx] = QuestionQueue.Question(askedby, qmsg, disc_msg)
+        self._enqueue(self.maxidx, QuestionQueue.Question(askedby, qmsg, disc_msg))
         msg = f'<@{askedby}>: Your question is added at position {len(self.queue)} with index {self.maxidx}'
         await ctx.send(msg, delete_after=10)
 
@@ -675,7 +812,7 @@ class QuestionQueue(Queue):
 
         elif answer:
             # This is a text-based answer
-            qstn = self.queue.pop(idx)
+            qstn = self._dequeue(idx)
             # Delete the question message
             if qstn.disc_msg is not None:
                 await qstn.disc_msg.delete()
@@ -683,15 +820,14 @@ class QuestionQueue(Queue):
             content = f'**Question:** {qstn.qmsg}\n\n**Answer:** {answer}\n\n' + \
                   f'**Answered by: **<@{ctx.author.id}>'
             msg = '**Followers:** ' + \
-                  ', '.join([f'<@{uid}>' for uid in qstn.followers])
+                  ', '.join([f'<@{uid}>' for uid in qstn.followerlist()])
             embed = discord.Embed(title=f"Answer to question {idx}:",
                                   description=content, colour=0x25a52b)  # 0x41f109
-            # Store the answer message object for possible later amendments
-            qstn.disc_msg = await ctx.channel.send(msg, embed=embed)
-            self.answers[idx] = qstn
+            # Store the answer message id and embed for possible later amendments
+            await self.storeanswer(ctx, idx, qstn, msg, embed)
 
             # Say something nice if student answers his/her own question
-            if qstn.followers[0] == ctx.author.id:
+            if qstn.askedby == ctx.author.id:
                 await ctx.send(f'Well done <@{ctx.author.id}>! You solved your own question!', delete_after=20)
 
         else:
@@ -701,7 +837,7 @@ class QuestionQueue(Queue):
                 await ctx.send(f'<@{ctx.author.id}>: Please select a voice channel first where you want to interview the student!', delete_after=20)
                 return
 
-            qstn = self.queue.pop(idx)
+            qstn = self._dequeue(idx)
             if qstn.disc_msg is not None:
                 await qstn.disc_msg.delete()
             content = f'**Question:** {qstn.qmsg}\n\nQuestion {idx} will be answered in voice channel <#{cv.id}>\n\n' + \
@@ -709,43 +845,54 @@ class QuestionQueue(Queue):
             embed = discord.Embed(title=f"Answer to question {idx}:",
                                   description=content, colour=0x25a52b)
             msg = '**Followers:** ' + \
-                  ', '.join([f'<@{uid}>' for uid in qstn.followers])
-            # Store the answer message object for possible later amendments
-            qstn.disc_msg = await ctx.channel.send(msg, embed=embed)
-            self.answers[idx] = qstn
+                  ', '.join([f'<@{uid}>' for uid in qstn.followerlist()])
+            # Store the answer message id and embed for possible later amendments
+            await self.storeanswer(ctx, idx, qstn, msg, embed)
+
+    async def storeanswer(self, ctx, idx, qstn, msg, embed):
+        ''' Send the answer message, and store its id and embed in the answered question. '''
+        answer_msg = await ctx.channel.send(msg, embed=embed)
+        qstn.disc_msg = None
+        qstn.msgid = answer_msg.id
+        qstn.title = embed.title
+        qstn.content = embed.description
+        self.answers[idx] = qstn
 
     async def amend(self, ctx, idx, amendment=''):
         ''' Amend the answer to question with index idx. '''
         qstn = self.answers.get(idx, None)
-        if qstn is None:
+        if qstn is None or qstn.msgid is None:
             await ctx.send(f'<@{ctx.author.id}>: No answered question found with index {idx}', delete_after=20)
             return
 
-        msg = qstn.disc_msg
-        embed = msg.embeds[0]
-        title = embed.title
-        colour = 0x2cc533 #embed.colour
-        content = embed.description
-        inspos = content.find('**Answered by: **')
-        # Delete the original answer
-        await msg.delete()
-        # and create an amended one
-        newcontent = content[:inspos] + f'**Amendment from <@{ctx.author.id}>: ** {amendment}\n\n' + content[inspos:]
-        newembed = discord.Embed(title=title,
-                                 description=newcontent, colour=colour)
+        qstn.pending.append(f'**Amendment from <@{ctx.author.id}>: ** {amendment}\n\n')
+        if len(qstn.pending) > 1:
+            # An earlier amendment is already waiting, and will take this one along
+            return
+        # Wait for more amendments to arrive, so they can be merged in one edit
+        await asyncio.sleep(self.amenddelay)
+        amendments = ''.join(qstn.pending)
+        qstn.pending.clear()
+
+        inspos = qstn.content.find('**Answered by: **')
+        qstn.content = qstn.content[:inspos] + amendments + qstn.content[inspos:]
+        newembed = discord.Embed(title=qstn.title,
+                                 description=qstn.content, colour=0x2cc533)
         msg = '**Followers:** ' + \
-            ', '.join([f'<@{uid}>' for uid in qstn.followers])
-        qstn.disc_msg = await ctx.channel.send(msg, embed=newembed)
+            ', '.join([f'<@{uid}>' for uid in qstn.followerlist()])
+        # Edit the existing answer message in place, without fetching it
+        await ctx.channel.get_partial_message(qstn.msgid).edit(content=msg, embed=newembed)
 
     def whereis(self, uid):
         ''' Find questions followed by user with id 'uid' in this queue. '''
         qlst = []
-        for pos, (idx, qstn) in enumerate(self.queue.items()):
-            if uid in qstn.followers:
-                if qstn.followers[0] == uid:
-                    qlst.append(f'Your own question ({idx}) at position {pos}')
-                else:
-                    qlst.append(f'Question {idx} at position {pos}')
+        for idx in sorted(self.following.get(uid, ())):
+            # Position is the number of pending questions asked before this one
+            pos = self.ranks.prefix(idx - 1)
+            if self.queue[idx].askedby == uid:
+                qlst.append(f'Your own question ({idx}) at position {pos}')
+            else:
+                qlst.append(f'Question {idx} at position {pos}')
         if not qlst:
             return f'You are not following questions in this channel <@{uid}>!'
         return f'Questions followed by <@{uid}>:\n' + '\n'.join(qlst)
@@ -755,11 +902,41 @@ class QueueCog(commands.Cog):
     def __init__(self, bot):
         super().__init__()
         self.bot = bot
+        # Per-user, per-command rate limiting of read-only requests: bursts
+        # of three requests, and one extra request every two seconds
+        self.limiter = TokenBucket(rate=0.5, capacity=3)
+        # Read-only requests that are currently being answered
+        self.inflight = dict()
         Queue.bot = bot
         Queue.datadir = bot.datadir.joinpath('queues')
         if not Queue.datadir.exists():
             Queue.datadir.mkdir()
 
+    async def readonly(self, ctx, respond, *key):
+        ''' Respond to a read-only request. Identical requests from the same
+            user in the same channel that arrive while the first one is
+            still being answered are merged into its response.
+
+            Read-only requests are rate-limited per user, admins are exempt.
+            Commands that change a queue are never rate-limited, so that no
+            question, answer or queue entry is dropped. '''
+        perms = getattr(ctx.author, 'guild_permissions', None)
+        if (perms is None or not perms.administrator) and \
+                not self.limiter.consume((ctx.author.id, ctx.command.qualified_name)):
+            raise RateLimited(f'{ctx.author} is sending {ctx.command} too often')
+        key = (ctx.command.qualified_name, ctx.author.id, ctx.channel.id) + key
+        if key in self.inflight:
+            try:
+                await ctx.message.delete()
+            except:
+                pass
+            return
+        self.inflight[key] = task = asyncio.ensure_future(respond())
+        try:
+            await task
+        finally:
+            del self.inflight[key]
+
     def cog_unload(self):
         # Save all queues upon exit
         print('Unloading QueueCog')
@@ -932,7 +1109,7 @@ class QueueCog(commands.Cog):
         await ctx.message.delete()
         await Queue.queues[qid].amend(ctx, idx, amstring)
 
-    @commands.command()
+    @commands.group(invoke_without_command=True)
     @commands.check(lambda ctx: Queue.qcheck(ctx, 'Question'))
     async def follow(self, ctx, idx: int = None):
         ''' Follow a question.
@@ -940,17 +1117,40 @@ class QueueCog(commands.Cog):
             Arguments:
             - idx: The index of the question to follow (optional: if no index
               is given a list of questions is printed).
+
+            Optional subcommand:
+            - `!follow page <number>` shows another page of the question list.
         '''
         qid = (ctx.guild.id, ctx.channel.id)
-        await Queue.queues[qid].follow(ctx, idx)
+        if idx is None:
+            await self.readonly(ctx, lambda: Queue.queues[qid].follow(ctx))
+        else:
+            await Queue.queues[qid].follow(ctx, idx)
+
+    @follow.command()
+    @commands.check(lambda ctx: Queue.qcheck(ctx, 'Question'))
+    async def page(self, ctx, page: int = 1):
+        ''' Show a page of the list of questions that can be followed. '''
+        qid = (ctx.guild.id, ctx.channel.id)
+
+        async def respond():
+            try:
+                await ctx.message.delete()
+            except:
+                pass
+            await Queue.queues[qid].listquestions(ctx, page)
+        await self.readonly(ctx, respond, page)
 
     @commands.command()
     @commands.check(Queue.qcheck)
     async def whereami(self, ctx):
         """ What's my position in the queue of this channel. """
         uid = ctx.author.id
-        await ctx.message.delete()
-        await ctx.send(Queue.queues[(ctx.guild.id, ctx.channel.id)].whereis(uid), delete_after=10)
+
+        async def respond():
+            await ctx.message.delete()
+            await ctx.send(Queue.queues[(ctx.guild.id, ctx.channel.id)].whereis(uid), delete_after=10)
+        await self.readonly(ctx, respond)
 
     @commands.command()
     @commands.check(lambda ctx: Queue.qcheck(ctx, ['Review',  'MultiReview']))
@@ -963,17 +1163,21 @@ class QueueCog(commands.Cog):
               if no user is given, the length of the queue is returned).
         """
         qid = (ctx.guild.id, ctx.channel.id)
-        await ctx.message.delete()
         if member is None:
             # Only respond with the length of the queue
-            size = Queue.queues[qid].size()
-            await ctx.send(f'There are {size} entries in the queue of <#{ctx.channel.id}>', delete_after=10)
+            async def respond():
+                await ctx.message.delete()
+                size = Queue.queues[qid].size()
+                await ctx.send(f'There are {size} entries in the queue of <#{ctx.channel.id}>', delete_after=10)
+                await Queue.queues[qid].updateIndicator(ctx)
+            await self.readonly(ctx, respond)
+            return
+        await ctx.message.delete()
+        # Member is passed, add him/her to the queue
+        if qtype == 'MultiReview':
+            await Queue.queues[qid].add(ctx, member.id, aid)
         else:
-            # Member is passed, add him/her to the queue
-            if qtype == 'MultiReview':
-                await Queue.queues[qid].add(ctx, member.id, aid)
-            else:
-                await Queue.queues[qid].add(ctx, member.id)
+            await Queue.queues[qid].add(ctx, member.id)
         await Queue.queues[qid].updateIndicator(ctx)
 
     @commands.command('toggle', aliases=('toggleReview',))
@@ -0,0 +1,31 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Compact containers for Discord user ids.
+
+Discord ids are unsigned 64-bit integers. Storing them in an
+:py:class:`array.array` takes 8 bytes per id, instead of the 28 bytes of
+a Python int plus the 8 byte pointer (or more, for sets) of a list.
+"""
+
+from array import array
+from typing import Iterable
+
+
+def uidarray(uids: Iterable[int] = ()) -> array:
+    """Returns a compact array of unsigned 64-bit user ids."""
+    return array("Q", uids)
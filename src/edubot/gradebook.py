@@ -0,0 +1,195 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Results of students across the quizzes of a course.
+
+A gradebook is a student x quiz matrix of int8 scores: 1 when the
+student answered the quiz correctly, 0 when they answered it wrong, and
+-1 when they did not answer. The matrix grows by doubling, and is stored
+as a ``.npz`` file, so thousands of students and hundreds of quizzes are
+analysed with a few vectorised NumPy operations.
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+# Score of a student that did not answer a quiz
+UNANSWERED = -1
+# Quiz names are stored up to 100 characters
+NAME_DTYPE = "<U100"
+
+
+def grow(array: np.ndarray, fill, axis: int = 0) -> np.ndarray:
+    """Returns ``array`` doubled in length along ``axis`` (at least 16)."""
+    shape = list(array.shape)
+    shape[axis] = max(shape[axis], 16)
+    return np.concatenate(
+        [array, np.full(shape, fill, dtype=array.dtype)], axis=axis
+    )
+
+
+class Gradebook:
+    """Student x quiz correctness matrix of a course.
+
+    Args:
+        path: Location of the ``.npz`` file, which is read if it exists.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        # Held while saving, as saves can run in worker threads
+        self.lock = threading.Lock()
+        self.nstudents = self.nquizzes = 0
+        self.students = np.zeros(64, dtype=np.uint64)
+        self.quizzes = np.zeros(16, dtype=np.uint64)
+        self.names = np.zeros(16, dtype=NAME_DTYPE)
+        self.scores = np.full((64, 16), UNANSWERED, dtype=np.int8)
+        if self.path.exists():
+            with np.load(self.path) as data:
+                self.students = data["students"]
+                self.quizzes = data["quizzes"]
+                self.names = data["names"].astype(NAME_DTYPE)
+                self.scores = data["scores"]
+            self.nstudents, self.nquizzes = self.scores.shape
+        # Row of each student, and column of each quiz
+        self.rows: Dict[int, int] = {
+            student: row
+            for row, student in enumerate(self.students[: self.nstudents])
+        }
+        self.columns: Dict[int, int] = {
+            quiz: column
+            for column, quiz in enumerate(self.quizzes[: self.nquizzes])
+        }
+
+    def _row(self, student: int) -> int:
+        """Returns the row of ``student``, adding one if needed."""
+        row = self.rows.get(student)
+        if row is None:
+            row = self.rows[student] = self.nstudents
+            self.nstudents += 1
+            if row == len(self.students):
+                self.students = grow(self.students, 0)
+                self.scores = grow(self.scores, UNANSWERED)
+            self.students[row] = student
+        return row
+
+    def _column(self, quiz: int, name: str) -> int:
+        """Returns the column of ``quiz``, adding one if needed."""
+        column = self.columns.get(quiz)
+        if column is None:
+            column = self.columns[quiz] = self.nquizzes
+            self.nquizzes += 1
+            if column == len(self.quizzes):
+                self.quizzes = grow(self.quizzes, 0)
+                self.names = grow(self.names, "")
+                self.scores = grow(self.scores, UNANSWERED, axis=1)
+            self.quizzes[column] = quiz
+        self.names[column] = name
+        return column
+
+    def add(
+        self,
+        quiz: int,
+        name: str,
+        students: Sequence[int],
+        correct: Sequence[bool],
+    ) -> None:
+        """Records the answers of the students that answered a quiz.
+
+        Adding a quiz again replaces its earlier results.
+        """
+        rows = np.array([self._row(int(student)) for student in students])
+        column = self._column(quiz, name)
+        self.scores[: self.nstudents, column] = UNANSWERED
+        if len(rows):
+            self.scores[rows, column] = np.asarray(correct, dtype=np.int8)
+
+    def save(self) -> None:
+        """Writes the gradebook, replacing the previous file at once."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp.npz")
+        with self.lock:
+            np.savez(
+                tmp_path,
+                students=self.students[: self.nstudents],
+                quizzes=self.quizzes[: self.nquizzes],
+                names=self.names[: self.nquizzes],
+                scores=self.scores[: self.nstudents, : self.nquizzes],
+            )
+            os.replace(tmp_path, self.path)
+
+    def counts(self, axis: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the number of answers, and of correct answers.
+
+        Args:
+            axis: 1 for the counts per student, 0 for those per quiz.
+        """
+        scores = self.scores[: self.nstudents, : self.nquizzes]
+        return (
+            np.count_nonzero(scores != UNANSWERED, axis=axis),
+            np.count_nonzero(scores == 1, axis=axis),
+        )
+
+    def accuracy(self) -> np.ndarray:
+        """Returns the fraction of correct answers of each student.
+
+        Students are in the order of :py:attr:`students`. The accuracy
+        is NaN for students without answers.
+        """
+        answered, correct = self.counts(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return correct / answered
+
+    def difficulty(self) -> np.ndarray:
+        """Returns the fraction of correct answers of each quiz.
+
+        Quizzes are in the order of :py:attr:`quizzes`. Low values are
+        difficult quizzes, NaN is a quiz without answers.
+        """
+        answered, correct = self.counts(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return correct / answered
+
+    def discrimination(self, fraction: float = 0.27) -> np.ndarray:
+        """Returns the discrimination index of each quiz.
+
+        Students that answered at least one quiz are ranked by their
+        accuracy. The index is the fraction of correct answers in the
+        top ``fraction`` of the students, minus that in the bottom
+        ``fraction``: high values are quizzes that good students answer
+        correctly more often than weak students. It is NaN for quizzes
+        that no student of either group answered.
+        """
+        accuracy = self.accuracy()
+        ranked = np.argsort(accuracy, kind="stable")
+        ranked = ranked[: np.count_nonzero(~np.isnan(accuracy))]
+        size = max(1, int(round(fraction * len(ranked))))
+        scores = self.scores[: self.nstudents, : self.nquizzes]
+
+        def correct_fraction(rows: np.ndarray) -> np.ndarray:
+            group = scores[rows]
+            answered = np.count_nonzero(group != UNANSWERED, axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.count_nonzero(group == 1, axis=0) / answered
+
+        return correct_fraction(ranked[-size:]) - correct_fraction(
+            ranked[:size]
+        )
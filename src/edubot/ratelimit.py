@@ -0,0 +1,83 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Rate limiting of commands and Discord API calls."""
+
+import asyncio
+import time
+from typing import Hashable
+
+from discord.ext import commands
+
+
+class RateLimited(commands.CheckFailure):
+    """Raised when a user sends a command too often."""
+
+
+class TokenBucket:
+    """Token-bucket rate limiter with a separate bucket per key.
+
+    Args:
+        rate: Number of tokens added to each bucket per second.
+        capacity: Maximum number of tokens in a bucket.
+    """
+
+    # Number of buckets from which full buckets are evicted
+    prune_size = 1024
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = dict()
+        self.prune_at = self.prune_size
+
+    def consume(self, key: Hashable) -> bool:
+        """Takes a token from the bucket of ``key``.
+
+        Returns:
+            False when the bucket is empty, True otherwise.
+        """
+        now = time.monotonic()
+        if len(self.buckets) >= self.prune_at:
+            self.prune(now)
+        tokens, last = self.buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return False
+        self.buckets[key] = (tokens - 1, now)
+        return True
+
+    def prune(self, now: float) -> None:
+        """Evicts the buckets that have refilled completely.
+
+        A missing bucket is a full one, so this doesn't change any limit.
+        Pruning happens when the number of buckets has doubled since the
+        last time, which keeps its cost constant per call.
+        """
+        self.buckets = {
+            key: (tokens, last)
+            for key, (tokens, last) in self.buckets.items()
+            if tokens + (now - last) * self.rate < self.capacity
+        }
+        self.prune_at = max(self.prune_size, 2 * len(self.buckets))
+
+    async def wait(self, key: Hashable) -> None:
+        """Waits until a token can be taken from the bucket of ``key``."""
+        while not self.consume(key):
+            tokens, _ = self.buckets[key]
+            await asyncio.sleep((1 - tokens) / self.rate)
@@ -0,0 +1,259 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Background seeding and removal of vote reactions.
+
+Votes are recorded as soon as a reaction arrives. Removing the reaction,
+so that other students can not see the vote, is a REST call that is
+queued and done by a few workers, at the pace the Discord API allows.
+
+The option reactions of a new quiz are added in the background as well,
+while the quiz is already open for votes.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+
+import discord
+import numpy as np
+
+from .ratelimit import TokenBucket
+
+
+class ReactionRemover:
+    """Queue of reactions to remove, with rate-limited workers.
+
+    Reactions of the same user on the same message are merged into one
+    queue entry, so a user that changes their vote several times takes
+    up a single place in the queue. The queue is bounded: when it is
+    full, :py:meth:`remove` waits until the workers have caught up.
+
+    Args:
+        maxsize: Maximum number of queued (message, user) entries.
+        workers: Number of worker tasks.
+        rate: Reaction removals per second, per channel.
+        capacity: Burst size of reaction removals, per channel.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        workers: int = 2,
+        rate: float = 4,
+        capacity: float = 4,
+    ):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.budget = TokenBucket(rate, capacity)
+        self.queue = None
+        self.tasks: List[asyncio.Task] = []
+        # Queued removals: (channel, message id, user id) -> (emoji, time)
+        self.pending: Dict[tuple, tuple] = dict()
+        # Seconds between queueing and removing a reaction
+        self.lags = deque(maxlen=500)
+        self.merged = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        """Starts the workers, if they are not running yet."""
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.maxsize)
+        # Workers that stopped are replaced
+        self.tasks = [task for task in self.tasks if not task.done()]
+        self.tasks += [
+            asyncio.ensure_future(self.worker())
+            for _ in range(self.workers - len(self.tasks))
+        ]
+
+    async def remove(
+        self, channel, message_id: int, user_id: int, emoji
+    ) -> None:
+        """Queues the removal of reaction ``emoji`` by ``user_id``.
+
+        Nothing is queued when ``channel`` is None, e.g. a channel that is
+        not in the cache of the bot.
+        """
+        if channel is None:
+            return
+        self.start()
+        key = (channel, message_id, user_id)
+        entry = self.pending.get(key)
+        if entry is not None:
+            entry[0][emoji] = None
+            self.merged += 1
+            return
+        self.pending[key] = ({emoji: None}, time.perf_counter())
+        await self.queue.put(key)
+
+    async def worker(self) -> None:
+        """Removes queued reactions, within the per-channel budget."""
+        while True:
+            key = await self.queue.get()
+            channel, message_id, user_id = key
+            # Reactions that arrive from here on need a new queue entry
+            emojis, queued = self.pending.pop(key)
+            user = discord.Object(id=user_id)
+            try:
+                message = channel.get_partial_message(message_id)
+                for emoji in emojis:
+                    await self.budget.wait(channel.id)
+                    try:
+                        await message.remove_reaction(emoji, user)
+                    except discord.HTTPException:
+                        self.failures += 1
+                self.lags.append(time.perf_counter() - queued)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # A broken entry must not stop the worker
+                self.failures += 1
+            finally:
+                self.queue.task_done()
+
+    def stats(self) -> str:
+        """Returns a summary of the removal lag."""
+        if not self.lags:
+            return "no reactions removed yet"
+        lag = np.array(self.lags) * 1000
+        return (
+            f"{len(self.pending)} queued, median lag {np.median(lag):.0f} ms, "
+            f"p95 {np.percentile(lag, 95):.0f} ms, {self.merged} merged, "
+            f"{self.failures} failures"
+        )
+
+    def shutdown(self) -> None:
+        """Stops the workers."""
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+
+class ReactionSeeder:
+    """Adds the option reactions to new quiz messages.
+
+    Reaction adds are issued as soon as the per-channel budget allows,
+    without waiting for the previous add to complete. discord.py sends
+    requests to the same route in the order they were made, so the
+    reactions keep the order of the options. Reactions that are seeded
+    again for the same message are added after the earlier ones.
+
+    Args:
+        budget: Reaction budget per channel, shared with the
+            :py:class:`ReactionRemover` of the same messages.
+    """
+
+    def __init__(self, budget: TokenBucket):
+        self.budget = budget
+        # Seeding tasks, by message id
+        self.tasks: Dict[int, asyncio.Task] = dict()
+        # Seconds between starting a quiz and adding its last reaction
+        self.durations = deque(maxlen=500)
+        self.failures = 0
+
+    def seed(
+        self, message, emojis: Sequence[str], started: float = None
+    ) -> asyncio.Task:
+        """Starts adding ``emojis`` to ``message`` in the background.
+
+        Args:
+            message: The quiz message.
+            emojis: The reactions to add, in order.
+            started: :py:func:`time.perf_counter` time the quiz started,
+                or None for the reactions of options added later, which
+                are not part of the statistics.
+
+        Returns:
+            The seeding task, with the seconds from ``started`` until the
+            message was fully votable (or None) as its result.
+        """
+        previous = self.tasks.get(message.id)
+        task = asyncio.ensure_future(
+            self.add(message, emojis, started, previous)
+        )
+        self.tasks[message.id] = task
+
+        def done(_):
+            if self.tasks.get(message.id) is task:
+                del self.tasks[message.id]
+            # Cancelling the seeding of a message stops all of it
+            if task.cancelled() and previous is not None:
+                previous.cancel()
+
+        task.add_done_callback(done)
+        return task
+
+    async def add(
+        self,
+        message,
+        emojis: Sequence[str],
+        started: Optional[float],
+        previous: Optional[asyncio.Task] = None,
+    ) -> Optional[float]:
+        """Adds the reactions, and returns the time until it is done.
+
+        The reactions of a ``previous`` seeding task of the message are
+        added first.
+        """
+        requests = []
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            for emoji in emojis:
+                await self.budget.wait(message.channel.id)
+                requests.append(
+                    asyncio.ensure_future(message.add_reaction(emoji))
+                )
+            results = await asyncio.gather(*requests, return_exceptions=True)
+        except asyncio.CancelledError:
+            for request in requests:
+                request.cancel()
+            raise
+        for result in results:
+            if isinstance(result, discord.HTTPException):
+                self.failures += 1
+            elif isinstance(result, Exception):
+                raise result
+        if started is None:
+            return None
+        duration = time.perf_counter() - started
+        self.durations.append(duration)
+        return duration
+
+    def cancel(self, message_id: int) -> None:
+        """Stops adding reactions to message ``message_id``."""
+        task = self.tasks.pop(message_id, None)
+        if task is not None:
+            task.cancel()
+
+    def stats(self) -> str:
+        """Returns a summary of the time until quizzes are fully votable."""
+        if not self.durations:
+            return "no quizzes started yet"
+        duration = np.array(self.durations)
+        return (
+            f"{len(self.tasks)} seeding, fully votable after median "
+            f"{np.median(duration):.1f} s, p95 "
+            f"{np.percentile(duration, 95):.1f} s, {self.failures} failures"
+        )
+
+    def shutdown(self) -> None:
+        """Stops all seeding tasks."""
+        for task in list(self.tasks.values()):
+            task.cancel()
+        self.tasks = dict()
@@ -0,0 +1,190 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Append-only log of the votes cast in active quizzes.
+
+Each vote is stored as a fixed-size binary record, so writing a vote
+takes the same time however many votes were cast before. Votes are
+committed in groups: all votes that arrive within a short interval are
+written with a single write and fsync, in a worker thread.
+
+After a crash, the votes in the log are replayed on top of the last
+snapshot of the quizzes. Replaying a vote that is already part of the
+snapshot does not change it, so the log only needs to be truncated
+after a new snapshot has been written. A snapshot that is written in
+the background only contains the votes before its :py:meth:`~VoteLog.mark`,
+so only those are discarded once it is stored.
+"""
+
+import asyncio
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+# Vote record: quiz (message id), voter, option and time of the vote
+RECORD = struct.Struct("<QQHd")
+RECORD_DTYPE = np.dtype(
+    [("quiz", "<u8"), ("voter", "<u8"), ("option", "<u2"), ("time", "<f8")]
+)
+
+
+class VoteLog:
+    """Append-only binary vote log with group commit.
+
+    Args:
+        path: Location of the log file.
+        interval: Seconds to collect votes before committing them.
+    """
+
+    def __init__(self, path: Path, interval: float = 0.05):
+        self.path = Path(path)
+        self.interval = interval
+        self.buffer = bytearray()
+        # Held while writing to or truncating the file
+        self.lock = threading.Lock()
+        # Increased on truncation, so older votes that are still being
+        # committed are not written after the new snapshot
+        self.generation = 0
+        self.file = open(self.path, "ab")
+        self.flusher = None
+        # Number of records in the file and the buffer
+        self.records = self.path.stat().st_size // RECORD.size
+        # Number of records still to be committed that were discarded
+        self.skip = 0
+        # Remove a partly written record left by a crash
+        self.file.truncate(self.records * RECORD.size)
+        self.commits = 0
+
+    def append(self, quiz: int, voter: int, option: int) -> None:
+        """Adds a vote to the log, which is committed shortly after."""
+        self.buffer += RECORD.pack(quiz, voter, option, time.time())
+        self.records += 1
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.ensure_future(self.commit())
+
+    async def commit(self) -> None:
+        """Commits the buffered votes, until no new votes arrive."""
+        loop = asyncio.get_event_loop()
+        while self.buffer:
+            await asyncio.sleep(self.interval)
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            await loop.run_in_executor(
+                None, self.write, data, self.generation
+            )
+
+    def write(self, data: bytes, generation: int = None) -> None:
+        """Appends ``data`` to the log file, and waits until it is stored.
+
+        Nothing is written if the log was truncated after ``generation``,
+        and records that were discarded before they were committed are
+        left out.
+        """
+        if not data:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if self.skip:
+                skipped = min(self.skip, len(data) // RECORD.size)
+                self.skip -= skipped
+                data = data[skipped * RECORD.size :]
+                if not data:
+                    return
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.commits += 1
+
+    def sync(self) -> None:
+        """Commits the buffered votes right away."""
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        self.write(data)
+
+    def truncate(self) -> None:
+        """Removes all votes from the log, after a new snapshot."""
+        with self.lock:
+            self.generation += 1
+            self.skip = 0
+            self.buffer.clear()
+            self.file.truncate(0)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.records = 0
+
+    def mark(self) -> Tuple[int, int]:
+        """Returns the position after the last vote, for :py:meth:`discard`.
+
+        A snapshot of the quizzes made at the same time contains all
+        votes before the mark.
+        """
+        return self.generation, self.records
+
+    async def discard(self, generation: int, records: int) -> None:
+        """Removes the votes before a mark, once their snapshot is stored.
+
+        Votes logged after the mark are kept. Nothing is removed when the
+        log was truncated after the mark.
+        """
+        loop = asyncio.get_event_loop()
+        if await loop.run_in_executor(None, self.remove, generation, records):
+            self.records -= records
+
+    def remove(self, generation: int, records: int) -> bool:
+        """Removes the first ``records`` records, replacing the file at once.
+
+        Returns:
+            False if the log was truncated after ``generation``.
+        """
+        with self.lock:
+            if generation != self.generation:
+                return False
+            stored = os.fstat(self.file.fileno()).st_size // RECORD.size
+            # Records before the mark that are not committed yet are skipped
+            self.skip += max(0, records - stored)
+            with open(self.path, "rb") as file:
+                file.seek(min(records, stored) * RECORD.size)
+                kept = file.read((stored - min(records, stored)) * RECORD.size)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as file:
+                file.write(kept)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            self.file.close()
+            self.file = open(self.path, "ab")
+        return True
+
+    def replay(self) -> np.ndarray:
+        """Returns the committed votes, as a structured array."""
+        data = self.path.read_bytes()
+        return np.frombuffer(
+            data, dtype=RECORD_DTYPE, count=len(data) // RECORD.size
+        )
+
+    def close(self) -> None:
+        """Commits the buffered votes, and closes the log."""
+        if self.flusher is not None:
+            self.flusher.cancel()
+        self.sync()
+        self.file.close()
@@ -0,0 +1,377 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+"""Vote bookkeeping of quizzes.
+
+Every vote is handled in constant time: single-vote quizzes keep a map
+of each voter's current option, multiple-vote quizzes keep a packed
+voter x option bit matrix, and the number of votes per option is kept up
+to date in a count vector, so tallies never have to be counted.
+
+The time of each counted vote is appended to a :py:class:`VoteTimeline`,
+which analyses response times with vectorised NumPy operations.
+"""
+
+from array import array
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Bytes per row of the vote matrix: 40 bits, room for all 36 options
+ROWBYTES = 5
+
+
+class VoteMatrix:
+    """Packed voter x option bit matrix of a multiple-vote quiz.
+
+    Each voter gets a row of bits, in which bit ``option - 1`` is set
+    when the voter selected that option. Rows are stored in a NumPy
+    array that grows when needed, so analyses are vectorised over all
+    voters.
+
+    Args:
+        capacity: Number of voter rows to allocate initially.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.rows: Dict[int, int] = dict()
+        self.voters = np.zeros(capacity, dtype=np.uint64)
+        self.bits = np.zeros((capacity, ROWBYTES), dtype=np.uint8)
+
+    @classmethod
+    def from_lists(cls, votes: Mapping[int, Iterable[int]]) -> "VoteMatrix":
+        """Creates a matrix from the voters of each option."""
+        voters = dict.fromkeys(
+            voter for option in votes.values() for voter in option
+        )
+        matrix = cls(max(len(voters), 1))
+        matrix.rows = {voter: row for row, voter in enumerate(voters)}
+        matrix.voters[: len(voters)] = np.array(list(voters), dtype=np.uint64)
+        for option, voters in votes.items():
+            rows = [matrix.rows[voter] for voter in voters]
+            matrix.bits[rows, (option - 1) >> 3] |= 0x80 >> ((option - 1) & 7)
+        return matrix
+
+    def __len__(self) -> int:  # noqa
+        return len(self.rows)
+
+    def _row(self, voter: int) -> int:
+        """Returns the row of ``voter``, adding one if needed."""
+        row = self.rows.get(voter)
+        if row is None:
+            row = len(self.rows)
+            if row == len(self.voters):
+                self.voters = np.concatenate([self.voters, self.voters * 0])
+                self.bits = np.concatenate([self.bits, self.bits * 0])
+            self.rows[voter] = row
+            self.voters[row] = voter
+        return row
+
+    def set(self, voter: int, option: int) -> bool:
+        """Marks ``option`` as selected by ``voter``.
+
+        Returns:
+            False when the voter had already selected this option.
+        """
+        row = self._row(voter)
+        byte, mask = (option - 1) >> 3, 0x80 >> ((option - 1) & 7)
+        if self.bits[row, byte] & mask:
+            return False
+        self.bits[row, byte] |= mask
+        return True
+
+    def selections(self, noptions: int) -> np.ndarray:
+        """Returns the unpacked (voters x options) 0/1 matrix."""
+        return np.unpackbits(
+            self.bits[: len(self.rows)], axis=1, count=noptions
+        )
+
+    def tally(self, noptions: int) -> np.ndarray:
+        """Returns the number of voters that selected each option."""
+        return self.selections(noptions).sum(axis=0, dtype=np.int64)
+
+    def coselection(self, noptions: int) -> np.ndarray:
+        """Returns the (options x options) co-selection counts.
+
+        Element ``[i, j]`` is the number of voters that selected both
+        option ``i + 1`` and option ``j + 1``. The diagonal holds the
+        tally of each option.
+        """
+        sel = self.selections(noptions).astype(np.int64)
+        return sel.T @ sel
+
+    def combinations(
+        self, noptions: int, limit: Optional[int] = None
+    ) -> List[Tuple[Tuple[int, ...], int]]:
+        """Returns how many voters picked each exact set of options.
+
+        Args:
+            noptions: Number of answer options.
+            limit: Maximum number of combinations to return.
+
+        Returns:
+            (options, count) pairs, most popular combination first.
+        """
+        # Each packed row, padded to 8 bytes, is the key of its combination
+        keys = np.zeros((len(self.rows), 8), dtype=np.uint8)
+        keys[:, :ROWBYTES] = self.bits[: len(self.rows)]
+        combos, counts = np.unique(keys.view(">u8")[:, 0], return_counts=True)
+        # Ties are listed with the lowest options first (the highest key)
+        combos, counts = combos[::-1], counts[::-1]
+        order = np.argsort(-counts, kind="stable")[:limit]
+        selected = np.unpackbits(
+            combos[order].astype(">u8").view(np.uint8).reshape(-1, 8),
+            axis=1,
+            count=noptions,
+        )
+        return [
+            (tuple((np.flatnonzero(row) + 1).tolist()), int(count))
+            for row, count in zip(selected, counts[order])
+        ]
+
+    def tolists(self, noptions: int) -> Dict[int, List[int]]:
+        """Returns the (sorted) voters per option, for storage."""
+        sel = self.selections(noptions).astype(bool)
+        voters = self.voters[: len(self.rows)]
+        return {
+            option: np.sort(voters[sel[:, option - 1]]).tolist()
+            for option in range(1, noptions + 1)
+        }
+
+
+class VoteEngine:
+    """Stores the votes of a quiz, with incrementally updated tallies.
+
+    Single-vote quizzes only store the current option of each voter.
+    Multiple-vote quizzes store the selected options of each voter in a
+    :py:class:`VoteMatrix`.
+    Options are numbered from 1, as in :py:attr:`Quiz.options`.
+
+    Args:
+        noptions: Number of answer options.
+        singlevote: When True, only the last vote of each voter counts.
+    """
+
+    def __init__(self, noptions: int = 0, singlevote: bool = True):
+        self.singlevote = singlevote
+        # Current option of each voter (single-vote quizzes)
+        self.choice: Dict[int, int] = dict()
+        # Selected options of each voter (multiple-vote quizzes)
+        self.matrix = None if singlevote else VoteMatrix()
+        self.counts = np.zeros(noptions, dtype=np.int64)
+
+    @classmethod
+    def from_votes(
+        cls, votes: Mapping[int, Iterable[int]], singlevote: bool = True
+    ) -> "VoteEngine":
+        """Creates an engine from stored voters per option.
+
+        In single-vote mode, a voter that is stored for several options
+        keeps the highest option.
+        """
+        engine = cls(len(votes), singlevote)
+        if not singlevote:
+            engine.matrix = VoteMatrix.from_lists(votes)
+            engine.counts = engine.matrix.tally(len(votes))
+            return engine
+        for option in sorted(votes):
+            engine.choice.update(dict.fromkeys(votes[option], option))
+        engine.counts = np.bincount(
+            np.fromiter(engine.choice.values(), np.int64, len(engine.choice)),
+            minlength=len(votes) + 1,
+        )[1:].astype(np.int64)
+        return engine
+
+    def __len__(self) -> int:  # noqa
+        return len(self.counts)
+
+    def add_option(self) -> int:
+        """Adds an answer option, and returns its number."""
+        self.counts = np.append(self.counts, 0)
+        return len(self.counts)
+
+    def vote(self, voter: int, option: int) -> bool:
+        """Casts a vote of ``voter`` for ``option``.
+
+        In single-vote quizzes this replaces the voter's earlier vote.
+
+        Returns:
+            True when the votes changed.
+        """
+        if self.singlevote:
+            previous = self.choice.get(voter)
+            if previous == option:
+                return False
+            if previous is not None:
+                self.counts[previous - 1] -= 1
+            self.choice[voter] = option
+        elif not self.matrix.set(voter, option):
+            return False
+        self.counts[option - 1] += 1
+        return True
+
+    def set_singlevote(self, singlevote: bool) -> None:
+        """Switches between single-vote and multiple-vote mode.
+
+        Votes that were already cast are kept. When switching to
+        single-vote mode, the highest option of each voter is kept.
+        """
+        if singlevote == self.singlevote:
+            return
+        votes = self.tolists()
+        self.singlevote = singlevote
+        self.choice = dict()
+        self.matrix = None if singlevote else VoteMatrix()
+        self.counts[:] = 0
+        for option in sorted(votes):
+            for voter in votes[option]:
+                self.vote(voter, option)
+
+    def tally(self) -> List[int]:
+        """Returns the number of votes per option."""
+        return self.counts.tolist()
+
+    def tolists(self) -> Dict[int, List[int]]:
+        """Returns the (sorted) voters per option, for storage."""
+        if not self.singlevote:
+            return self.matrix.tolists(len(self.counts))
+        votes = {option: [] for option in range(1, len(self.counts) + 1)}
+        for voter, option in self.choice.items():
+            votes[option].append(voter)
+        for voters in votes.values():
+            voters.sort()
+        return votes
+
+    def selection_matrix(self) -> VoteMatrix:
+        """Returns the votes as a :py:class:`VoteMatrix`.
+
+        For single-vote quizzes, the matrix is built from the current
+        votes.
+        """
+        if self.singlevote:
+            return VoteMatrix.from_lists(self.tolists())
+        return self.matrix
+
+
+class VoteTimeline:
+    """Times of the counted votes of a quiz, in seconds since its start.
+
+    Votes are appended to compact typed arrays (8 bytes per voter, 1 per
+    option and 4 per time), which are copied to NumPy arrays for
+    analysis. The analyses assume that the quiz did not switch between
+    single-vote and multiple-vote mode.
+    """
+
+    def __init__(self):
+        self.voters = array("Q")
+        self.options = array("B")
+        self.times = array("f")
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, List]) -> "VoteTimeline":
+        """Creates a timeline from the lists of :py:meth:`todict`."""
+        timeline = cls()
+        timeline.voters.extend(data["voters"])
+        timeline.options.extend(data["options"])
+        timeline.times.extend(data["times"])
+        return timeline
+
+    def __len__(self) -> int:  # noqa
+        return len(self.times)
+
+    def append(self, voter: int, option: int, seconds: float) -> None:
+        """Records a vote of ``voter`` for ``option``."""
+        self.voters.append(voter)
+        self.options.append(option)
+        self.times.append(seconds)
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns copies of the voters, options and times."""
+        return (
+            np.array(self.voters, dtype=np.uint64),
+            np.array(self.options, dtype=np.int64),
+            np.array(self.times, dtype=np.float32),
+        )
+
+    def todict(self) -> Dict[str, List]:
+        """Returns the votes as lists, for storage."""
+        return dict(
+            voters=self.voters.tolist(),
+            options=self.options.tolist(),
+            times=[round(seconds, 3) for seconds in self.times],
+        )
+
+    def response_times(
+        self, noptions: int, percentiles: Sequence[float] = (25, 50, 75)
+    ) -> np.ndarray:
+        """Returns percentiles of the vote times for each option.
+
+        Returns:
+            An (options x percentiles) array, which is NaN for options
+            without votes.
+        """
+        _, options, times = self.columns()
+        order = np.argsort(options, kind="stable")
+        counts = np.bincount(options, minlength=noptions + 1)[1 : noptions + 1]
+        result = np.full((noptions, len(percentiles)), np.nan)
+        groups = np.split(times[order], np.cumsum(counts)[:-1])
+        for option, group in enumerate(groups):
+            if len(group):
+                result[option] = np.percentile(group, percentiles)
+        return result
+
+    def time_to_correct(self, correct: int) -> np.ndarray:
+        """Returns when each voter first voted for option ``correct``.
+
+        Returns:
+            The (sorted) seconds since the start of the quiz, one for
+            each voter that selected the correct option.
+        """
+        voters, options, times = self.columns()
+        selected = options == correct
+        # Votes are in time order, so the first vote of a voter is the earliest
+        _, first = np.unique(voters[selected], return_index=True)
+        return np.sort(times[selected][first])
+
+    def tallies(
+        self, noptions: int, moments: Sequence[float], singlevote: bool = True
+    ) -> np.ndarray:
+        """Returns the tally of each option at several moments.
+
+        Args:
+            noptions: Number of answer options.
+            moments: Increasing seconds since the start of the quiz.
+            singlevote: When True, a vote replaces the earlier vote of
+                the same voter.
+
+        Returns:
+            A (moments x options) array of the number of votes per
+            option, counting the votes cast up to and including each
+            moment.
+        """
+        voters, options, times = self.columns()
+        # Each vote adds one to its option from the first moment at or after it
+        moment = np.searchsorted(np.asarray(moments, np.float32), times)
+        changes = np.zeros((len(moments) + 1, noptions + 1), dtype=np.int64)
+        np.add.at(changes, (moment, options), 1)
+        if singlevote:
+            # ... and removes one from the previous option of the voter
+            order = np.argsort(voters, kind="stable")
+            same = voters[order][1:] == voters[order][:-1]
+            replacing, replaced = order[1:][same], order[:-1][same]
+            np.add.at(changes, (moment[replacing], options[replaced]), -1)
+        return np.cumsum(changes, axis=0)[: len(moments), 1:]
@@ -0,0 +1,77 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+
+import io
+import json
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pytest
+
+from edubot.archive import QuizArchive
+
+BIG_ID = 2 ** 63 + 12345
+
+
+def timestamp(day: str) -> float:
+    """Returns the Unix time of noon (UTC) on ``day``."""
+    return datetime.fromisoformat(f"{day}T12:00:00+00:00").timestamp()
+
+
+@pytest.fixture
+def archive(tmp_path) -> QuizArchive:
+    """Returns an archive with quizzes on three days."""
+    archive = QuizArchive(tmp_path)
+    for quiz, day, nvotes in [
+        (1, "2020-09-01", 3),
+        (2, "2020-09-02", 0),
+        (BIG_ID, "2020-09-03", 2),
+    ]:
+        finished = timestamp(day)
+        archive.add(
+            dict(quiz=quiz, name=f"q{quiz}", finished_at=finished),
+            np.arange(nvotes) + 10,
+            np.arange(nvotes) % 2 + 1,
+            finished - np.arange(nvotes, 0, -1),
+        )
+    return archive
+
+
+def test_archive_by_day(archive):
+    """Checking that quizzes are stored and selected by finishing day."""
+    paths = list(archive.paths(date(2020, 9, 2), date(2020, 9, 3)))
+    assert [path.parent.name for path in paths] == ["2020-09-02", "2020-09-03"]
+    meta, voters, options, times = archive.load(paths[1])
+    assert meta["quiz"] == BIG_ID and meta["votes"] == 2
+    assert voters.tolist() == [10, 11] and options.tolist() == [1, 2]
+    assert datetime.fromtimestamp(times[0], timezone.utc).hour == 11
+    assert len(list(archive.paths(end=date(2020, 9, 1)))) == 1
+
+
+def test_export_columns(archive):
+    """Checking that an export combines the quizzes into columns."""
+    file = io.BytesIO()
+    assert archive.export(file, start=date(2020, 9, 1)) == (3, 5)
+    file.seek(0)
+    with np.load(file) as data:
+        assert data["quiz"].tolist() == [1, 1, 1, BIG_ID, BIG_ID]
+        assert data["voter"].tolist() == [10, 11, 12, 10, 11]
+        assert data["option"].tolist() == [1, 2, 1, 1, 2]
+        assert data["time"].dtype == np.float64
+        names = [quiz["name"] for quiz in json.loads(data["quizzes.json"])]
+    assert names == ["q1", "q2", f"q{BIG_ID}"]
@@ -0,0 +1,99 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import random
+
+import pytest
+
+from edubot.bank import QuestionBank, parse_reference
+from edubot.catalog import QuizFormatError
+
+
+def make_quiz(i: int) -> dict:
+    """Returns a quiz definition, with an extra field to keep."""
+    return {
+        "name": f"q{i}",
+        "question": f"{i}?",
+        "options": ["a", "b"],
+        "correct": 1,
+        "course": "AE1205",
+    }
+
+
+@pytest.fixture
+def bank(tmp_path) -> QuestionBank:
+    """Returns a bank with 100 questions, every third tagged 'loops'."""
+    bank = QuestionBank(tmp_path.joinpath("banks", "python.jsonl"))
+    for i in range(1, 101):
+        bank.append(make_quiz(i), ["loops"] if i % 3 == 0 else [])
+    return bank
+
+
+def test_get_reads_one_line(bank, monkeypatch):
+    """Checking that a question is loaded without parsing the bank."""
+    parsed = []
+    loads = json.loads
+    monkeypatch.setattr(json, "loads", lambda s: parsed.append(s) or loads(s))
+    assert bank.get(57)["question"] == "57?"
+    assert len(parsed) == 1
+    with pytest.raises(KeyError):
+        bank.get(101)
+
+
+def test_draw_by_tag(bank):
+    """Checking random draws, with and without a tag."""
+    rng = random.Random(1)
+    assert all(bank.draw("loops", rng) % 3 == 0 for _ in range(20))
+    assert 1 <= bank.draw(rng=rng) <= 100
+    with pytest.raises(KeyError):
+        bank.draw("recursion")
+
+
+def test_index_is_rebuilt(bank):
+    """Checking that a missing or outdated index is rebuilt."""
+    bank.index_path.unlink()
+    bank.tags_path.unlink()
+    reopened = QuestionBank(bank.path)
+    assert len(reopened) == 100
+    assert reopened.get(100)["name"] == "q100"
+    assert reopened.tags["loops"][:2] == [3, 6]
+
+
+def test_import_export_roundtrip(bank, tmp_path):
+    """Checking that per-file quizzes survive a bank unchanged."""
+    original = tmp_path.joinpath("quiz.json")
+    original.write_text(json.dumps(make_quiz(0)))
+    assert bank.import_file(original, ["intro"]) == 101
+    paths = bank.export(tmp_path.joinpath("export"))
+    assert len(paths) == 101
+    assert paths[0].name == "1.json" and paths[-1].name == "quiz.json"
+    assert json.loads(paths[-1].read_text()) == make_quiz(0)
+    assert json.loads(paths[41].read_text()) == make_quiz(42)
+
+
+def test_invalid_questions_and_references(bank):
+    """Checking that invalid questions and references are refused."""
+    with pytest.raises(QuizFormatError):
+        bank.append({"question": "?"})
+    assert len(bank) == 100
+    assert parse_reference("python:12") == ("python", 12, None)
+    assert parse_reference("python:random:loops") == ("python", None, "loops")
+    for reference in ("python:first", "../python:1", "python:1:loops"):
+        with pytest.raises(QuizFormatError):
+            parse_reference(reference)
@@ -0,0 +1,77 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import os
+
+import pytest
+
+from edubot.catalog import QuizCatalog, QuizFormatError, validate_quiz
+
+
+@pytest.fixture
+def catalog(tmp_path) -> QuizCatalog:
+    """Returns a catalog of a directory with one valid quiz."""
+    quiz = {"name": "q", "question": "?", "options": ["a", "b"], "correct": 2}
+    tmp_path.joinpath("quiz.json").write_text(json.dumps(quiz))
+    return QuizCatalog(tmp_path, interval=0, watch=False)
+
+
+def test_validate_quiz():
+    """Checking defaults, and the errors for invalid quiz definitions."""
+    definition = validate_quiz({"question": 1, "options": ["a"]})
+    assert definition["name"] == "Quiz" and definition["question"] == "1"
+    assert definition["singlevote"] and definition["correct"] is None
+    for data, message in (
+        ([], "JSON object"),
+        ({"options": []}, '"question"'),
+        ({"question": "?", "options": "a;b"}, '"options"'),
+        ({"question": "?", "options": ["a"] * 37}, "at most 36"),
+        ({"question": "?", "options": ["a"], "correct": 2}, '"correct"'),
+        ({"question": "?", "options": ["a"], "correct": 0}, '"correct"'),
+        ({"question": "?", "options": [], "timer": "1m"}, '"timer"'),
+    ):
+        with pytest.raises(QuizFormatError, match=message):
+            validate_quiz(data)
+
+
+def test_catalog_refreshes_changed_files(catalog, tmp_path):
+    """Checking that entries are only reread when their file changes."""
+    entry = catalog.get("quiz.json")
+    assert entry.definition["correct"] == 2
+    assert catalog.get("quiz.json") is entry
+
+    path = tmp_path.joinpath("quiz.json")
+    path.write_text('{"question": "?", "options": ["a"], "correct": 3}')
+    os.utime(path, ns=(0, 0))
+    tmp_path.joinpath("sub").mkdir()
+    tmp_path.joinpath("sub", "other.json").write_text("{")
+    assert catalog.names() == ["quiz.json", "sub/other.json"]
+    assert '"correct"' in catalog.get("quiz.json").error
+    assert catalog.get("sub/other.json").error.startswith("invalid JSON")
+
+    path.unlink()
+    assert catalog.get("quiz.json") is None
+
+
+def test_warm_catalog_does_not_read_files(catalog, monkeypatch):
+    """Checking that a warm catalog serves quizzes from memory."""
+    catalog.interval = 60
+    assert catalog.get("quiz.json") is not None
+    monkeypatch.setattr("pathlib.Path.rglob", pytest.fail)
+    assert catalog.get("quiz.json").definition["options"] == ["a", "b"]
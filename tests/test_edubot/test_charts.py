@@ -0,0 +1,118 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from edubot.charts import (
+    ChartCache,
+    ChartRenderer,
+    HistogramTemplate,
+    render_histogram,
+    text_histogram,
+)
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+
+@pytest.mark.parametrize("tally", [(0, 0, 0), (3, 1, 0, 4), (1,) * 36])
+def test_render_histogram(tally):
+    """Checking that histograms are encoded as PNG images."""
+    assert render_histogram(tally, correct=1).startswith(PNG_HEADER)
+
+
+@pytest.mark.asyncio
+async def test_renderer_uses_workers():
+    """Checking that the renderer returns charts and records latency."""
+    renderer = ChartRenderer(workers=1)
+    try:
+        png = await renderer.render([1, 2, 3], 2)
+    finally:
+        renderer.shutdown()
+    assert png.startswith(PNG_HEADER)
+    assert len(renderer.latencies) == 1
+    assert "1 recent renders" in renderer.stats()
+
+
+@pytest.mark.asyncio
+async def test_renderer_timeout():
+    """Checking that slow renders time out and are counted."""
+    renderer = ChartRenderer(workers=1, timeout=0.0001)
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await renderer.render([1, 2, 3])
+    finally:
+        renderer.shutdown()
+    assert renderer.timeouts == 1
+
+
+def test_cache_evicts_least_recently_used():
+    """Checking that the cache keeps within its byte budget."""
+    cache = ChartCache(budget=10)
+    cache.put((1, "a"), b"1234")
+    cache.put((1, "b"), b"1234")
+    assert cache.get((1, "a")) == b"1234"
+    cache.put((2, "c"), b"1234")
+    assert cache.get((1, "b")) is None
+    assert cache.nbytes == 8
+    cache.discard(1)
+    assert list(cache.charts) == [(2, "c")]
+    assert cache.nbytes == 4
+
+
+@pytest.mark.asyncio
+async def test_renderer_encodes_each_state_once():
+    """Checking that identical requests share one render."""
+    renderer = ChartRenderer(workers=1)
+    try:
+        first, second = await asyncio.gather(
+            renderer.render([1, 2], 1, quiz=5, labels=("a", "b")),
+            renderer.render([1, 2], 1, quiz=5, labels=("a", "b")),
+        )
+        third = await renderer.render([1, 2], 1, quiz=5, labels=("a", "b"))
+        await renderer.render([2, 2], 1, quiz=5, labels=("a", "b"))
+    finally:
+        renderer.shutdown()
+    assert first is second is third
+    assert len(renderer.latencies) == 2
+
+
+def test_template_reuse_matches_fresh_template():
+    """Checking that reused templates don't keep state of earlier charts."""
+    render_histogram((9, 0, 4), correct=2)
+    assert render_histogram((1, 2, 3)) == HistogramTemplate(3).render(
+        (1, 2, 3)
+    )
+
+
+def test_render_from_threads():
+    """Checking that charts can be rendered from several threads."""
+    tallies = [(i, 2 * i, 3) for i in range(8)]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        charts = list(pool.map(render_histogram, tallies))
+    assert charts == [render_histogram(tally) for tally in tallies]
+
+
+def test_text_histogram():
+    """Checking the text bars used for live results."""
+    text = text_histogram((3, 1), ("A", "B"), correct=1, width=4)
+    assert text.splitlines()[0] == "A `███ `  75% (3) ✔"
+    assert text.splitlines()[1] == "B `█   `  25% (1)"
+    assert text.endswith("Total number of votes: 4")
+    assert "  0% (0)" in text_histogram((0,), ("A",))
@@ -0,0 +1,38 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+from edubot.cogs.queue import MultiReviewQueue, ReviewQueue
+
+BIG_ID = 2 ** 63 + 12345
+
+
+def test_queue_roundtrip_from_arrays():
+    """Checking that array-backed queues serialise to plain lists."""
+    queue = ReviewQueue((1, 2), "guild", "channel")
+    queue.fromfile([BIG_ID, 7])
+    queue.queue.insert(1, 8)
+    assert queue.tofile() == [BIG_ID, 8, 7]
+
+
+def test_multireview_roundtrip():
+    """Checking that students are rebuilt from the array-backed queues."""
+    queue = MultiReviewQueue((1, 2), "guild", "channel")
+    qdata = {"assignments": ["1", "2"], "queue": {"1": [7, 8], "2": [8]}}
+    queue.fromfile(qdata)
+    assert queue.studentsQueued[8].aid == ["1", "2"]
+    assert queue.tofile() == qdata
+    assert "**2nd** in Queue 1" in queue.whereis(8)
@@ -0,0 +1,80 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+
+import time
+
+import numpy as np
+
+from edubot.gradebook import Gradebook
+
+BIG_ID = 2 ** 63 + 12345
+
+
+def test_aggregates(tmp_path):
+    """Checking accuracy, difficulty and discrimination of a course."""
+    gradebook = Gradebook(tmp_path / "course.npz")
+    # Students 1 to 4, from strong to weak
+    gradebook.add(10, "easy", [1, 2, 3, 4], [True, True, True, False])
+    gradebook.add(20, "hard", [1, 2, 4], [True, False, False])
+    gradebook.add(30, "odd", [1, 4], [False, True])
+    gradebook.add(40, "unanswered", [], [])
+    assert gradebook.counts(axis=1)[0].tolist() == [3, 2, 1, 3]
+    assert np.allclose(gradebook.accuracy(), [2 / 3, 1 / 2, 1, 1 / 3])
+    difficulty = gradebook.difficulty()
+    assert np.allclose(difficulty[:3], [3 / 4, 1 / 3, 1 / 2])
+    assert np.isnan(difficulty[3])
+    # Top group: student 3, bottom group: student 4
+    discrimination = gradebook.discrimination(fraction=0.25)
+    assert discrimination[0] == 1
+    assert np.isnan(discrimination[1:]).all()
+    assert np.allclose(gradebook.discrimination(fraction=0.5)[:3], [0.5, 1, -1])
+
+
+def test_store_and_grow(tmp_path):
+    """Checking that a stored gradebook is restored and can grow."""
+    gradebook = Gradebook(tmp_path / "course.npz")
+    gradebook.add(BIG_ID, "nobody", [], [])
+    gradebook.save()
+    restored = Gradebook(tmp_path / "course.npz")
+    assert restored.nstudents == 0 and restored.nquizzes == 1
+    restored.add(2, "a much longer quiz name", range(100), [True] * 100)
+    restored.add(BIG_ID, "renamed", [5], [False])
+    restored.save()
+    restored = Gradebook(tmp_path / "course.npz")
+    assert restored.names.tolist() == ["renamed", "a much longer quiz name"]
+    assert restored.counts(axis=0)[0].tolist() == [1, 100]
+    assert restored.columns[BIG_ID] == 0
+
+
+def test_aggregates_scale():
+    """Checking that thousands of students are analysed in milliseconds."""
+    rng = np.random.default_rng(0)
+    gradebook = Gradebook("unused.npz")
+    students = np.arange(5000, dtype=np.uint64) + np.uint64(BIG_ID)
+    ability = rng.random(5000)
+    for quiz in range(200):
+        answered = rng.random(5000) < 0.7
+        correct = rng.random(answered.sum()) < ability[answered]
+        gradebook.add(quiz, str(quiz), students[answered], correct)
+    start = time.perf_counter()
+    gradebook.accuracy()
+    gradebook.difficulty()
+    discrimination = gradebook.discrimination()
+    assert time.perf_counter() - start < 0.5
+    # Strong students answer correctly more often
+    assert (discrimination > 0.5).all()
@@ -0,0 +1,542 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import io
+import threading
+import time
+import unittest.mock
+
+import discord
+import numpy as np
+import pytest
+
+from edubot.catalog import QuizFormatError
+from edubot.cogs.poll import Poll, Quiz
+from edubot.ratelimit import TokenBucket
+from edubot.votes import VoteEngine
+from tests.helpers import (
+    MockContext,
+    MockMember,
+    MockMessage,
+    MockTextChannel,
+    MockUser,
+)
+
+
+@pytest.fixture
+def poll(tmp_path):
+    """Returns a Poll cog with an empty data directory."""
+    poll = Poll(unittest.mock.MagicMock(datadir=tmp_path))
+    yield poll
+    poll.charts.shutdown()
+    poll.reactions.shutdown()
+    poll.seeder.shutdown()
+    if poll.compactor is not None:
+        poll.compactor.cancel()
+    poll.votelog.close()
+
+
+@pytest.fixture
+def quiz(poll) -> Quiz:
+    """Returns an active quiz with three options."""
+    quiz = Quiz(None, 1)
+    quiz.name = "test"
+    quiz.options = {1: "a", 2: "b", 3: "c"}
+    quiz.engine = VoteEngine(3)
+    quiz.message_id = 100
+    quiz.channel_id = 200
+    poll.activate_quiz(quiz)
+    return quiz
+
+
+@pytest.mark.asyncio
+async def test_live_updater_edits_on_change(poll, quiz):
+    """Checking that live results are only edited when votes change."""
+    poll.live_interval = 0
+    quiz.live_message_id = 300
+    channel = MockTextChannel()
+    message = channel.get_partial_message.return_value
+    ticks = 0
+
+    async def sleep(delay):
+        nonlocal ticks
+        ticks += 1
+        if ticks == 2:
+            quiz.vote(5, quiz.emoji_options[1])
+        elif ticks == 4:
+            poll.quizzes.pop(quiz.message_id)
+
+    with unittest.mock.patch("edubot.cogs.poll.asyncio.sleep", sleep):
+        await poll.live_updater(quiz, channel)
+    channel.get_partial_message.assert_called_once_with(300)
+    assert message.edit.call_count == 1
+    assert "(1)" in message.edit.call_args.kwargs["embed"].description
+    assert quiz.live_message_id is None
+
+
+@pytest.mark.asyncio
+async def test_live_updater_stops_on_deleted_message(poll, quiz):
+    """Checking that failed edits are retried, until the message is gone."""
+    poll.live_interval = 0
+    quiz.live_message_id = 300
+    channel = MockTextChannel()
+    message = channel.get_partial_message.return_value
+    response = unittest.mock.MagicMock(status=404)
+    message.edit.side_effect = [
+        discord.HTTPException(response, "error"),
+        discord.NotFound(response, "unknown message"),
+    ]
+
+    async def sleep(delay):
+        quiz.vote(message.edit.call_count, quiz.emoji_options[1])
+
+    with unittest.mock.patch("edubot.cogs.poll.asyncio.sleep", sleep):
+        await poll.live_updater(quiz, channel)
+    assert message.edit.call_count == 2
+    assert quiz.live_message_id is None
+    assert quiz.message_id in poll.quizzes
+
+
+def test_combination_report(poll, quiz):
+    """Checking the combination summary of a multiple-answer quiz."""
+    assert Poll.combination_report(quiz) == "Nobody has voted yet."
+    quiz.singlevote = False
+    for voter, option in ((1, 1), (1, 2), (2, 1), (2, 2), (3, 3)):
+        quiz.engine.vote(voter, option)
+    report = Poll.combination_report(quiz)
+    a, b, c = quiz.emoji_options[:3]
+    assert f"{a} {b}: 2 (67%)" in report
+    assert f"{a} + {b}: 2" in report
+    assert f"{a} + {c}" not in report
+    assert report.endswith("Total number of voters: 3")
+
+
+def test_timing_report(poll, quiz):
+    """Checking the response time summary of a finished quiz."""
+    assert Poll.timing_report(quiz) == "Nobody has voted yet."
+    quiz.correct_answer = 2
+    for voter, option, seconds in [(1, 2, 4.0), (2, 2, 6.0), (3, 1, 8.0)]:
+        quiz.engine.vote(voter, option)
+        quiz.timeline.append(voter, option, seconds)
+    report = Poll.timing_report(quiz, nmoments=2)
+    emoji = quiz.emoji_options
+    assert f"{emoji[1]}: 5.0 s (4.5 to 5.5 s)" in report
+    assert f"{emoji[2]}:" not in report
+    assert "median 5.0 s" in report
+    assert f"4 s: {emoji[0]} 0  {emoji[1]} 1  {emoji[2]} 0" in report
+    assert report.endswith(f"8 s: {emoji[0]} 1  {emoji[1]} 2  {emoji[2]} 0")
+
+
+@pytest.mark.asyncio
+async def test_reaction_votes_without_fetch(poll, quiz):
+    """Checking that reactions are counted before they are removed."""
+    poll.bot.user.id = 1
+    channel = MockTextChannel()
+    poll.bot.get_channel.return_value = channel
+    event = unittest.mock.MagicMock(
+        message_id=quiz.message_id, channel_id=quiz.channel_id, user_id=7
+    )
+    event.emoji.__str__.return_value = quiz.emoji_options[1]
+    await poll.on_raw_reaction_add(event)
+    assert quiz.tally() == [0, 1, 0]
+    assert len(poll.vote_latencies) == 1
+    await poll.reactions.queue.join()
+    channel.fetch_message.assert_not_called()
+    channel.get_partial_message.return_value.remove_reaction.assert_called_once()
+
+
+def test_quiz_indexes(poll, quiz):
+    """Checking channel and name lookups with concurrent quizzes."""
+    second = Quiz(None, 1)
+    second.name = "test"
+    second.options = {1: "x"}
+    second.engine = VoteEngine(1)
+    second.message_id = 101
+    second.channel_id = quiz.channel_id
+    poll.activate_quiz(second)
+    assert poll.get_chanquizzes(quiz.channel_id) == [quiz, second]
+    assert poll.find_quiz("test") is second
+
+    poll.save_quizzes()
+    poll.load_quizzes()
+    restored = poll.find_quiz("test")
+    assert restored.message_id == 101
+    assert len(poll.get_chanquizzes(quiz.channel_id)) == 2
+
+    poll.deactivate_quiz(restored)
+    assert poll.find_quiz("test").message_id == 100
+    poll.deactivate_quiz(poll.find_quiz("test"))
+    assert poll.find_quiz("test") is None
+    assert poll.get_chanquizzes(quiz.channel_id) == []
+    assert not poll.channel_quizzes and not poll.quizzes
+
+
+@pytest.mark.asyncio
+async def test_dynamic_channel_messages_deleted_in_bulk(poll, quiz):
+    """Checking that chatter in dynamic quiz channels is deleted in bulk."""
+    poll.bot.user.id = 1
+    poll.bot.loop = asyncio.get_event_loop()
+    poll.bot.command_prefix = "!"
+    poll.delete_delay = 0
+    channel = MockTextChannel(id=quiz.channel_id)
+
+    def message(content, channel=channel):
+        return unittest.mock.MagicMock(
+            channel=channel, content=content, author=MockMember(id=2)
+        )
+
+    await poll.on_message(message("ignored"))
+    assert not poll.pending_deletions
+
+    quiz.dynamic = True
+    poll.update_dynamic(quiz.channel_id)
+    messages = [message("first"), message("second")]
+    for msg in messages + [message("!add option")]:
+        await poll.on_message(msg)
+    await poll.on_message(message("elsewhere", MockTextChannel(id=5)))
+    await asyncio.sleep(0.01)
+    channel.delete_messages.assert_called_once_with(messages)
+
+    poll.deactivate_quiz(quiz)
+    assert quiz.channel_id not in poll.dynamic_channels
+
+
+@pytest.mark.asyncio
+async def test_ticker_finishes_at_deadline(poll, quiz):
+    """Checking that one ticker counts down and finishes timed quizzes."""
+    poll.bot.loop = asyncio.get_event_loop()
+    poll.timer_cadence = ((float("inf"), 0.1),)
+    channel = MockTextChannel()
+    poll.bot.get_channel.return_value = channel
+    finished = {}
+
+    async def finish_quiz(message_id):
+        finished[message_id] = time.monotonic()
+        poll.deactivate_quiz(quiz)
+
+    poll.finish_quiz = finish_quiz
+    poll.finish_retry = 0.05
+    poll.start_timer(quiz, 0.25)
+    deadline = quiz.deadline
+    await asyncio.sleep(0.4)
+    assert finished[quiz.message_id] == pytest.approx(deadline, abs=0.05)
+    assert poll.ticker.done()
+
+    edit = channel.get_partial_message.return_value.edit
+    footers = [c.kwargs["embed"].footer.text for c in edit.call_args_list]
+    assert footers == ["Time left: 00:01"] * 3
+    channel.fetch_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_overdue_quiz_finished_after_restart(poll, quiz, tmp_path):
+    """Checking that a quiz whose time ran out while offline is finished."""
+    quiz.deadline = time.monotonic() - 1
+    poll.save_quizzes()
+    loop = asyncio.get_event_loop()
+    bot = unittest.mock.MagicMock(datadir=tmp_path, loop=loop)
+    ready = asyncio.Event()
+    bot.wait_until_ready.side_effect = ready.wait
+    bot.get_channel.return_value = None
+    restarted = Poll(bot)
+    # The ticker calls the command, as it does once the cog is added to the bot
+    restarted.finish_quiz.cog = restarted
+    restarted.finish_retry = 0.05
+    restarted.charts.render = unittest.mock.AsyncMock(return_value=b"png")
+    restored = restarted.quizzes[quiz.message_id]
+    await asyncio.sleep(0.1)
+    # Nothing happens before the bot is ready
+    bot.get_channel.assert_not_called()
+
+    # The channel is not available at first, so finishing is tried again
+    ready.set()
+    await asyncio.sleep(0.01)
+    assert restored.deadline is not None
+    assert quiz.message_id in restarted.quizzes
+    channel = MockTextChannel(id=quiz.channel_id)
+    bot.get_channel.return_value = channel
+    await asyncio.wait_for(restarted.ticker, 1)
+    assert quiz.message_id not in restarted.quizzes
+    assert restored.deadline is None
+    message = channel.get_partial_message.return_value
+    message.clear_reactions.assert_called_once()
+    restarted.charts.shutdown()
+    restarted.votelog.close()
+
+
+@pytest.mark.asyncio
+async def test_voting_opens_before_reactions_are_seeded(poll):
+    """Checking that a quiz takes votes while its reactions are added."""
+    channel = MockTextChannel(id=200)
+    message = MockMessage(id=100, channel=channel)
+    channel.send.return_value = message
+    release = asyncio.Event()
+    added = []
+
+    async def add_reaction(emoji):
+        await release.wait()
+        added.append(emoji)
+
+    message.add_reaction.side_effect = add_reaction
+    poll.seeder.budget = TokenBucket(rate=1000, capacity=1000)
+    quiz = Quiz(None, 1)
+    quiz.options = {i + 1: str(i) for i in range(26)}
+    quiz.engine = VoteEngine(26)
+    await poll.launch_quiz(channel, quiz)
+
+    # The last option has no reaction yet, but can be voted on
+    poll.cast_vote(quiz, 7, quiz.emoji_options[25])
+    assert quiz.tally()[25] == 1
+    assert quiz.votable_after is None
+    release.set()
+    await poll.seeder.tasks[100]
+    await asyncio.sleep(0)
+    assert added == list(quiz.emoji_options[:26])
+    assert quiz.votable_after > 0
+    assert "fully votable" in poll.seeder.stats()
+
+
+@pytest.mark.asyncio
+async def test_finish_quiz_sends_results_concurrently(poll, quiz):
+    """Checking that results go out at once, once to each recipient."""
+    poll.charts.render = unittest.mock.AsyncMock(return_value=b"png")
+    channel = MockTextChannel(id=quiz.channel_id)
+    poll.bot.get_channel.return_value = channel
+    release = asyncio.Event()
+    sent = []
+
+    async def send(**kwargs):
+        sent.append(kwargs["file"].fp.read())
+        await release.wait()
+
+    def get_user(user_id):
+        user = MockUser(id=user_id)
+        user.send.side_effect = send
+        return user
+
+    channel.send.side_effect = send
+    # The owner and the author are the same user, as different objects
+    poll.bot.get_user.side_effect = get_user
+    ctx = MockContext(author=MockMember(id=quiz.owner), channel=channel)
+    poll.last_started = quiz.name
+    finishing = asyncio.ensure_future(poll.finish_quiz.callback(poll, ctx))
+    await asyncio.sleep(0.01)
+    # Both messages are being sent before either one is done
+    assert sent == [b"png", b"png"]
+    release.set()
+    await finishing
+    channel.fetch_message.assert_not_called()
+    message = channel.get_partial_message.return_value
+    message.clear_reactions.assert_called_once()
+    assert message.edit.call_args.kwargs["embed"].colour.value == 0x25A52B
+    assert quiz.message_id not in poll.quizzes
+
+
+@pytest.mark.asyncio
+async def test_export_finished_quizzes(poll, quiz):
+    """Checking that finished quizzes are archived and can be exported."""
+    poll.bot.loop = asyncio.get_event_loop()
+    quiz.vote(7, quiz.emoji_options[2])
+    await poll.archive_quiz(quiz)
+    ctx = MockContext()
+    ctx.guild.filesize_limit = 8 << 20
+    sent = {}
+
+    async def send(content, file):
+        # discord.py opens anything that is not an io.IOBase as a path, and
+        # a spooled temporary file is not one before Python 3.11
+        assert isinstance(file.fp, io.BytesIO)
+        sent[file.filename] = file.fp.read()
+
+    ctx.author.send.side_effect = send
+    await poll.export_quizzes.callback(poll, ctx, "2020-01-01")
+    (filename, data), = sent.items()
+    assert filename.startswith("quizzes_2020-01-01_")
+    with np.load(io.BytesIO(data)) as data:
+        assert data["quiz"].tolist() == [quiz.message_id]
+        assert data["option"].tolist() == [3]
+    await poll.export_quizzes.callback(poll, ctx, "September")
+    assert "YYYY-MM-DD" in ctx.channel.send.call_args.args[0]
+
+    # Direct messages of the author are closed
+    response = unittest.mock.MagicMock(status=403)
+    ctx.author.send.side_effect = discord.Forbidden(response, "closed")
+    await poll.export_quizzes.callback(poll, ctx)
+    assert "direct messages" in ctx.channel.send.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_course_statistics(poll, quiz):
+    """Checking that finished quizzes are graded per course."""
+    poll.bot.loop = asyncio.get_event_loop()
+    channel = MockTextChannel()
+    await poll.grade_quiz(quiz, channel)
+    assert not poll.get_gradebook(channel.guild.id).nquizzes
+    quiz.correct_answer = 2
+    quiz.vote(7, quiz.emoji_options[1])
+    quiz.vote(8, quiz.emoji_options[0])
+    await poll.grade_quiz(quiz, channel)
+    assert poll.get_gradebook(channel.guild.id).path.exists()
+
+    ctx = MockContext(guild=channel.guild)
+    ctx.guild.get_member.return_value = None
+    await poll.quiz_stats.callback(poll, ctx)
+    content, file = ctx.author.send.call_args.args[0], ctx.author.send.call_args.kwargs["file"]
+    assert "most difficult was test (50% correct)" in content
+    assert file.fp.read().decode().splitlines()[1] == "100,test,2,1,0.500,1.000"
+    await poll.student_stats.callback(poll, ctx, MockMember(id=7, display_name="Ada"))
+    assert ctx.author.send.call_args.args[0].startswith("Ada answered 1 of 1")
+    await poll.student_stats.callback(poll, ctx)
+    assert "2 students answered 1 graded quizzes" in ctx.author.send.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_dynamic_options_burst(poll, quiz):
+    """Checking duplicate detection and batched updates of added options."""
+    poll.bot.loop = asyncio.get_event_loop()
+    poll.delete_delay = poll.option_delay = 0
+    poll.seeder.budget = TokenBucket(rate=1000, capacity=1000)
+    quiz.deadline = time.monotonic() + 90
+    quiz.dynamic = True
+    poll.update_dynamic(quiz.channel_id)
+    channel = MockTextChannel(id=quiz.channel_id)
+    submissions = ["Numpy", "numpy!", "\uff2e\uff35\uff2d\uff30\uff39", "  pandas ", "C++", " c "]
+    for voter, text in enumerate(submissions):
+        ctx = MockContext(channel=channel, author=MockMember(id=voter))
+        ctx.message.channel = channel
+        await poll.add_quiz_option.callback(poll, ctx, *text.split())
+    assert quiz.options == {1: "a", 2: "b", 3: "c", 4: "Numpy", 5: "pandas", 6: "C++"}
+    assert quiz.tally() == [0, 0, 1, 3, 1, 1]
+
+    await poll.option_updates[quiz.message_id]
+    message = channel.get_partial_message.return_value
+    message.edit.assert_called_once()
+    embed = message.edit.call_args.kwargs["embed"]
+    assert "C++" in embed.description
+    assert embed.footer.text == "Time left: 01:30"
+    while poll.seeder.tasks:
+        await asyncio.sleep(0)
+    added = [call.args[0] for call in message.add_reaction.call_args_list]
+    assert added == list(quiz.emoji_options[3:6])
+    await asyncio.sleep(0)
+    assert channel.delete_messages.call_count == 1
+    assert len(channel.delete_messages.call_args.args[0]) == len(submissions)
+
+
+@pytest.mark.asyncio
+async def test_options_seeded_when_edit_fails(poll, quiz):
+    """Checking that new options get reactions when the edit fails."""
+    poll.option_delay = 0
+    poll.seeder.budget = TokenBucket(rate=1000, capacity=1000)
+    channel = MockTextChannel(id=quiz.channel_id)
+    message = channel.get_partial_message.return_value
+    response = unittest.mock.MagicMock(status=500)
+    message.edit.side_effect = discord.HTTPException(response, "error")
+    quiz.add_option("d")
+    poll.queue_option_update(quiz, channel, 4)
+    await poll.option_updates[quiz.message_id]
+    while poll.seeder.tasks:
+        await asyncio.sleep(0)
+    message.add_reaction.assert_called_once_with(quiz.emoji_options[3])
+
+
+@pytest.mark.asyncio
+async def test_votes_survive_crash(poll, quiz, tmp_path):
+    """Checking that logged votes are replayed on top of the last save."""
+    poll.save_quizzes()
+    poll.cast_vote(quiz, 7, quiz.emoji_options[1])
+    poll.cast_vote(quiz, 8, quiz.emoji_options[2])
+    poll.cast_vote(quiz, 8, quiz.emoji_options[2])
+    assert poll.votelog.records == 2
+    await poll.votelog.flusher
+    # Start again without saving, as after a crash
+    restarted = Poll(unittest.mock.MagicMock(datadir=tmp_path))
+    assert restarted.quizzes[quiz.message_id].tally() == [0, 1, 1]
+    assert len(restarted.quizzes[quiz.message_id].timeline) == 2
+    assert restarted.votelog.path.stat().st_size == 0
+    restarted.votelog.close()
+
+
+@pytest.mark.asyncio
+async def test_compaction_keeps_votes_cast_while_saving(poll, quiz, tmp_path):
+    """Checking that saving in the background only drops saved votes."""
+    poll.bot.loop = asyncio.get_event_loop()
+    poll.compact_interval = 0.05
+    writing, release = threading.Event(), threading.Event()
+    write_snapshot = poll.write_snapshot
+
+    def slow_write(snapshot):
+        writing.set()
+        release.wait(1)
+        write_snapshot(snapshot)
+
+    poll.write_snapshot = slow_write
+    poll.cast_vote(quiz, 7, quiz.emoji_options[1])
+    await poll.votelog.flusher
+    while not writing.is_set():
+        await asyncio.sleep(0.01)
+    # This vote is not part of the snapshot that is being written
+    poll.cast_vote(quiz, 8, quiz.emoji_options[2])
+    await poll.votelog.flusher
+    release.set()
+    while poll.votelog.records == 2:
+        await asyncio.sleep(0.01)
+    assert poll.votelog.replay()["voter"].tolist() == [8]
+    assert "\n" not in poll.save_filepath.read_text()
+
+    restarted = Poll(unittest.mock.MagicMock(datadir=tmp_path))
+    assert restarted.quizzes[quiz.message_id].tally() == [0, 1, 1]
+    restarted.votelog.close()
+
+
+def test_timer_resumes_after_restart(poll, quiz):
+    """Checking that saved quizzes continue their countdown."""
+    quiz.timer = 60
+    quiz.deadline = time.monotonic() + 30
+    restored = Quiz(None, None).load_from_save_data(quiz.create_save_data())
+    assert restored.deadline - time.monotonic() == pytest.approx(30, abs=1)
+    data = quiz.create_save_data()
+    data.pop("ends_at")
+    restored = Quiz(None, None).load_from_save_data(data)
+    assert restored.deadline - time.monotonic() == pytest.approx(60, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_start_quiz_reports_invalid_file(poll):
+    """Checking that invalid quiz files are reported with the problem."""
+    poll.datadir.joinpath("bad.json").write_text('{"question": "?"}')
+    ctx = MockContext()
+    await poll.start_quiz.callback(poll, ctx, "bad")
+    message = ctx.channel.send.call_args.args[0]
+    assert message.endswith('"options" should be a list of answers')
+    assert not poll.quizzes
+
+
+def test_bank_questions(poll):
+    """Checking that quizzes are created from bank questions."""
+    bank = poll.get_bank("python", create=True)
+    bank.append({"name": "loop", "question": "?", "options": ["a"]}, ["loops"])
+    assert poll.bank_question("python:1", 5).name == "loop"
+    assert poll.bank_question("python:random:loops", 5).owner == 5
+    for reference, message in (
+        ("java:1", "no question bank"),
+        ("python:2", "questions 1 to 1, not 2"),
+        ("python:random:io", "no questions tagged io"),
+    ):
+        with pytest.raises(QuizFormatError, match=message):
+            poll.bank_question(reference, 5)
@@ -0,0 +1,182 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+
+import discord
+import pytest
+
+from edubot.cogs.queue import FenwickTree, QuestionQueue, QueueCog
+from edubot.ratelimit import RateLimited, TokenBucket
+from tests.helpers import MockContext, MockMember
+
+
+@pytest.fixture
+def qqueue() -> QuestionQueue:
+    """Returns a question queue with three questions from two users."""
+    queue = QuestionQueue((1, 2), "guild", "channel")
+    queue.fromfile([("first?", [10]), ("second?", [11, 10]), ("third?", [11])])
+    return queue
+
+
+def test_fenwick_prefix():
+    """Checking prefix sums while the tree grows and shrinks."""
+    tree = FenwickTree()
+    for idx in range(1, 20):
+        tree.add(idx, 1)
+    tree.add(5, -1)
+    assert tree.prefix(4) == 4
+    assert tree.prefix(5) == 4
+    assert tree.prefix(19) == 18
+    assert tree.prefix(100) == 18
+
+
+def test_whereis_uses_positions(qqueue):
+    """Checking that positions shift when earlier questions are answered."""
+    assert "Your own question (1) at position 0" in qqueue.whereis(10)
+    assert "Question 2 at position 1" in qqueue.whereis(10)
+    qqueue._dequeue(1)
+    assert qqueue.whereis(10).endswith("Question 2 at position 0")
+    assert 1 not in qqueue.following[11]
+    assert "not following" in qqueue.whereis(12)
+
+
+@pytest.mark.asyncio
+async def test_follow_updates_index(qqueue):
+    """Checking that following a question updates the reverse index."""
+    ctx = MockContext(author=MockMember(id=12))
+    await qqueue.follow(ctx, 3)
+    assert 3 in qqueue.following[12]
+    assert "Question 3 at position 2" in qqueue.whereis(12)
+    await qqueue.follow(ctx, 3)
+    assert "already following" in ctx.send.call_args.args[0]
+
+
+def test_tofile_keeps_asker_first(qqueue):
+    """Checking that the asker is stored as the first follower."""
+    assert qqueue.tofile()["questions"][1] == (2, "second?", [11, 10])
+
+
+def test_pages_are_cached_and_invalidated(qqueue):
+    """Checking that question pages are only rebuilt after changes."""
+    pages = qqueue.getpages()
+    assert qqueue.getpages() is pages
+    qqueue._addfollower(1, 12)
+    assert qqueue.getpages() is pages
+    qqueue._dequeue(1)
+    assert [idx for idx, _ in qqueue.getpages()[0]] == [2, 3]
+
+
+def test_pages_respect_limits():
+    """Checking that long queues are split within the embed limits."""
+    queue = QuestionQueue((1, 2), "guild", "channel")
+    queue.fromfile([("x" * 500, [10])] * 40)
+    pages = queue.getpages()
+    assert sum(len(page) for page in pages) == 40
+    for page in pages:
+        assert len(page) <= queue.pagesize
+        assert sum(len(line) + 21 for _, line in page) <= queue.pagechars
+
+
+@pytest.mark.asyncio
+async def test_listquestions_marks_followed(qqueue):
+    """Checking that the listing marks questions the user follows."""
+    ctx = MockContext(author=MockMember(id=11))
+    await qqueue.listquestions(ctx)
+    embed = ctx.channel.send.call_args.kwargs["embed"]
+    assert "second? (already following)" in embed.description
+    assert "first? (already following)" not in embed.description
+
+
+@pytest.fixture
+def answered(qqueue) -> QuestionQueue:
+    """Returns the question queue with question 1 answered."""
+    qqueue.amenddelay = 0.05
+    ctx = MockContext(author=MockMember(id=20))
+    ctx.channel.send.return_value.id = 1234
+    asyncio.run(qqueue.answer(ctx, 1, "Yes."))
+    return qqueue
+
+
+def test_answers_survive_save(answered):
+    """Checking that answer message ids are stored and restored."""
+    restored = QuestionQueue((1, 2), "guild", "channel")
+    restored.fromfile(answered.tofile())
+    assert restored.answers[1].msgid == 1234
+    assert restored.answers[1].content == answered.answers[1].content
+    assert list(restored.queue) == [2, 3]
+    assert restored.maxidx == 3
+
+
+@pytest.mark.asyncio
+async def test_amendments_are_merged(answered):
+    """Checking that quick amendments are merged in one in-place edit."""
+    ctx = MockContext(author=MockMember(id=20))
+    await asyncio.gather(
+        answered.amend(ctx, 1, "First."), answered.amend(ctx, 1, "Second.")
+    )
+    ctx.channel.get_partial_message.assert_called_once_with(1234)
+    edit = ctx.channel.get_partial_message.return_value.edit
+    edit.assert_called_once()
+    description = edit.call_args.kwargs["embed"].description
+    assert description.index("First.") < description.index("Second.")
+    assert description.index("Second.") < description.index("Answered by")
+
+
+@pytest.mark.asyncio
+async def test_readonly_merges_inflight_requests():
+    """Checking that identical read-only requests share one response."""
+    cog = QueueCog.__new__(QueueCog)
+    cog.inflight = dict()
+    ctx = MockContext(author=MockMember(id=30))
+    calls = []
+
+    async def respond():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+
+    await asyncio.gather(
+        cog.readonly(ctx, respond), cog.readonly(ctx, respond)
+    )
+    assert len(calls) == 1
+    assert not cog.inflight
+
+
+@pytest.mark.asyncio
+async def test_readonly_requests_are_rate_limited():
+    """Checking that only repeated read-only requests are limited."""
+    cog = QueueCog.__new__(QueueCog)
+    cog.inflight = dict()
+    cog.limiter = TokenBucket(rate=0.5, capacity=1)
+    student = MockMember(id=30, guild_permissions=discord.Permissions.none())
+    admin = MockMember(id=31)
+    admin.guild_permissions.administrator = True
+    calls = []
+
+    async def respond():
+        calls.append(1)
+
+    def context(author):
+        ctx = MockContext(author=author)
+        ctx.command.qualified_name = "whereami"
+        return ctx
+
+    for author in (student, admin, admin):
+        await cog.readonly(context(author), respond)
+    with pytest.raises(RateLimited):
+        await cog.readonly(context(student), respond)
+    assert len(calls) == 3
@@ -0,0 +1,51 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+from edubot.ratelimit import TokenBucket
+
+
+def test_token_bucket(monkeypatch):
+    """Checking that buckets empty per key and refill over time."""
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=0.5, capacity=2)
+    assert bucket.consume(("a", "whereami"))
+    assert bucket.consume(("a", "whereami"))
+    assert not bucket.consume(("a", "whereami"))
+    assert bucket.consume(("a", "follow"))
+    now[0] += 2.0
+    assert bucket.consume(("a", "whereami"))
+    assert not bucket.consume(("a", "whereami"))
+
+
+def test_full_buckets_are_evicted(monkeypatch):
+    """Checking that refilled buckets don't accumulate."""
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.prune_at = 4
+    for user in range(4):
+        assert bucket.consume(user)
+    now[0] += 1.0
+    assert bucket.consume(0) and bucket.consume(0)
+    now[0] += 0.5
+    # Only the bucket of user 0 has not refilled yet
+    assert bucket.consume(4)
+    assert sorted(bucket.buckets) == [0, 4]
+    assert bucket.prune_at == 1024
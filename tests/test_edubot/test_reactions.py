@@ -0,0 +1,123 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+
+import pytest
+
+from edubot.ratelimit import TokenBucket
+from edubot.reactions import ReactionRemover, ReactionSeeder
+from tests.helpers import MockMessage, MockTextChannel
+
+
+@pytest.mark.asyncio
+async def test_removals_are_merged_per_user():
+    """Checking that queued reactions of one user share a queue entry."""
+    remover = ReactionRemover(workers=1)
+    channel = MockTextChannel()
+    await remover.remove(channel, 100, 1, "a")
+    await remover.remove(channel, 100, 1, "b")
+    await remover.remove(channel, 100, 1, "a")
+    await remover.remove(channel, 100, 2, "a")
+    assert remover.queue.qsize() == 2
+    await remover.queue.join()
+    remover.shutdown()
+
+    channel.get_partial_message.assert_called_with(100)
+    removed = channel.get_partial_message.return_value.remove_reaction
+    assert [(c.args[0], c.args[1].id) for c in removed.call_args_list] == [
+        ("a", 1),
+        ("b", 1),
+        ("a", 2),
+    ]
+    assert remover.merged == 2
+    assert len(remover.lags) == 2
+
+
+@pytest.mark.asyncio
+async def test_full_queue_applies_backpressure():
+    """Checking that queueing waits while the queue is full."""
+    remover = ReactionRemover(maxsize=1, workers=0)
+    channel = MockTextChannel()
+    await remover.remove(channel, 100, 1, "a")
+    blocked = asyncio.ensure_future(remover.remove(channel, 100, 2, "a"))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+    remover.tasks = [asyncio.ensure_future(remover.worker())]
+    await asyncio.wait_for(blocked, 1)
+    await remover.queue.join()
+    remover.shutdown()
+    assert len(remover.lags) == 2
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_errors():
+    """Checking that workers keep running after unexpected errors."""
+    remover = ReactionRemover(workers=1)
+    await remover.remove(None, 100, 1, "a")
+    assert remover.queue is None
+
+    broken = MockTextChannel()
+    broken.get_partial_message.side_effect = AttributeError
+    channel = MockTextChannel()
+    await remover.remove(broken, 100, 1, "a")
+    await remover.remove(channel, 100, 1, "a")
+    await remover.queue.join()
+    assert remover.failures == 1
+    assert len(remover.lags) == 1
+
+    remover.tasks[0].cancel()
+    await asyncio.sleep(0)
+    remover.start()
+    assert len(remover.tasks) == 1 and not remover.tasks[0].done()
+    await remover.remove(channel, 100, 2, "a")
+    await remover.queue.join()
+    remover.shutdown()
+    assert len(remover.lags) == 2
+
+
+@pytest.mark.asyncio
+async def test_later_seeding_follows_earlier_one():
+    """Checking that reactions seeded again are added after the first."""
+    seeder = ReactionSeeder(TokenBucket(rate=1000, capacity=1000))
+    message = MockMessage(id=100, channel=MockTextChannel(id=200))
+    release = asyncio.Event()
+    added = []
+
+    async def add_reaction(emoji):
+        if emoji == "a":
+            await release.wait()
+        added.append(emoji)
+
+    message.add_reaction.side_effect = add_reaction
+    first = seeder.seed(message, ["a"], started=0)
+    second = seeder.seed(message, ["b", "c"])
+    await asyncio.sleep(0.01)
+    assert added == [] and seeder.tasks == {100: second}
+    release.set()
+    assert await second is None
+    assert await first > 0
+    assert added == ["a", "b", "c"]
+    assert len(seeder.durations) == 1 and not seeder.tasks
+
+    release.clear()
+    first = seeder.seed(message, ["a"])
+    second = seeder.seed(message, ["b"])
+    seeder.cancel(100)
+    await asyncio.sleep(0.01)
+    assert first.cancelled() and second.cancelled()
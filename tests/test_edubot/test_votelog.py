@@ -0,0 +1,94 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+
+import pytest
+
+from edubot.votelog import RECORD, VoteLog
+
+
+@pytest.fixture
+def log(tmp_path) -> VoteLog:
+    """Returns an empty vote log."""
+    log = VoteLog(tmp_path / "votes.log")
+    yield log
+    log.close()
+
+
+@pytest.mark.asyncio
+async def test_group_commit(log):
+    """Checking that a burst of votes is written in one commit."""
+    for voter in range(100):
+        log.append(1, voter, voter % 4 + 1)
+    await log.flusher
+    assert log.commits == 1
+    assert log.path.stat().st_size == 100 * RECORD.size
+    votes = log.replay()
+    assert votes["voter"].tolist() == list(range(100))
+    assert votes["option"][:4].tolist() == [1, 2, 3, 4]
+    assert (votes["quiz"] == 1).all()
+
+
+@pytest.mark.asyncio
+async def test_torn_record_ignored(log):
+    """Checking that a partly written last record is dropped."""
+    log.append(1, 2, 3)
+    log.append(1, 4, 5)
+    log.flusher.cancel()
+    log.sync()
+    with open(log.path, "ab") as file:
+        file.write(RECORD.pack(1, 6, 7, 0.0)[:10])
+    assert len(log.replay()) == 2
+    log.close()
+    reopened = VoteLog(log.path)
+    assert reopened.records == 2
+    assert log.path.stat().st_size == 2 * RECORD.size
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_truncate(log):
+    """Checking that votes committed before a truncation are dropped."""
+    log.append(1, 2, 3)
+    log.flusher.cancel()
+    data = bytes(log.buffer)
+    generation = log.generation
+    log.truncate()
+    log.write(data, generation)
+    assert log.records == 0
+    assert len(log.replay()) == 0
+
+
+@pytest.mark.asyncio
+async def test_discard_keeps_later_votes(log):
+    """Checking that only the votes before a mark are discarded."""
+    log.append(1, 2, 3)
+    await log.flusher
+    log.append(1, 4, 5)
+    mark = log.mark()
+    log.append(1, 6, 7)
+    # The second vote is discarded before it is committed
+    await log.discard(*mark)
+    await log.flusher
+    assert log.records == 1
+    assert log.replay()["voter"].tolist() == [6]
+
+    mark = log.mark()
+    log.truncate()
+    log.append(1, 8, 9)
+    await log.discard(*mark)
+    assert log.records == 1
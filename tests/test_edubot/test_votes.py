@@ -0,0 +1,158 @@
+# Discord bot for the TU Delft Aerospace Engineering Python course
+# Copyright (C) 2020 Delft University of Technology
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+import numpy as np
+import pytest
+
+from edubot.cogs.poll import Quiz
+from edubot.votes import VoteEngine, VoteMatrix, VoteTimeline
+
+BIG_ID = 2 ** 63 + 12345
+
+
+def test_single_vote_replaces_earlier_vote():
+    """Checking that only the last vote counts in single-vote mode."""
+    engine = VoteEngine(3)
+    assert engine.vote(1, 1)
+    assert engine.vote(2, 1)
+    assert engine.vote(1, 3)
+    assert not engine.vote(1, 3)
+    assert engine.tally() == [1, 0, 1]
+    assert engine.tolists() == {1: [2], 2: [], 3: [1]}
+
+
+def test_multiple_votes():
+    """Checking that voters can select several options."""
+    engine = VoteEngine(2, singlevote=False)
+    engine.vote(1, 1)
+    engine.vote(1, 2)
+    assert not engine.vote(1, 2)
+    assert engine.tally() == [1, 1]
+
+
+def test_switch_modes_and_restore():
+    """Checking mode switches, and restoring from stored votes."""
+    engine = VoteEngine(2)
+    engine.vote(1, 1)
+    engine.set_singlevote(False)
+    engine.vote(1, 2)
+    assert engine.tally() == [1, 1]
+    engine.set_singlevote(True)
+    assert engine.tally() == [0, 1]
+    restored = VoteEngine.from_votes({1: [3], 2: [1, 4]})
+    assert restored.tally() == [1, 2]
+    restored.vote(4, 1)
+    assert restored.tally() == [2, 1]
+
+
+def test_quiz_vote_with_emoji():
+    """Checking that quizzes map emoji to options, and ignore others."""
+    quiz = Quiz(None, 1)
+    quiz.options = {1: "a", 2: "b"}
+    quiz.engine = VoteEngine(2)
+    quiz.vote(5, quiz.emoji_options[1])
+    quiz.vote(6, quiz.emoji_options[2])
+    quiz.vote(6, "no emoji")
+    assert quiz.tally() == [0, 1]
+    assert quiz.create_save_data()["counted_votes"] == {"a": 0, "b": 1}
+
+
+def test_vote_matrix_analyses():
+    """Checking tallies, co-selection and combinations of multiple votes."""
+    votes = {1: [1, 2, 3], 2: [1, 2], 3: [3], 36: [BIG_ID]}
+    engine = VoteEngine.from_votes(
+        {option: votes.get(option, []) for option in range(1, 37)},
+        singlevote=False,
+    )
+    matrix = engine.selection_matrix()
+    assert matrix.tally(36).tolist() == engine.tally()
+    cosel = matrix.coselection(36)
+    assert cosel[0, 1] == 2 and cosel[0, 2] == 1 and cosel[1, 2] == 0
+    assert matrix.combinations(36) == [((1, 2), 2), ((1, 3), 1), ((36,), 1)]
+    assert engine.tolists()[36] == [BIG_ID]
+
+
+def test_vote_matrix_scales():
+    """Checking that thousands of voters are analysed in milliseconds."""
+    rng = np.random.default_rng(0)
+    picks = rng.random((5000, 36)) < 0.2
+    matrix = VoteMatrix(capacity=8)
+    for voter, option in zip(*np.nonzero(picks)):
+        matrix.set(int(voter), int(option) + 1)
+    start = time.perf_counter()
+    assert matrix.tally(36).tolist() == picks.sum(axis=0).tolist()
+    assert (matrix.coselection(36) == picks.T.astype(int) @ picks).all()
+    assert sum(count for _, count in matrix.combinations(36)) == len(matrix)
+    assert time.perf_counter() - start < 0.5
+
+
+def test_restore_keeps_highest_single_vote():
+    """Checking bulk restores, with a voter stored for two options."""
+    engine = VoteEngine.from_votes({1: [1, 2], 2: [2, 3], 3: []})
+    assert engine.tally() == [1, 2, 0]
+    assert engine.tolists() == {1: [1], 2: [2, 3], 3: []}
+
+
+def test_quizzes_share_emoji_table():
+    """Checking that quizzes share one emoji table, and are slotted."""
+    first, second = Quiz(None, 1), Quiz(None, 2)
+    assert first.emoji_options is second.emoji_options
+    assert first.emoji_index[first.emoji_options[35]] == 36
+    assert not hasattr(first, "__dict__")
+
+
+def test_vote_timeline_analyses():
+    """Checking response times, time to correct and tallies over time."""
+    timeline = VoteTimeline()
+    for voter, option, seconds in [
+        (1, 1, 1.0),
+        (2, 2, 2.0),
+        (1, 2, 3.0),
+        (3, 2, 4.0),
+        (1, 1, 5.0),
+    ]:
+        timeline.append(voter, option, seconds)
+    assert len(timeline) == 5
+    times = timeline.response_times(3, (0, 50, 100))
+    assert times[:2].tolist() == [[1.0, 3.0, 5.0], [2.0, 3.0, 4.0]]
+    assert np.isnan(times[2]).all()
+    assert timeline.time_to_correct(2).tolist() == [2.0, 3.0, 4.0]
+    tallies = timeline.tallies(3, [0.5, 1, 3, 5])
+    assert tallies.tolist() == [[0, 0, 0], [1, 0, 0], [0, 2, 0], [1, 2, 0]]
+    multiple = timeline.tallies(3, [3, 5], singlevote=False)
+    assert multiple.tolist() == [[1, 2, 0], [2, 3, 0]]
+    restored = VoteTimeline.from_dict(timeline.todict())
+    assert restored.todict() == timeline.todict()
+
+
+def test_quiz_vote_times():
+    """Checking that votes are timed from the start of the quiz."""
+    quiz = Quiz(None, 1)
+    quiz.message_id, quiz.channel_id = 100, 200
+    quiz.options = {1: "a", 2: "b"}
+    quiz.engine = VoteEngine(2)
+    quiz.started = time.monotonic() - 10
+    quiz.vote(5, quiz.emoji_options[1])
+    quiz.vote(5, quiz.emoji_options[1])
+    quiz.vote(6, quiz.emoji_options[0], at=time.time() - 8)
+    assert quiz.timeline.options.tolist() == [2, 1]
+    assert quiz.timeline.times.tolist() == pytest.approx([10, 2], abs=0.1)
+    restored = Quiz(None, None).load_from_save_data(quiz.create_save_data())
+    assert restored.started == pytest.approx(quiz.started, abs=0.1)
+    assert restored.timeline.todict() == quiz.timeline.todict()